@@ -1,20 +1,74 @@
 import json
+import time
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from tracing import tracer
+from llm import ratelimit
+from llm.base_client import RateLimitError
+from agent.prefetcher import serve_from_prefetch
+from agent.history import Message
+from agent.result_format import PAGE_TOOL, ResultEncoder
+
+# 分层模型策略：
+# - single：每轮都用回复模型（不分层）
+# - tiered：选工具的轮次用路由模型；路由模型给出最终回复或输出无法解析时，本轮升级到回复模型重答；
+#           拿到工具结果后的轮次直接用回复模型撰写回复
+# - tiered_fast：同 tiered，但接受路由模型直接给出的最终回复（闲聊等不调工具的问题只花一次小模型调用）
+TIER_POLICIES = ("single", "tiered", "tiered_fast")
+
+
+def _model_name(llm) -> str:
+    return getattr(llm, "model", None) or type(llm).__name__
+
 
 class AssistantAgent:
     """大学生小秘书Agent"""
     
-    def __init__(self, llm_client, prompt_manager, tool_executor, max_history=10):
-        self.llm = llm_client
+    def __init__(self, llm_client, prompt_manager, tool_executor, max_history=10, prefetcher=None,
+                 history_store=None, memory_cap=50, routing_llm=None, tier_policy="tiered",
+                 intent_router=None, result_encoder=None, session="default"):
+        if tier_policy not in TIER_POLICIES:
+            raise ValueError(f"未知的分层策略: {tier_policy}（可选 {', '.join(TIER_POLICIES)}）")
+        self.llm = llm_client  # 回复模型
+        # 可选：低延迟的路由模型，只负责决定调用哪些工具
+        self.routing_llm = routing_llm if tier_policy != "single" else None
+        self.tier_policy = tier_policy
+        self.tier_stats = {tier: {"calls": 0, "errors": 0, "invalid": 0, "escalations": 0, "latency": 0.0}
+                           for tier in ("routing", "reply")}
+        self.turn_log: List[Dict] = []  # 本轮对话中每次 LLM 调用的层级、耗时和结果，供评估使用
+        self.intent_router = intent_router  # 可选：本地意图快速通道，简单查询不经过 LLM
+        # 工具结果写回上下文时的编码（默认紧凑表格，超长结果截断后可按编号翻页）
+        self.result_encoder = result_encoder or ResultEncoder()
         self.prompt_manager = prompt_manager
+        # 会话名：多个会话共用 LLM 配额时按会话轮流排队
+        self.session = session
         self.executor = tool_executor
         self.max_history = max_history
-        self.history: List[Dict] = []
+        self.prefetcher = prefetcher  # 可选：投机预取只读工具结果
+        self.history_store = history_store  # 可选：持久化对话历史
+        # 内存中只保留最近 memory_cap 条，更早的消息只在磁盘日志里
+        self.memory_cap = max(memory_cap, max_history)
+        self.history: List[Message] = []
+        if history_store is not None:
+            self.history = history_store.tail(self.memory_cap)
+
+    def _append(self, role: str, content: str):
+        """记录一条消息：写入持久化日志，并把内存中的历史限制在 memory_cap 条以内"""
+        self.history.append(Message(role, content))
+        if self.history_store is not None:
+            self.history_store.append(role, content)
+        # 超出两倍上限时一次性裁剪，摊还成本为 O(1)
+        if len(self.history) > 2 * self.memory_cap:
+            del self.history[:-self.memory_cap]
         
     def _get_system_prompt(self) -> str:
-        """获取带动态信息的system prompt"""
-        template = self.prompt_manager.load("assistant")
+        """获取 system prompt 的静态部分（工具手册），内容不随时间变化，可被服务端缓存"""
+        return self.prompt_manager.load("assistant").format()
+
+    def _get_system_context(self) -> str:
+        """获取 system prompt 的动态部分：当前日期和时间"""
+        template = self.prompt_manager.load("assistant_context")
         now = datetime.now()
         weekdays = ["一", "二", "三", "四", "五", "六", "日"]
         return template.format(
@@ -23,35 +77,167 @@ class AssistantAgent:
             weekday=weekdays[now.weekday()]
         )
     
-    def get_context_messages(self) -> List[Dict]:
+    def get_context_messages(self) -> List[Message]:
         """获取发送给LLM的消息上下文（滑动窗口）"""
         # 始终保留 system prompt（在 Gemini Client 中处理）
         # 这里只返回 recent messages
         return self.history[-self.max_history:]
     
+    def _call_llm(self, tier: str, messages, priority: int = ratelimit.PRIORITY_REPLY) -> str:
+        """用指定层级的模型调用一次 LLM，记录耗时；priority 决定配额紧张时的排队顺序"""
+        llm = self.routing_llm if tier == "routing" else self.llm
+        stats = self.tier_stats[tier]
+        entry = {"tier": tier, "model": _model_name(llm), "latency": 0.0, "result": "error"}
+        self.turn_log.append(entry)
+        with tracer.span("agent.llm", tier=tier, model=entry["model"]):
+            t0 = time.perf_counter()
+            try:
+                with ratelimit.use_request(self.session, priority):
+                    return llm.chat(messages=messages, system_prompt=self._get_system_prompt(),
+                                    system_context=self._get_system_context())
+            except Exception:
+                stats["errors"] += 1
+                raise
+            finally:
+                entry["latency"] = time.perf_counter() - t0
+                stats["calls"] += 1
+                stats["latency"] += entry["latency"]
+
+    def _parse(self, response: str, iteration: int):
+        with tracer.span("agent.parse", iteration=iteration, response_chars=len(response)) as parse_span:
+            parsed = self.executor.parse_structured_response(response)
+            parse_span.set("result", parsed["type"] if parsed else "invalid")
+            parse_span.set("self_correction", parsed is None)
+        self.turn_log[-1]["result"] = parsed["type"] if parsed else "invalid"
+        if parsed is None:
+            self.tier_stats[self.turn_log[-1]["tier"]]["invalid"] += 1
+        return parsed
+
+    def _should_escalate(self, parsed) -> bool:
+        """路由模型这一轮的输出是否需要交给回复模型重答"""
+        if parsed is None:
+            return True
+        return parsed["type"] == "final" and self.tier_policy == "tiered"
+
+    def tier_summary(self) -> Dict:
+        """各层级模型的调用次数、平均耗时、无法解析次数和升级次数"""
+        summary = {}
+        for tier, stats in self.tier_stats.items():
+            llm = self.routing_llm if tier == "routing" else self.llm
+            if llm is None:
+                continue
+            calls = stats["calls"]
+            summary[tier] = {
+                "model": _model_name(llm),
+                "calls": calls,
+                "avg_ms": round(stats["latency"] / calls * 1000, 1) if calls else None,
+                "errors": stats["errors"],
+                "invalid": stats["invalid"],
+                "escalations": stats["escalations"],
+            }
+        return summary
+
+    def _run_tools(self, calls) -> List[Dict]:
+        """执行一轮的全部工具调用：先用预取结果，其余按顺序执行（相邻同工具调用合并批处理）"""
+        results: List = [None] * len(calls)
+        pending = []
+        for i, (tool_name, args) in enumerate(calls):
+            if tool_name == PAGE_TOOL:
+                # 翻页查看之前被截断的结果，不需要执行任何工具
+                results[i] = self.result_encoder.page(args)
+                continue
+            results[i] = serve_from_prefetch(self.prefetcher, tool_name, args)
+            if results[i] is None:
+                pending.append(i)
+        if pending:
+            executed = self.executor.execute_many([calls[i] for i in pending])
+            for i, result in zip(pending, executed):
+                results[i] = result
+        return results
+
     def chat(self, user_input: str) -> str:
         """处理用户输入，返回回复"""
-        self.history.append({"role": "user", "content": user_input})
+        with tracer.span("agent.turn", input_chars=len(user_input)) as turn_span:
+            if self.intent_router is not None:
+                reply = self._fast_path(user_input, turn_span)
+                if reply is not None:
+                    return reply
+            if self.prefetcher is not None:
+                # 在第一次 LLM 调用的同时，后台执行可能用到的只读工具
+                self.prefetcher.start(user_input)
+            t0 = time.perf_counter()
+            try:
+                return self._chat(user_input, turn_span)
+            finally:
+                if self.prefetcher is not None:
+                    self.prefetcher.finish_turn()
+                if self.intent_router is not None:
+                    self.intent_router.record_llm_turn(time.perf_counter() - t0)
+
+    def _fast_path(self, user_input: str, turn_span) -> Optional[str]:
+        """高置信度的简单查询：进程内调用工具、按模板回复；不处理时返回 None"""
+        t0 = time.perf_counter()
+        answered = self.intent_router.answer(user_input)
+        if answered is None:
+            return None
+        match, result, reply = answered
+        # 按 LLM 循环的格式写入历史，后续追问时模型能看到工具结果
+        call = {"tool_calls": [{"tool": match.rule.tool, "args": match.args}], "reply": None}
+        self._append("user", user_input)
+        self._append("assistant", json.dumps(call, ensure_ascii=False))
+        self._append("user", self.result_encoder.encode(match.rule.tool, result))
+        self._append("assistant", json.dumps({"tool_calls": [], "reply": reply}, ensure_ascii=False))
+        self.turn_log = [{"tier": "intent", "model": match.rule.name,
+                          "latency": time.perf_counter() - t0, "result": "tool_calls"}]
+        turn_span.set("outcome", "fast_path")
+        turn_span.set("intent", match.rule.name)
+        return reply
+
+    def _llm_failed(self, error: Exception, turn_span) -> str:
+        """LLM 调用失败时给用户的回复；配额用尽单独提示，不当作模型输出"""
+        if isinstance(error, RateLimitError):
+            turn_span.set("outcome", "rate_limited")
+            return "现在请求的人有点多，小秘书忙不过来了，请稍等几秒再问我一次。"
+        turn_span.set("outcome", "llm_error")
+        return f"系统错误: LLM调用失败 - {str(error)}"
+
+    def _chat(self, user_input: str, turn_span) -> str:
+        self._append("user", user_input)
+        self.turn_log = []
         
         max_iterations = 8  # 防止无限循环
+        # 上一条消息是否为工具结果：是则本轮在撰写回复，直接用回复模型
+        after_tools = False
         
-        for _ in range(max_iterations):
+        for iteration in range(max_iterations):
+            turn_span.set("iterations", iteration + 1)
             # 获取上下文
             messages = self.get_context_messages()
+            tier = "routing" if self.routing_llm is not None and not after_tools else "reply"
             
-            # 调用LLM
+            # 调用LLM：拿到工具结果后的轮次是在撰写回复，配额紧张时优先于选工具的轮次
+            priority = ratelimit.PRIORITY_REPLY if after_tools else ratelimit.PRIORITY_ROUTING
             try:
-                response = self.llm.chat(
-                    messages=messages,
-                    system_prompt=self._get_system_prompt()
-                )
+                response = self._call_llm(tier, messages, priority)
+                parsed = self._parse(response, iteration)
             except Exception as e:
-                return f"系统错误: LLM调用失败 - {str(e)}"
+                if tier == "reply":
+                    return self._llm_failed(e, turn_span)
+                response, parsed = None, None
+            
+            if tier == "routing" and self._should_escalate(parsed):
+                # 小模型出错、输出无法解析，或策略要求由大模型撰写最终回复：本轮升级到回复模型
+                self.tier_stats["routing"]["escalations"] += 1
+                turn_span.set("escalated", True)
+                tier = "reply"
+                try:
+                    response = self._call_llm(tier, messages)
+                except Exception as e:
+                    return self._llm_failed(e, turn_span)
+                parsed = self._parse(response, iteration)
             
             print(f"\n[AI思考] {response[:100]}..." if len(response) > 100 else f"\n[AI思考] {response}")
 
-            # 统一解析：final 或 tool_calls 列表
-            parsed = self.executor.parse_structured_response(response)
             if parsed is None:
                 # 格式错误，触发自修正
                 error_msg = (
@@ -60,25 +246,30 @@ class AssistantAgent:
                     '- reply：字符串或 null。有最终回复时填 reply，需要调工具时填 tool_calls，二者二选一。'
                 )
                 print(f"[自修正] {error_msg}")
-                self.history.append({"role": "assistant", "content": response})
-                self.history.append({"role": "user", "content": error_msg})
+                self._append("assistant", response)
+                self._append("user", error_msg)
+                # 自修正交给回复模型处理
+                after_tools = True
                 continue
 
             if parsed["type"] == "final":
-                self.history.append({"role": "assistant", "content": response})
+                self._append("assistant", response)
+                turn_span.set("outcome", "final")
+                turn_span.set("reply_tier", tier)
                 return parsed["reply"]
 
             # parsed["type"] == "tool_calls"
             calls = parsed["calls"]
             results_parts = []
-            for tool_name, args in calls:
+            for (tool_name, args), result in zip(calls, self._run_tools(calls)):
                 print(f"[调用工具] {tool_name} {args}")
-                result = self.executor.execute(tool_name, args)
                 print(f"[工具结果] {json.dumps(result, ensure_ascii=False)[:200]}...")
-                results_parts.append(f"工具 {tool_name} 执行结果：{json.dumps(result, ensure_ascii=False)}")
-            self.history.append({"role": "assistant", "content": response})
+                results_parts.append(self.result_encoder.encode(tool_name, result))
+            self._append("assistant", response)
             tool_msg = "\n\n".join(results_parts)
-            self.history.append({"role": "user", "content": tool_msg})
+            self._append("user", tool_msg)
+            after_tools = True
             continue
 
+        turn_span.set("outcome", "max_iterations")
         return "抱歉，我思考了很久还是没能解决你的问题，可能是陷入了死循环。"
@@ -0,0 +1,217 @@
+# 对话历史的持久化
+# 每个会话一个目录 data/sessions/<session>/：
+#   seg-000001.jsonl ...   只追加的消息分段，每行一条 {"seq", "role", "content", "ts"}
+#   index.json             分段清单（文件名、起始序号、条数），只在分段切换/压缩时重写
+#   archive/               超出保留数量的旧分段，gzip 压缩后移入
+# 恢复会话时只从末尾倒着读取上下文窗口需要的几行，不读整个历史。
+import gzip
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from config import SESSIONS_DIR, HISTORY_SEGMENT_LINES, HISTORY_KEEP_SEGMENTS
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import SESSIONS_DIR, HISTORY_SEGMENT_LINES, HISTORY_KEEP_SEGMENTS
+
+_TAIL_BLOCK = 64 * 1024
+
+
+class Message:
+    """一条对话消息；用 __slots__ 压缩内存，同时兼容 msg["role"] / msg.get("content") 的字典写法"""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> Dict:
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:30]!r})"
+
+
+def _segment_name(no: int) -> str:
+    return f"seg-{no:06d}.jsonl"
+
+
+def _tail_lines(path: Path, n: int) -> List[bytes]:
+    """从文件末尾倒着按块读取，返回最后 n 个非空行"""
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        buf = b""
+        while pos > 0 and buf.count(b"\n") <= n:
+            step = min(_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+    lines = [line for line in buf.split(b"\n") if line.strip()]
+    return lines[-n:]
+
+
+class HistoryStore:
+    """单个会话的只追加历史日志"""
+
+    def __init__(self, session: str, base_dir: Optional[Path] = None,
+                 segment_lines: int = HISTORY_SEGMENT_LINES,
+                 keep_segments: int = HISTORY_KEEP_SEGMENTS):
+        if not session or "/" in session or "\\" in session or session.startswith("."):
+            raise ValueError(f"非法的会话名: {session!r}")
+        self.session = session
+        self.dir = Path(base_dir or SESSIONS_DIR) / session
+        self.segment_lines = max(1, segment_lines)
+        self.keep_segments = max(1, keep_segments)
+        self._fh = None
+        self._index = self._load_index()
+        # 当前分段的行数只在打开时数一次，之后随追加递增
+        self._active_count = self._count_active()
+
+    # ---------- 索引 ----------
+
+    @property
+    def index_path(self) -> Path:
+        return self.dir / "index.json"
+
+    def _load_index(self) -> Dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"session": self.session, "next_seq": 1,
+                    "segments": [{"file": _segment_name(1), "first_seq": 1, "count": 0}],
+                    "archived": []}
+
+    def _save_index(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def _active(self) -> Dict:
+        return self._index["segments"][-1]
+
+    def _count_active(self) -> int:
+        path = self.dir / self._active()["file"]
+        if not path.exists():
+            return 0
+        count = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    count += 1
+        # 按实际行数校正 next_seq（上次可能没来得及写索引就退出了）
+        self._index["next_seq"] = self._active()["first_seq"] + count
+        return count
+
+    # ---------- 写入 ----------
+
+    def append(self, role: str, content: str) -> int:
+        """追加一条消息并立即落盘，返回消息序号"""
+        if self._active_count >= self.segment_lines:
+            self._rotate()
+        if self._fh is None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.dir / self._active()["file"], "a", encoding="utf-8")
+        seq = self._index["next_seq"]
+        record = {"seq": seq, "role": role, "content": content, "ts": round(time.time(), 3)}
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        self._index["next_seq"] = seq + 1
+        self._active_count += 1
+        self._active()["count"] = self._active_count
+        if self._active_count == 1 and not self.index_path.exists():
+            self._save_index()
+        return seq
+
+    def _rotate(self):
+        """当前分段写满：关闭它、开新分段，并把超出保留数量的旧分段归档"""
+        self.close()
+        self._active()["count"] = self._active_count
+        no = len(self._index["segments"]) + len(self._index["archived"]) + 1
+        self._index["segments"].append(
+            {"file": _segment_name(no), "first_seq": self._index["next_seq"], "count": 0})
+        self._active_count = 0
+        self.compact(save=False)
+        self._save_index()
+
+    def compact(self, save: bool = True) -> int:
+        """把超出保留数量的旧分段压缩进 archive/，返回归档的分段数"""
+        segments = self._index["segments"]
+        excess = len(segments) - self.keep_segments
+        if excess <= 0:
+            return 0
+        archive_dir = self.dir / "archive"
+        archive_dir.mkdir(parents=True, exist_ok=True)
+        for seg in segments[:excess]:
+            src = self.dir / seg["file"]
+            if src.exists():
+                with open(src, "rb") as fin, gzip.open(archive_dir / (seg["file"] + ".gz"), "wb") as fout:
+                    shutil.copyfileobj(fin, fout)
+                src.unlink()
+            self._index["archived"].append(dict(seg, file="archive/" + seg["file"] + ".gz"))
+        del segments[:excess]
+        if save:
+            self._save_index()
+        return excess
+
+    # ---------- 读取 ----------
+
+    def tail(self, n: int) -> List[Message]:
+        """读取最近 n 条消息：从最新分段末尾倒着读，不够再读前一个分段"""
+        lines: List[bytes] = []
+        for seg in reversed(self._index["segments"]):
+            if len(lines) >= n:
+                break
+            path = self.dir / seg["file"]
+            if path.exists():
+                lines = _tail_lines(path, n - len(lines)) + lines
+        messages = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+                messages.append(Message(record["role"], record["content"]))
+            except (ValueError, KeyError):
+                # 进程中途退出时最后一行可能不完整
+                continue
+        return messages
+
+    def stats(self) -> Dict:
+        return {
+            "session": self.session,
+            "messages": self._index["next_seq"] - 1,
+            "segments": len(self._index["segments"]),
+            "archived": len(self._index["archived"]),
+        }
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._save_index()
+
+
+def list_sessions(base_dir: Optional[Path] = None) -> List[str]:
+    base = Path(base_dir or SESSIONS_DIR)
+    if not base.exists():
+        return []
+    return sorted(p.name for p in base.iterdir() if p.is_dir())
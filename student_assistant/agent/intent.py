@@ -0,0 +1,212 @@
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from tracing import tracer
+
+# 本地意图快速通道：对“余额多少”“今天有什么课”“明天天气”这类一句话就能确定工具的查询，
+# 不经过 LLM，直接在进程内调用工具并用模板生成回复；置信度不够时交回完整的 LLM 循环。
+
+WEEKDAYS = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+# 出现这些词说明是写操作或需要推理，快速通道一律不接
+WRITE_HINTS = re.compile(r"记|添加|加个|加一|新增|删|取消|改|修改|提醒|设置|设成|花了|买了|支出|收入|导入|帮我安排")
+# 多个意图或追问：交给 LLM 统筹
+COMPOUND_HINTS = re.compile(r"和|还有(?!多少)|以及|并且|然后|顺便|另外|同时|如果|为什么|怎么办|要不要|建议")
+# 快速通道只支持今天/明天/后天，其他日期表达交给 LLM 解析
+OTHER_DATE_HINTS = re.compile(r"昨|前天|大后天|周[一二三四五六日天]|星期|礼拜|下周|上周|这周|本周|\d+\s*[号日月]|\d{4}-\d{2}-\d{2}")
+RELATIVE_DAYS = [(re.compile(r"后天"), 2), (re.compile(r"明天|明日|明早|明晚"), 1),
+                 (re.compile(r"今天|今日|今晚|今早|现在"), 0)]
+DAY_NAMES = {0: "今天", 1: "明天", 2: "后天"}
+# 语气词和常见问法；去掉这些、日期词和规则关键词后还剩下的字是规则没理解的内容（如地点、人名）
+FILLER = re.compile(r"怎么样|如何|多少|一下|帮我|请问|告诉我|情况|查查?|看看|[我你的了吗呢啊呀吧么嘛要会有是还，,。？?！!\s]")
+
+
+def extract_day(text: str) -> Optional[int]:
+    """返回相对今天的天数；没有日期词时返回 None"""
+    for pattern, offset in RELATIVE_DAYS:
+        if pattern.search(text):
+            return offset
+    return None
+
+
+def _date_str(offset: int) -> str:
+    return (datetime.now() + timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+def render_balance(result: Dict, day: int) -> str:
+    text = (f"本月预算 {result['monthly_budget']} 元，已支出 {result['monthly_expense']} 元，"
+            f"收入 {result['monthly_income']} 元，还剩 {result['balance']} 元。")
+    if result["balance"] < 0:
+        text += "已经超支了，注意控制开销哦。"
+    return text
+
+
+def render_courses(result: Dict, day: int) -> str:
+    name = DAY_NAMES[day]
+    courses = result.get("data") or []
+    weekday = WEEKDAYS[(datetime.now() + timedelta(days=day)).weekday()]
+    if not courses:
+        return f"{name}（{weekday}）没有课，好好安排一下自己的时间吧~"
+    lines = [f"{name}（{weekday}）有 {len(courses)} 节课："]
+    for c in courses:
+        lines.append(f"- {c['time']} {c['name']} @ {c.get('location', '')}".rstrip(" @"))
+    return "\n".join(lines)
+
+
+def render_schedule(result: Dict, day: int) -> str:
+    name = DAY_NAMES[day]
+    items = result.get("data") or []
+    if not items:
+        return f"{name}没有日程安排。"
+    lines = [f"{name}有 {len(items)} 项安排："]
+    for item in items:
+        lines.append(f"- {item['time']} {item['event']}（{item.get('duration', 60)} 分钟）")
+    return "\n".join(lines)
+
+
+def render_weather(result: Dict, day: int) -> str:
+    w = result["data"]
+    text = (f"{DAY_NAMES[day]}{w['location']}{w['weather']}，{w['temp_low']}~{w['temp_high']}°C，"
+            f"降水概率 {w['rain_prob']}%。")
+    if w.get("suggestion"):
+        text += w["suggestion"]
+    return text
+
+
+class IntentRule:
+    """一条意图规则：关键词命中后映射到单个工具调用，并用模板渲染回复"""
+
+    def __init__(self, name: str, pattern: str, tool: str, make_args: Callable[[int], str],
+                 render: Callable[[Dict, int], str], needs_day: bool = True, confidence: float = 0.95):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.tool = tool
+        self.make_args = make_args
+        self.render = render
+        self.needs_day = needs_day  # 是否与日期有关（没写日期时默认今天，置信度略降）
+        self.confidence = confidence
+
+
+DEFAULT_INTENTS = [
+    IntentRule("budget_balance", r"余额|还剩多少|还有多少钱|剩多少钱|生活费还", "budget",
+               lambda day: "balance", render_balance, needs_day=False),
+    IntentRule("course_day", r"(什么|哪些|几节|有没有)课|课表|有课吗|课程安排", "course",
+               lambda day: f"query --date {_date_str(day)}", render_courses),
+    IntentRule("schedule_day", r"日程|(什么|哪些)安排|有什么事", "schedule",
+               lambda day: f"query --date {_date_str(day)}", render_schedule),
+    IntentRule("weather_day", r"天气|下雨|带伞|气温|冷不冷|热不热", "weather",
+               lambda day: f"query --date {_date_str(day)}", render_weather),
+]
+
+
+class IntentMatch:
+    __slots__ = ("rule", "day", "confidence", "args")
+
+    def __init__(self, rule: IntentRule, day: int, confidence: float):
+        self.rule = rule
+        self.day = day
+        self.confidence = confidence
+        self.args = rule.make_args(day)
+
+
+class IntentRouter:
+    """LLM 之前的意图匹配器
+
+    对每条规则打分：命中关键词得到规则的基础置信度，再按特征扣分——
+    写操作或不支持的日期直接归零，多意图/追问、句子过长、命中多条规则、没写日期、
+    有规则没理解的字（地点等）各扣一部分。
+    最高分不低于 threshold 时才走快速通道。
+    """
+
+    def __init__(self, executor, rules=None, threshold: float = 0.8, max_chars: int = 20):
+        self.executor = executor
+        self.rules = rules if rules is not None else DEFAULT_INTENTS
+        self.threshold = threshold
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self.total = 0
+        self.served = 0
+        self.fallbacks = 0  # 匹配上但工具失败、退回 LLM 的次数
+        self.fast_seconds = 0.0
+        self.llm_turns = 0
+        self.llm_seconds = 0.0
+
+    def classify(self, text: str) -> Optional[IntentMatch]:
+        text = text.strip()
+        hits = [rule for rule in self.rules if rule.pattern.search(text)]
+        if not hits or WRITE_HINTS.search(text) or OTHER_DATE_HINTS.search(text):
+            return None
+        day = extract_day(text)
+        rest = text
+        for pattern, _ in RELATIVE_DAYS:
+            rest = pattern.sub("", rest)
+        best = None
+        for rule in hits:
+            score = rule.confidence
+            # 每个没理解的字扣 0.1：“明天上海天气”里的“上海”会让它退回 LLM
+            score -= 0.1 * len(FILLER.sub("", rule.pattern.sub("", rest)))
+            if COMPOUND_HINTS.search(text):
+                score -= 0.3
+            if len(text) > self.max_chars:
+                score -= 0.2
+            if len(hits) > 1:
+                score -= 0.4
+            if rule.needs_day and day is None:
+                score -= 0.1
+            if best is None or score > best.confidence:
+                best = IntentMatch(rule, day or 0, round(score, 3))
+        return best
+
+    def answer(self, text: str):
+        """尝试直接回答；返回 (匹配, 工具结果, 回复)，不能处理时返回 None"""
+        with self._lock:
+            self.total += 1
+        with tracer.span("agent.intent") as span:
+            match = self.classify(text)
+            span.set("intent", match.rule.name if match else None)
+            span.set("confidence", match.confidence if match else 0.0)
+            if match is None or match.confidence < self.threshold:
+                span.set("served", False)
+                return None
+            t0 = time.perf_counter()
+            result = self.executor.execute_local(match.rule.tool, match.args)
+            reply = None
+            if isinstance(result, dict) and result.get("success"):
+                try:
+                    reply = match.rule.render(result, match.day)
+                except (KeyError, TypeError, ValueError):
+                    reply = None
+            elapsed = time.perf_counter() - t0
+            span.set("served", reply is not None)
+            with self._lock:
+                if reply is None:
+                    self.fallbacks += 1
+                    return None
+                self.served += 1
+                self.fast_seconds += elapsed
+            return match, result, reply
+
+    def record_llm_turn(self, seconds: float):
+        """记录一轮走完整 LLM 循环的耗时，用于估算快速通道节省的时间"""
+        with self._lock:
+            self.llm_turns += 1
+            self.llm_seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            fast_avg = self.fast_seconds / self.served if self.served else None
+            llm_avg = self.llm_seconds / self.llm_turns if self.llm_turns else None
+            saved = (llm_avg - fast_avg) * self.served if fast_avg is not None and llm_avg is not None else None
+            return {
+                "total": self.total,
+                "served": self.served,
+                "fallbacks": self.fallbacks,
+                "share": round(self.served / self.total, 3) if self.total else 0.0,
+                "fast_avg_ms": round(fast_avg * 1000, 1) if fast_avg is not None else None,
+                "llm_avg_ms": round(llm_avg * 1000, 1) if llm_avg is not None else None,
+                # 按完整 LLM 轮次的平均耗时估算，还没有 LLM 样本时为 None
+                "saved_ms": round(saved * 1000, 1) if saved is not None else None,
+            }
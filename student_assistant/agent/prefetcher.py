@@ -0,0 +1,200 @@
+import re
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tracing import tracer
+
+# 只读命令白名单：只有这些 (工具, 子命令) 才允许被投机执行
+READ_ONLY_COMMANDS = {
+    ("course", "query"),
+    ("course", "now"),
+    ("course", "free"),
+    ("schedule", "query"),
+    ("schedule", "range"),
+    ("schedule", "week"),
+    ("schedule", "conflicts"),
+    ("schedule", "free"),
+    ("budget", "balance"),
+    ("budget", "list"),
+    ("budget", "stats"),
+    ("weather", "query"),
+    ("memory", "query"),
+}
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _tomorrow() -> str:
+    return (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+# 规则：关键词正则 -> 预测的工具调用列表
+DEFAULT_RULES: List[Tuple["re.Pattern", Callable[[], List[Tuple[str, str]]]]] = [
+    (re.compile(r"今天|今日|今晚|今早"), lambda: [
+        ("course", f"query --date {_today()}"),
+        ("schedule", f"query --date {_today()}"),
+    ]),
+    (re.compile(r"明天|明日|明早|明晚"), lambda: [
+        ("course", f"query --date {_tomorrow()}"),
+        ("schedule", f"query --date {_tomorrow()}"),
+    ]),
+    (re.compile(r"余额|还剩|生活费|预算|花了多少|没钱|钱"), lambda: [
+        ("budget", "balance"),
+    ]),
+    (re.compile(r"天气|下雨|带伞|气温|冷不冷|热不热"), lambda: [
+        ("weather", "query --date today"),
+        ("weather", "query --date tomorrow"),
+    ]),
+]
+
+
+def normalize_call(tool: str, args: str) -> Optional[Tuple]:
+    """把工具调用规范化成可比较的键：相对日期换成具体日期，参数顺序无关"""
+    try:
+        tokens = shlex.split(args)
+    except ValueError:
+        return None
+    if not tokens:
+        return (tool, "", ())
+    sub, rest = tokens[0], tokens[1:]
+    pairs = []
+    i = 0
+    while i < len(rest):
+        flag = rest[i]
+        value = None
+        if i + 1 < len(rest) and not rest[i + 1].startswith("--"):
+            value = rest[i + 1]
+            i += 1
+        if flag == "--date" and value == "today":
+            value = _today()
+        elif flag == "--date" and value == "tomorrow":
+            value = _tomorrow()
+        pairs.append((flag, value))
+        i += 1
+    return (tool, sub, tuple(sorted(pairs, key=lambda p: (p[0], p[1] or ""))))
+
+
+def is_read_only(tool: str, args: str) -> bool:
+    key = normalize_call(tool, args)
+    return key is not None and (key[0], key[1]) in READ_ONLY_COMMANDS
+
+
+class Prefetcher:
+    """在第一次 LLM 调用进行时，按规则投机执行可能用到的只读工具
+
+    模型真正请求相同调用时直接返回预取结果；写操作永远不会被投机执行，
+    并且会使同一工具已预取的结果失效。
+    """
+
+    def __init__(self, executor, rules=None, max_workers: int = 4, wait_timeout: float = 15):
+        self.executor = executor
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.wait_timeout = wait_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple, Future] = {}
+        self.predicted = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def predict(self, user_input: str) -> List[Tuple[str, str]]:
+        calls = []
+        seen = set()
+        for pattern, make_calls in self.rules:
+            if not pattern.search(user_input):
+                continue
+            for tool, args in make_calls():
+                key = normalize_call(tool, args)
+                if key is None or key in seen or not is_read_only(tool, args):
+                    continue
+                seen.add(key)
+                calls.append((tool, args))
+        return calls
+
+    def start(self, user_input: str):
+        """新一轮对话开始：丢弃上一轮残留的预取，提交本轮预测的调用"""
+        self.finish_turn()
+        calls = self.predict(user_input)
+        with self._lock:
+            for tool, args in calls:
+                key = normalize_call(tool, args)
+                self._pending[key] = self._pool.submit(self.executor.execute, tool, args)
+                self.predicted += 1
+
+    def take(self, tool: str, args: str) -> Optional[dict]:
+        """取出与模型请求一致的预取结果；未命中返回 None"""
+        key = normalize_call(tool, args)
+        if key is None or (key[0], key[1]) not in READ_ONLY_COMMANDS:
+            return None
+        with self._lock:
+            future = self._pending.pop(key, None)
+            if future is None:
+                self.misses += 1
+                return None
+        try:
+            result = future.result(timeout=self.wait_timeout)
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def invalidate(self, tool: str):
+        """写操作执行前调用：同一工具的预取结果作废"""
+        with self._lock:
+            stale = [k for k in self._pending if k[0] == tool]
+            for k in stale:
+                self._pending.pop(k).cancel()
+                self.wasted += 1
+
+    def finish_turn(self):
+        """本轮结束：没被用到的预取都计为浪费"""
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self.wasted += len(self._pending)
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "predicted": self.predicted,
+            "hits": self.hits,
+            "misses": self.misses,
+            "wasted": self.wasted,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "waste_rate": round(self.wasted / self.predicted, 3) if self.predicted else 0.0,
+        }
+
+    def shutdown(self):
+        self.finish_turn()
+        self._pool.shutdown(wait=False)
+
+
+def serve_from_prefetch(prefetcher: Optional[Prefetcher], tool_name: str, args: str) -> Optional[dict]:
+    """尝试用预取结果响应一次调用；写操作会先让同一工具的预取失效并返回 None"""
+    if prefetcher is None:
+        return None
+    if not is_read_only(tool_name, args):
+        prefetcher.invalidate(tool_name)
+        return None
+    with tracer.span("agent.prefetch_lookup", tool=tool_name) as span:
+        result = prefetcher.take(tool_name, args)
+        span.set("hit", result is not None)
+    return result
+
+
+def execute_with_prefetch(prefetcher: Optional[Prefetcher], executor, tool_name: str, args: str) -> dict:
+    """优先使用预取结果；写操作先让预取失效再执行"""
+    result = serve_from_prefetch(prefetcher, tool_name, args)
+    if result is None:
+        result = executor.execute(tool_name, args)
+    return result
@@ -0,0 +1,159 @@
+import json
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# 工具结果写回 LLM 上下文时的紧凑编码：
+# - 字典列表渲染成表格：一行列名，之后每条记录一行，键名只出现一次
+# - 去掉模型用不到的字段（创建时间等），所有行取值相同的列提到表头里
+# - 超过 max_rows 行时只保留前几行并附上数值列的合计，完整数据存进 ResultStore，
+#   模型可以用伪工具 `result page --ref <编号>` 翻页查看
+
+# 对模型没有帮助的字段
+DROP_FIELDS = {"created_at", "updated_at"}
+# 模型翻页用的伪工具名，不对应任何 CLI
+PAGE_TOOL = "result"
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _compact_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _is_table(value) -> bool:
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(v, dict) for v in value)
+
+
+def _is_grouped_table(value) -> bool:
+    """{分组键: [记录, ...]}，如 schedule range/week 的按日期分组"""
+    return (isinstance(value, dict) and len(value) > 0
+            and all(isinstance(v, list) and all(isinstance(x, dict) for x in v) for v in value.values())
+            and any(value.values()))
+
+
+class ResultStore:
+    """保存被截断的完整表格，按编号翻页；只保留最近 capacity 份"""
+
+    def __init__(self, capacity: int = 20):
+        self.capacity = capacity
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._next = 1
+
+    def put(self, columns: List[str], rows: List[Dict]) -> str:
+        ref = f"R{self._next}"
+        self._next += 1
+        self._items[ref] = {"columns": columns, "rows": rows}
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return ref
+
+    def get(self, ref: str) -> Optional[Dict]:
+        return self._items.get(ref)
+
+
+class ResultEncoder:
+    """把工具返回的字典编码成写回 LLM 上下文的文本"""
+
+    def __init__(self, max_rows: int = 20, store: Optional[ResultStore] = None, mode: str = "table"):
+        self.max_rows = max_rows
+        self.store = store if store is not None else ResultStore()
+        self.mode = mode  # table：紧凑表格；json：原样 json.dumps（便于对比）
+
+    def encode(self, tool_name: str, result) -> str:
+        head = f"工具 {tool_name} 执行结果："
+        if self.mode == "json" or not isinstance(result, dict):
+            return head + json.dumps(result, ensure_ascii=False)
+        scalars = []
+        blocks = []
+        for key, value in result.items():
+            if key in DROP_FIELDS or (key == "success" and value is True):
+                continue
+            if _is_table(value):
+                blocks.append(self._table(key, value))
+            elif _is_grouped_table(value):
+                rows = [{"group": group, **row} for group, items in value.items() for row in items]
+                empty = [group for group, items in value.items() if not items]
+                blocks.append(self._table(key, rows, empty_groups=empty))
+            elif isinstance(value, (dict, list)):
+                scalars.append(f"{key}={_compact_json(value)}")
+            else:
+                scalars.append(f"{key}={_cell(value)}")
+        lines = [" ".join(scalars)] if scalars else []
+        lines.extend(blocks)
+        return head + "\n" + "\n".join(lines) if lines else head + "{}"
+
+    def _table(self, key: str, rows: List[Dict], empty_groups: Optional[List[str]] = None) -> str:
+        columns: List[str] = []
+        for row in rows:
+            for k in row:
+                if k not in columns and k not in DROP_FIELDS:
+                    columns.append(k)
+        # 所有行取值相同的列写进表头，不在每行重复
+        constant = {}
+        if len(rows) > 1:
+            for col in columns:
+                values = {_cell(row.get(col)) for row in rows}
+                if len(values) == 1:
+                    constant[col] = values.pop()
+        shown = [c for c in columns if c not in constant]
+        header = f"{key}（{len(rows)} 行，列 {'|'.join(shown)}"
+        # 全部为空的列直接省略
+        constant = {c: v for c, v in constant.items() if v != ""}
+        if constant:
+            header += "；所有行 " + " ".join(f"{c}={v}" for c, v in constant.items())
+        if empty_groups:
+            header += f"；无记录的 group: {','.join(empty_groups)}"
+        header += "）:"
+        lines = [header]
+        for row in rows[:self.max_rows]:
+            lines.append("|".join(_cell(row.get(c)) for c in shown))
+        if len(rows) > self.max_rows:
+            ref = self.store.put(columns, [{c: row.get(c) for c in columns} for row in rows])
+            totals = self._totals(shown, rows)
+            note = f"（仅显示前 {self.max_rows} 行，共 {len(rows)} 行"
+            if totals:
+                note += "；全部合计 " + " ".join(f"{c}={v}" for c, v in totals.items())
+            note += f"；其余可调用 {PAGE_TOOL} page --ref {ref} --offset {self.max_rows}）"
+            lines.append(note)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _totals(columns: List[str], rows: List[Dict]) -> Dict[str, float]:
+        totals = {}
+        for col in columns:
+            if col == "id":
+                continue
+            values = [row.get(col) for row in rows]
+            if values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                totals[col] = round(sum(values), 2)
+        return totals
+
+    def page(self, args: str) -> Dict:
+        """伪工具 result：page --ref R1 [--offset N] [--limit N]"""
+        tokens = args.split()
+        if not tokens or tokens[0] != "page":
+            return {"success": False, "error": f"用法: {PAGE_TOOL} page --ref <编号> [--offset N] [--limit N]"}
+        opts = {}
+        for flag, value in zip(tokens[1::2], tokens[2::2]):
+            opts[flag.lstrip("-")] = value
+        entry = self.store.get(opts.get("ref", ""))
+        if entry is None:
+            return {"success": False, "error": f"结果 {opts.get('ref')} 不存在或已过期，请重新调用原工具"}
+        try:
+            offset = max(0, int(opts.get("offset", 0)))
+            limit = max(1, min(int(opts.get("limit", self.max_rows)), self.max_rows))
+        except ValueError:
+            return {"success": False, "error": "offset/limit 必须是整数"}
+        rows = entry["rows"]
+        return {"success": True, "ref": opts["ref"], "total": len(rows), "offset": offset,
+                "data": rows[offset:offset + limit]}
@@ -1,21 +1,38 @@
 import subprocess
+import importlib
 import json
 import re
+import shlex
 import sys
+import threading
+import time
 from pathlib import Path
 from typing import Optional, Tuple, Dict, Any, List
 
 try:
-    from config import TOOLS_DIR
+    import config
+    from config import TOOLS_DIR, USER_ENV_VAR, STREAM_ENV_VAR
 except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
-    from config import TOOLS_DIR
+    import config
+    from config import TOOLS_DIR, USER_ENV_VAR, STREAM_ENV_VAR
+
+from tracing import tracer
+from tools import records
+from tools.userdata import current_user, use_user, validate_user_id
 
 class ToolExecutor:
     """解析LLM输出的工具调用，执行CLI命令"""
     
-    def __init__(self, tools_dir=None):
+    def __init__(self, tools_dir=None, user_id: Optional[str] = None, max_rows: Optional[int] = None,
+                 max_bytes: Optional[int] = None, timeout: float = 15):
         self.tools_dir = tools_dir or TOOLS_DIR
+        # 固定的用户；为 None 时每次执行取调用方上下文中的当前用户
+        self.user_id = validate_user_id(user_id) if user_id else None
+        # 读取工具输出的上限：流式结果超过行数或字节数时提前结束子进程，结果标记为截断
+        self.max_rows = max_rows if max_rows is not None else config.TOOL_STREAM_MAX_ROWS
+        self.max_bytes = max_bytes if max_bytes is not None else config.TOOL_STREAM_MAX_BYTES
+        self.timeout = timeout
 
     def _extract_first_json_object(self, text: str) -> Optional[Dict[str, Any]]:
         """从一段文本中尽力提取第一个“看起来像我们协议”的 JSON 对象。
@@ -58,6 +75,62 @@ class ToolExecutor:
     
     def execute(self, tool_name: str, args: str) -> dict:
         """执行指定工具"""
+        with tracer.span("tool.execute", tool=tool_name, args=args) as span:
+            result = self._execute(tool_name, args, span)
+            span.set("success", bool(result.get("success", True)) if isinstance(result, dict) else True)
+            return result
+
+    def execute_batch(self, tool_name: str, args_list: List[str]) -> List[dict]:
+        """把同一工具的多次调用合并成一次 batch 子命令：一个进程、一次加载、一次保存"""
+        with tracer.span("tool.execute_batch", tool=tool_name, ops=len(args_list)) as span:
+            ops = json.dumps(args_list, ensure_ascii=False)
+            result = self._execute(tool_name, "batch", span, stdin_data=ops)
+            results = result.get("results") if isinstance(result, dict) else None
+            if not isinstance(results, list) or len(results) != len(args_list):
+                # 整批失败时，每个调用都返回同样的错误
+                span.set("success", False)
+                return [result] * len(args_list)
+            span.set("success", True)
+            return results
+
+    def execute_many(self, calls: List[Tuple[str, str]]) -> List[dict]:
+        """按顺序执行多个工具调用，相邻的同一工具调用合并为一次批处理"""
+        results: List[dict] = []
+        i = 0
+        while i < len(calls):
+            j = i
+            while j + 1 < len(calls) and calls[j + 1][0] == calls[i][0]:
+                j += 1
+            tool_name = calls[i][0]
+            if j == i:
+                results.append(self.execute(tool_name, calls[i][1]))
+            else:
+                results.extend(self.execute_batch(tool_name, [args for _, args in calls[i:j + 1]]))
+            i = j + 1
+        return results
+
+    def execute_local(self, tool_name: str, args: str) -> dict:
+        """在当前进程内执行工具：复用 CLI 的 build_parser/run_command，省去启动子进程的开销"""
+        with tracer.span("tool.execute_local", tool=tool_name, args=args) as span:
+            if not (self.tools_dir / f"{tool_name}_cli.py").exists():
+                return {"success": False, "error": f"工具 {tool_name} 不存在"}
+            try:
+                module = importlib.import_module(f"tools.{tool_name}_cli")
+                parsed = module.build_parser().parse_args(shlex.split(args))
+                with use_user(self.user_id or current_user()):
+                    result = module.run_command(parsed)
+            except SystemExit:
+                # argparse 参数错误时会直接退出
+                result = {"success": False, "error": f"参数无效: {args}"}
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if result is None:
+                result = {"success": False, "error": f"未知子命令: {args}"}
+            span.set("success", bool(result.get("success", True)))
+            # 记录对象换成 dict，与子进程执行的结果一致
+            return records.to_builtins(result)
+
+    def _execute(self, tool_name: str, args: str, span, stdin_data: Optional[str] = None) -> dict:
         cli_path = self.tools_dir / f"{tool_name}_cli.py"
         
         if not cli_path.exists():
@@ -68,37 +141,166 @@ class ToolExecutor:
         import os
         env = os.environ.copy()
         env["PYTHONIOENCODING"] = "utf-8"
+        # 工具子进程按该用户的数据分区读写
+        env[USER_ENV_VAR] = self.user_id or current_user()
+        span.set("user", env[USER_ENV_VAR])
+        
+        # 单条调用允许工具按 NDJSON 流式输出；批处理的结果是一个整体，不走流式
+        env[STREAM_ENV_VAR] = "1" if stdin_data is None else "0"
         
         try:
             # 使用 shell=True 来支持 Windows 下的命令执行
-            result = subprocess.run(
+            t0 = time.perf_counter()
+            proc = subprocess.Popen(
                 cmd, 
                 shell=True,
-                capture_output=True, 
+                stdin=subprocess.PIPE if stdin_data is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True, 
                 encoding='utf-8', 
                 errors='replace', # 避免编码错误导致崩溃
-                env=env,
-                timeout=15
+                env=env
             )
-            
-            if result.returncode != 0:
+            t1 = time.perf_counter()
+            timed_out = threading.Event()
+
+            def on_timeout():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(self.timeout, on_timeout)
+            timer.daemon = True
+            timer.start()
+            # 标准错误在后台读完，避免子进程写满管道后卡住
+            stderr_parts = []
+            drain = threading.Thread(target=lambda: stderr_parts.append(proc.stderr.read()), daemon=True)
+            drain.start()
+            try:
+                if stdin_data is not None:
+                    proc.stdin.write(stdin_data)
+                    proc.stdin.close()
+                result, info = self._read_output(proc.stdout)
+                if info["stopped_early"]:
+                    # 已经拿够了：不再读取剩余输出，直接结束子进程
+                    proc.kill()
+                proc.stdout.close()
+                proc.wait()
+            finally:
+                timer.cancel()
+            drain.join(timeout=1)
+            stderr = "".join(stderr_parts)
+            t2 = time.perf_counter()
+            span.set("spawn_ms", round((t1 - t0) * 1000, 3))
+            span.set("run_ms", round((t2 - t1) * 1000, 3))
+            span.set("output_bytes", info["bytes"])
+            span.set("returncode", proc.returncode)
+            span.set("stream", info["stream"])
+            if info["stream"]:
+                span.set("rows", info["rows"])
+                span.set("truncated", info["stopped_early"])
+
+            if timed_out.is_set():
+                return {"success": False, "error": f"工具执行超时（{self.timeout}s）"}
+            if proc.returncode != 0 and not info["stopped_early"]:
                 # 尝试解析标准错误
-                return {"success": False, "error": f"CLI执行错误: {result.stderr}", "raw_output": result.stdout}
-
-            # 尝试查找输出中的 JSON 部分（防止有其他 print 干扰）
-            output = result.stdout.strip()
-            # 简单的提取最后一个大括号包围的内容（假设 JSON 在最后）
-            json_match = re.search(r'(\{.*\})$', output, re.DOTALL)
-            if json_match:
-                output = json_match.group(1)
-                
-            return json.loads(output)
+                return {"success": False, "error": f"CLI执行错误: {stderr}", "raw_output": info.get("raw", "")}
+            return result
             
-        except json.JSONDecodeError:
-            return {"success": False, "error": "工具输出格式非标准JSON", "raw_output": result.stdout}
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    def _read_output(self, stdout) -> Tuple[dict, dict]:
+        """读取工具输出：NDJSON 流逐行读取并在达到上限时停下；普通输出整体解析，同样受字节上限约束"""
+        first = stdout.readline()
+        info = {"stream": False, "stopped_early": False, "rows": 0, "bytes": len(first.encode("utf-8"))}
+        head = None
+        if first.startswith('{"stream"'):
+            try:
+                head = json.loads(first)
+            except json.JSONDecodeError:
+                head = None
+        if isinstance(head, dict) and head.get("stream") == "head":
+            info["stream"] = True
+            return self._read_stream(stdout, head, info), info
+
+        chunks = [first]
+        while True:
+            chunk = stdout.read(65536)
+            if not chunk:
+                break
+            info["bytes"] += len(chunk.encode("utf-8"))
+            if info["bytes"] > self.max_bytes:
+                info["stopped_early"] = True
+                return {"success": False, "error": f"工具输出超过 {self.max_bytes} 字节，已中止",
+                        "truncated": True}, info
+            chunks.append(chunk)
+        output = "".join(chunks).strip()
+        info["raw"] = output
+        return self._parse_json_output(output), info
+
+    def _read_stream(self, stdout, head: dict, info: dict) -> dict:
+        key = head.get("key") or "data"
+        result = dict(head.get("fields") or {})
+        rows = []
+        reason = None
+        ended = False
+        for line in stdout:
+            info["bytes"] += len(line.encode("utf-8"))
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = records.loads(line)
+            except records.DecodeError:
+                result.update(success=False, error="工具输出的 NDJSON 行无法解析")
+                break
+            if isinstance(obj, dict) and obj.get("stream") == "end":
+                if head.get("count_key"):
+                    result[head["count_key"]] = obj.get("count", len(rows))
+                ended = True
+                break
+            if len(rows) >= self.max_rows:
+                reason = "rows"
+                break
+            if info["bytes"] > self.max_bytes:
+                reason = "bytes"
+                break
+            rows.append(obj)
+        result[key] = rows
+        info["rows"] = len(rows)
+        if reason is not None:
+            # 告诉 Agent 结果被截断了：只有前面这些行，总数未知
+            info["stopped_early"] = True
+            result["truncated"] = True
+            result["truncation"] = {"reason": reason, "rows": len(rows), "max_rows": self.max_rows,
+                                    "max_bytes": self.max_bytes,
+                                    "hint": "结果太多，请加上筛选条件（如 --month/--date/--category）缩小范围"}
+        elif not ended and result.get("success", True):
+            result.update(success=False, error="工具输出流意外中断")
+        return result
+
+    @staticmethod
+    def _parse_json_output(output: str) -> dict:
+        """解析普通（非流式）输出：工具最后一行是结果 JSON，前面可能夹杂其他打印"""
+        try:
+            return records.loads(output)
+        except records.DecodeError:
+            pass
+        last = output.rsplit("\n", 1)[-1].strip()
+        try:
+            return records.loads(last)
+        except records.DecodeError:
+            pass
+        # 兜底：从第一个 { 开始尽力解析一个 JSON 对象
+        start = output.find("{")
+        if start >= 0:
+            try:
+                obj, _ = json.JSONDecoder().raw_decode(output[start:])
+                return obj
+            except json.JSONDecodeError:
+                pass
+        return {"success": False, "error": "工具输出格式非标准JSON", "raw_output": output[:2000]}
     
     def parse_structured_response(
         self, llm_output: str
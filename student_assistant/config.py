@@ -1,10 +1,8 @@
 import os
-from dotenv import load_dotenv
 from pathlib import Path
 
-# 加载 .env 文件
-env_path = Path(__file__).parent / '.env'
-load_dotenv(env_path, override=True)
+# 配置按需解析：路径类常量在导入时确定；依赖环境变量的配置项第一次被访问时才读取 .env 并计算，
+# 之后缓存为模块属性。导入本模块不做任何 I/O，工具子进程只为真正用到的配置付出代价。
 
 # 基础配置
 BASE_DIR = Path(__file__).parent
@@ -12,16 +10,218 @@ DATA_DIR = BASE_DIR / "data"
 TOOLS_DIR = BASE_DIR / "tools"
 PROMPTS_DIR = BASE_DIR / "prompts"
 
-# 确保数据目录存在
-DATA_DIR.mkdir(exist_ok=True)
-
-# LLM 配置
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-MAX_HISTORY_COUNT = int(os.getenv("MAX_HISTORY_COUNT", "10"))
+# 数据目录不再在导入时创建，由各写入方在第一次写文件时创建
 
 # 数据文件路径
 SCHEDULE_FILE = DATA_DIR / "schedule.json"
 COURSE_FILE = DATA_DIR / "courses.json"
 BUDGET_FILE = DATA_DIR / "budget.json"
 MEMORY_FILE = DATA_DIR / "memory.json"
+# 数据变更流：各工具写入数据后追加变更事件，Web 端据此推送页面更新（见 tools/changefeed.py）
+CHANGES_FILE = DATA_DIR / "changes.jsonl"
+# 跨进程的数据版本号：每次写数据文件后递增，多个 Web worker 的进程内缓存据此失效（见 tools/dataversion.py）
+VERSIONS_DB = DATA_DIR / "versions.db"
+# 后台任务（报告、导出、备份）生成的文件，按用户分区存放
+EXPORTS_DIR = DATA_DIR / "exports"
+# 提醒调度的进程间锁：多个 Web worker 或守护进程中只有持锁的一个投递提醒（见 tools/reminders.py）
+REMINDER_LOCK_FILE = DATA_DIR / "reminders.lock"
+# Web 会话 Cookie 的签名密钥（未配置 SESSION_SECRET 时第一次登录时生成，见 web/auth.py）
+SESSION_SECRET_FILE = DATA_DIR / "session_secret"
+# 增量快照：按内容寻址的压缩数据块和每次快照的清单（见 tools/snapshot.py）
+SNAPSHOTS_DIR = DATA_DIR / "snapshots"
+
+# 多用户数据分区：默认用户沿用 data/ 下的文件，其他用户放在 data/users/<用户名>/
+USERS_DIR = DATA_DIR / "users"
+# 工具子进程通过该环境变量得知当前用户
+USER_ENV_VAR = "STUDENT_USER"
+# 工具子进程看到该环境变量为 1 时，列表型结果按 NDJSON 逐行输出（见 tools/stream.py）
+STREAM_ENV_VAR = "STUDENT_TOOL_STREAM"
+# 工具子进程看到该环境变量为 1 时，把进度以 JSON 行写到 stderr（后台任务据此汇报进度）
+PROGRESS_ENV_VAR = "STUDENT_JOB_PROGRESS"
+
+env_path = BASE_DIR / '.env'
+_env_loaded = False
+# 父进程加载过 .env 后把它的 mtime 记在环境变量里；工具子进程继承到相同 mtime 时说明
+# 环境里已经是解析好的配置，只需 stat 一次，不必再读取和解析 .env
+ENV_STAMP_VAR = "STUDENT_ENV_STAMP"
+
+
+def load_env():
+    """加载 .env 文件（只做一次；.env 中的值覆盖已有环境变量，与原先 override=True 一致）"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    try:
+        stamp = str(os.stat(env_path).st_mtime_ns)
+    except FileNotFoundError:
+        stamp = "none"
+    if os.environ.get(ENV_STAMP_VAR) != stamp:
+        # 只在真正需要解析 .env 时导入 python-dotenv（引号、转义、${VAR} 插值和多行值都按它的规则）
+        if stamp != "none":
+            from dotenv import load_dotenv
+            load_dotenv(env_path, override=True)
+        os.environ[ENV_STAMP_VAR] = stamp
+    _env_loaded = True
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _parse_rate_limits(spec: str) -> dict:
+    """"模型=RPM/TPM,..." -> {模型: (RPM, TPM)}；TPM 可省略"""
+    limits = {}
+    for item in spec.split(","):
+        model, sep, value = item.partition("=")
+        if not sep:
+            continue
+        rpm, _, tpm = value.partition("/")
+        limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+    return limits
+
+
+def _parse_user_tokens(spec: str) -> dict:
+    """"用户=令牌,..." -> {用户: 令牌}"""
+    tokens = {}
+    for item in spec.split(","):
+        user, sep, token = item.partition("=")
+        if sep and user.strip() and token.strip():
+            tokens[user.strip()] = token.strip()
+    return tokens
+
+
+_LAZY = {
+    # LLM 配置
+    "GEMINI_API_KEY": lambda: os.getenv("GEMINI_API_KEY"),
+    "GEMINI_MODEL": lambda: os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+    "MAX_HISTORY_COUNT": lambda: int(os.getenv("MAX_HISTORY_COUNT", "10")),
+    # 为空时使用官方地址；可指向本地桩服务
+    "GEMINI_BASE_URL": lambda: os.getenv("GEMINI_BASE_URL") or None,
+    "LLM_TIMEOUT": lambda: float(os.getenv("LLM_TIMEOUT", "30")),
+    # 服务端上下文缓存：静态系统提示（工具手册）缓存一次，之后每次请求只引用缓存名；TTL 单位为秒
+    "GEMINI_CONTEXT_CACHE": lambda: _flag("GEMINI_CONTEXT_CACHE", "false"),
+    "GEMINI_CACHE_TTL": lambda: int(os.getenv("GEMINI_CACHE_TTL", "3600")),
+    # 分层模型：选工具的轮次用低延迟的路由模型（为空表示不分层），最终回复仍由 GEMINI_MODEL 撰写
+    "LLM_ROUTING_MODEL": lambda: os.getenv("LLM_ROUTING_MODEL", "").strip(),
+    # 分层策略：single / tiered / tiered_fast，含义见 agent/assistant.py
+    "LLM_TIER_POLICY": lambda: os.getenv("LLM_TIER_POLICY", "tiered"),
+
+    # 多后端路由：主模型之外的备用后端，逗号分隔，每项为 "模型" 或 "模型@base_url"
+    "LLM_FALLBACKS": lambda: [x.strip() for x in os.getenv("LLM_FALLBACKS", "").split(",") if x.strip()],
+    # 主请求超过该延迟百分位仍未返回时，向下一个后端发一个对冲请求
+    "LLM_HEDGE_PERCENTILE": lambda: float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+    # 延迟样本不足时使用的对冲等待时间（秒）
+    "LLM_HEDGE_DELAY": lambda: float(os.getenv("LLM_HEDGE_DELAY", "3")),
+    # 连续失败多少次后熔断，熔断多少秒后放行一个试探请求
+    "LLM_BREAKER_FAILURES": lambda: int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+    "LLM_BREAKER_COOLDOWN": lambda: float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+    # 客户端限流：每个模型每分钟的请求数和 token 数配额（0 表示不限），请求按令牌桶排队发出
+    "LLM_RPM": lambda: int(os.getenv("LLM_RPM", "0")),
+    "LLM_TPM": lambda: int(os.getenv("LLM_TPM", "0")),
+    # 按模型覆盖配额，逗号分隔，每项为 "模型=RPM/TPM"
+    "LLM_RATE_LIMITS": lambda: _parse_rate_limits(os.getenv("LLM_RATE_LIMITS", "")),
+    # 排队超过该秒数仍未获得配额时放弃；收到 429 后最多重新排队的次数
+    "LLM_RATE_MAX_WAIT": lambda: float(os.getenv("LLM_RATE_MAX_WAIT", "30")),
+    "LLM_RATE_RETRIES": lambda: int(os.getenv("LLM_RATE_RETRIES", "2")),
+
+    # 追踪与指标配置
+    "TRACE_ENABLED": lambda: _flag("TRACE_ENABLED", "false"),
+    "TRACE_FILE": lambda: Path(os.getenv("TRACE_FILE", str(DATA_DIR / "traces.jsonl"))),
+    "METRICS_ENABLED": lambda: _flag("METRICS_ENABLED", "false"),
+
+    # 投机预取：根据用户输入提前执行可能用到的只读工具
+    "PREFETCH_ENABLED": lambda: _flag("PREFETCH_ENABLED", "false"),
+
+    # 工具结果写回上下文的编码：table（紧凑表格）/ json（原样）；表格最多显示的行数；保留多少份可翻页的完整结果
+    "TOOL_RESULT_FORMAT": lambda: os.getenv("TOOL_RESULT_FORMAT", "table"),
+    "TOOL_RESULT_MAX_ROWS": lambda: int(os.getenv("TOOL_RESULT_MAX_ROWS", "20")),
+    "TOOL_RESULT_REFS": lambda: int(os.getenv("TOOL_RESULT_REFS", "20")),
+
+    # 工具子进程输出上限：流式结果最多读取的行数和字节数，超过时提前结束子进程并标记截断
+    "TOOL_STREAM_MAX_ROWS": lambda: int(os.getenv("TOOL_STREAM_MAX_ROWS", "500")),
+    "TOOL_STREAM_MAX_BYTES": lambda: int(os.getenv("TOOL_STREAM_MAX_BYTES", str(1024 * 1024))),
+
+    # 数据变更流：文件超过该字节数时压缩，只保留最近的若干条事件
+    "CHANGEFEED_MAX_BYTES": lambda: int(os.getenv("CHANGEFEED_MAX_BYTES", str(1024 * 1024))),
+    "CHANGEFEED_KEEP": lambda: int(os.getenv("CHANGEFEED_KEEP", "1000")),
+    # Web 端检查变更流的间隔（秒）和 SSE 心跳间隔（秒）
+    "CHANGEFEED_POLL_INTERVAL": lambda: float(os.getenv("CHANGEFEED_POLL_INTERVAL", "0.5")),
+    "SSE_KEEPALIVE": lambda: float(os.getenv("SSE_KEEPALIVE", "15")),
+
+    # 日程与课程提醒：Web 端是否在后台运行提醒调度器（也可以单独运行 tools/reminders.py，两者选一）
+    "REMINDERS_ENABLED": lambda: _flag("REMINDERS_ENABLED", "false"),
+    # 为哪些用户提醒（逗号分隔，默认只有默认用户）；提前多少分钟提醒；检查数据变化的间隔（秒）
+    "REMINDER_USERS": lambda: [u.strip() for u in os.getenv(
+        "REMINDER_USERS", os.getenv("DEFAULT_USER", "default")).split(",") if u.strip()],
+    "REMINDER_LEAD_MINUTES": lambda: int(os.getenv("REMINDER_LEAD_MINUTES", "10")),
+    "REMINDER_CHECK_INTERVAL": lambda: float(os.getenv("REMINDER_CHECK_INTERVAL", "2")),
+    # 投递方式：console（打印）/ webhook（POST 到 REMINDER_WEBHOOK_URL）/ sse（推送到打开的页面）
+    "REMINDER_SINKS": lambda: [x.strip() for x in os.getenv("REMINDER_SINKS", "console,sse").split(",") if x.strip()],
+    "REMINDER_WEBHOOK_URL": lambda: os.getenv("REMINDER_WEBHOOK_URL") or None,
+
+    # 后台任务队列：每个 Web 进程同时运行的任务数、单个任务的超时（秒）、每个用户最多排队的任务数、
+    # 已完成任务及其结果文件保留多久（秒）
+    "JOB_WORKERS": lambda: int(os.getenv("JOB_WORKERS", "2")),
+    "JOB_TIMEOUT": lambda: float(os.getenv("JOB_TIMEOUT", "600")),
+    "JOB_MAX_PENDING": lambda: int(os.getenv("JOB_MAX_PENDING", "20")),
+    "JOB_RESULT_TTL": lambda: int(os.getenv("JOB_RESULT_TTL", "86400")),
+    # 任务是否持久化到 SQLite：重启后继续未完成的任务，多个 worker 共享同一个队列
+    "JOB_PERSIST": lambda: _flag("JOB_PERSIST", "false"),
+    "JOBS_DB": lambda: Path(os.getenv("JOBS_DB", str(DATA_DIR / "jobs.db"))),
+    # 持久化模式下空闲时检查新任务的间隔（秒），其他 worker 提交的任务靠它发现
+    "JOB_POLL_INTERVAL": lambda: float(os.getenv("JOB_POLL_INTERVAL", "1")),
+
+    # 增量快照：Web 服务每隔多少秒检查一次数据文件，有变化就拍一个快照（0 表示不在后台拍）
+    "SNAPSHOT_INTERVAL": lambda: float(os.getenv("SNAPSHOT_INTERVAL", "300")),
+    # 保留策略：最近的若干个快照全部保留，更早的每天、每周各保留最后一个
+    "SNAPSHOT_KEEP_LAST": lambda: int(os.getenv("SNAPSHOT_KEEP_LAST", "24")),
+    "SNAPSHOT_KEEP_DAILY": lambda: int(os.getenv("SNAPSHOT_KEEP_DAILY", "7")),
+    "SNAPSHOT_KEEP_WEEKLY": lambda: int(os.getenv("SNAPSHOT_KEEP_WEEKLY", "4")),
+
+    # 本地意图快速通道：高置信度的简单查询（余额、某天的课程/日程/天气）直接调用工具并按模板回复
+    "INTENT_FAST_PATH": lambda: _flag("INTENT_FAST_PATH", "true"),
+    "INTENT_THRESHOLD": lambda: float(os.getenv("INTENT_THRESHOLD", "0.8")),
+
+    # 对话历史持久化：每个会话一个目录，只追加的 JSONL 分段
+    "HISTORY_ENABLED": lambda: _flag("HISTORY_ENABLED", "true"),
+    "SESSIONS_DIR": lambda: Path(os.getenv("SESSIONS_DIR", str(DATA_DIR / "sessions"))),
+    "HISTORY_SEGMENT_LINES": lambda: int(os.getenv("HISTORY_SEGMENT_LINES", "500")),
+    "HISTORY_KEEP_SEGMENTS": lambda: int(os.getenv("HISTORY_KEEP_SEGMENTS", "4")),
+    # 内存中最多保留的消息条数（不小于 MAX_HISTORY_COUNT），更早的只在磁盘上
+    "HISTORY_MEMORY_CAP": lambda: int(os.getenv("HISTORY_MEMORY_CAP", "50")),
+
+    # 多用户：默认用户名；进程内最多缓存多少份（用户, 数据文件）的解析结果，以及它们对应文件的总字节数上限
+    "DEFAULT_USER": lambda: os.getenv("DEFAULT_USER", "default"),
+    "USER_CACHE_SIZE": lambda: int(os.getenv("USER_CACHE_SIZE", "256")),
+    "USER_CACHE_MAX_BYTES": lambda: int(os.getenv("USER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    # Web 登录：每个用户的访问令牌 "用户=令牌,..."（只有列出的用户能登录；默认用户不在其中时无需登录）；
+    # 会话 Cookie 的签名密钥（为空时自动生成并保存在 data/session_secret）和有效期（秒）
+    "USER_TOKENS": lambda: _parse_user_tokens(os.getenv("USER_TOKENS", "")),
+    "SESSION_SECRET": lambda: os.getenv("SESSION_SECRET", ""),
+    "SESSION_MAX_AGE": lambda: int(os.getenv("SESSION_MAX_AGE", str(30 * 24 * 3600))),
+    # 只在部署于已完成认证的反向代理之后时打开：按代理设置的 X-User-Id 请求头选择用户
+    "TRUST_USER_HEADER": lambda: _flag("TRUST_USER_HEADER", "false"),
+
+    # 天气：数据源 stub（离线、按地点和日期确定性生成）/ file（本地 JSON）/ http（预报服务或 eval 下的桩服务）
+    "WEATHER_PROVIDER": lambda: os.getenv("WEATHER_PROVIDER", "stub"),
+    "WEATHER_LOCATION": lambda: os.getenv("WEATHER_LOCATION", "学校"),
+    "WEATHER_FILE": lambda: Path(os.getenv("WEATHER_FILE", str(DATA_DIR / "weather.json"))),
+    "WEATHER_API_URL": lambda: os.getenv("WEATHER_API_URL", "http://127.0.0.1:8765"),
+    # 预报缓存按 (地点, 日期) 存盘，多个进程共享；TTL 单位为秒
+    "WEATHER_CACHE_FILE": lambda: Path(os.getenv("WEATHER_CACHE_FILE", str(DATA_DIR / "weather_cache.json"))),
+    "WEATHER_CACHE_TTL": lambda: int(os.getenv("WEATHER_CACHE_TTL", "3600")),
+}
+
+
+def __getattr__(name: str):
+    factory = _LAZY.get(name)
+    if factory is None:
+        raise AttributeError(f"module 'config' has no attribute {name!r}")
+    load_env()
+    value = factory()
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,90 @@
+"""对比系统提示内联发送与使用服务端上下文缓存时的上传量和输入 token
+
+在本地启动 Gemini 桩服务，用同一组对话分别跑两遍：
+- 内联：每次请求都在 system_instruction 里带上完整的工具手册
+- 缓存：工具手册创建为 cachedContents，请求只带缓存名和当前日期时间
+打印上传字节数、输入 token、其中命中缓存的 token、以及缓存的创建/续期次数。
+--cache-ttl 设得比整个测试短时，可以看到缓存过期后被透明地重新创建。
+
+用法：
+    python eval/context_cache_bench.py --turns 20
+    python eval/context_cache_bench.py --turns 20 --cache-ttl 2 --delay 0.3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.gemini_client import GeminiClient
+from prompts.prompt_manager import PromptManager
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_stub_server.py")
+QUERIES = ["今天有什么课", "明天天气怎么样", "我的余额还有多少", "这周有什么安排", "你好呀"]
+
+
+def build_prompts():
+    pm = PromptManager()
+    now = datetime.now()
+    weekdays = ["一", "二", "三", "四", "五", "六", "日"]
+    static = pm.load("assistant").format()
+    dynamic = pm.load("assistant_context").format(
+        current_date=now.strftime("%Y-%m-%d"), current_time=now.strftime("%H:%M"),
+        weekday=weekdays[now.weekday()])
+    return static, dynamic
+
+
+def run(client, turns, static, dynamic):
+    history = []
+    t0 = time.perf_counter()
+    for i in range(turns):
+        history.append({"role": "user", "content": QUERIES[i % len(QUERIES)]})
+        reply = client.chat(history[-10:], system_prompt=static, system_context=dynamic)
+        history.append({"role": "assistant", "content": reply})
+    return time.perf_counter() - t0
+
+
+def report(name, client, elapsed):
+    s = client.stats()
+    print(f"{name:<6} 上传 {s['request_bytes'] / 1024:8.1f}KB  输入 token {s['prompt_tokens']:>7}  "
+          f"命中缓存 {s['cached_tokens']:>7} ({s['cached_ratio']:.0%})  耗时 {elapsed:.2f}s")
+    if "cache" in s:
+        c = s["cache"]
+        print(f"       缓存创建 {c['creates']} 次，续期 {c['renewals']} 次，失效后重建 {c['invalidations']} 次，"
+              f"创建失败 {c['failures']} 次")
+    return s
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上下文缓存基准")
+    parser.add_argument("--turns", type=int, default=20, help="请求次数")
+    parser.add_argument("--cache-ttl", type=int, default=3600, help="缓存 TTL（秒）")
+    parser.add_argument("--delay", type=float, default=0.05, help="桩服务每次请求的延迟（秒）")
+    parser.add_argument("--port", type=int, default=8793)
+    args = parser.parse_args()
+
+    proc = subprocess.Popen([sys.executable, STUB, "--port", str(args.port), "--delay", str(args.delay),
+                             "--jitter", "0", "--seed", "1"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.8)
+    try:
+        base_url = f"http://127.0.0.1:{args.port}/v1beta"
+        static, dynamic = build_prompts()
+        inline = GeminiClient("stub", "bench-model", base_url=base_url)
+        cached = GeminiClient("stub", "bench-model", base_url=base_url, context_cache=True, cache_ttl=args.cache_ttl)
+        print(f"{args.turns} 次请求，静态提示 {len(static)} 字，动态部分 {len(dynamic)} 字\n")
+        a = report("内联", inline, run(inline, args.turns, static, dynamic))
+        b = report("缓存", cached, run(cached, args.turns, static, dynamic))
+        if a["prompt_tokens"]:
+            uncached = b["prompt_tokens"] - b["cached_tokens"]
+            print(f"\n需要完整计费的输入 token 减少 {1 - uncached / a['prompt_tokens']:.0%}，"
+                  f"上传字节减少 {1 - b['request_bytes'] / a['request_bytes']:.0%}")
+    finally:
+        proc.kill()
+
+
+if __name__ == "__main__":
+    main()
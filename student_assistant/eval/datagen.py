@@ -0,0 +1,192 @@
+"""生成大规模的合成数据，用于测量各个数据工具在大数据量下的表现
+
+按固定种子生成，同样的参数每次得到同样的数据：
+- 账单：跨若干年，每月固定生活费和偶尔的兼职收入；支出按类别的占比和金额分布抽样，周末外出消费更多；
+- 日程：分布在今天前后两年内，约 5% 为每周/隔周重复；
+- 课表：学期格式（节次、周次、单双周），课程数可调；
+- 记忆：用户和助手交替的中文对话片段，时间戳递增。
+
+数据写进指定用户的分区（见 tools/userdata.py），不会碰默认用户的数据；分区已存在时需要 --force。
+
+用法：
+    python eval/datagen.py --user bench_big --budget 50000 --years 3 --schedule 100000 --memories 100000
+    python eval/datagen.py --user bench_small --scale 0.01      # 所有数量乘以 0.01
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import COURSE_FILE
+from tools import budget_cli, memory_cli, records, schedule_cli
+from tools.recurrence import make_rule
+from tools.userdata import ensure_parent, mark_changed, use_user, user_dir, user_path
+
+# 支出类别: (占比权重, 金额中位数, 金额离散程度, 常见备注)
+EXPENSE_CATEGORIES = {
+    "餐饮": (45, 18, 0.5, ["食堂午饭", "食堂晚饭", "早餐", "外卖", "聚餐", "夜宵"]),
+    "饮品": (10, 14, 0.3, ["奶茶", "咖啡", "矿泉水", "果汁"]),
+    "交通出行": (9, 6, 0.8, ["地铁", "公交", "打车", "共享单车", "高铁"]),
+    "学习用品": (7, 25, 0.9, ["打印资料", "教材", "文具", "网课会员"]),
+    "日用品": (8, 30, 0.7, ["洗发水", "纸巾", "洗衣液", "牙膏"]),
+    "休闲娱乐": (8, 45, 0.8, ["看电影", "KTV", "游戏充值", "演出门票"]),
+    "服饰": (4, 150, 0.6, ["T恤", "运动鞋", "外套"]),
+    "通讯": (3, 39, 0.2, ["话费", "流量包"]),
+    "医疗": (2, 35, 0.9, ["药店", "校医院"]),
+    "运动健身": (4, 30, 0.7, ["羽毛球场", "游泳", "健身房"]),
+}
+EVENTS = ["社团例会", "小组讨论", "图书馆自习", "健身", "家教", "实验报告", "班会", "讲座", "面试",
+          "志愿活动", "英语角", "导师见面", "体测", "跑步", "考研复习", "项目答辩"]
+COURSE_NAMES = ["高等数学", "大学物理", "线性代数", "概率论", "大学英语", "计算机导论", "数据结构", "离散数学",
+                "操作系统", "计算机网络", "数据库原理", "编译原理", "思想政治", "体育", "马克思主义原理",
+                "电路分析", "信号与系统", "数字逻辑", "机器学习", "软件工程"]
+BUILDINGS = ["A", "B", "C", "D", "E", "实验楼", "机房"]
+PERIODS = {"1": "08:00-08:45", "2": "08:55-09:40", "3": "10:00-10:45", "4": "10:55-11:40",
+           "5": "14:00-14:45", "6": "14:55-15:40", "7": "16:00-16:45", "8": "16:55-17:40",
+           "9": "19:00-19:45", "10": "19:55-20:40", "11": "20:50-21:35", "12": "21:45-22:30"}
+# 记忆内容的模板：{0} 填地点/科目/事物，{1} 填时间或数字
+USER_SAYINGS = ["我下周{1}要去{0}", "帮我记住我喜欢{0}", "{0}的作业{1}之前要交", "我这个月在{0}上花了{1}块",
+                "提醒我{1}去{0}", "我不太擅长{0}", "以后{0}都安排在{1}", "我的室友在{0}", "{0}考试考了{1}分"]
+ASSISTANT_SAYINGS = ["好的，已经记下你{1}要去{0}", "明白，你喜欢{0}", "记住了：{0}的截止时间是{1}",
+                     "收到，{0}这个月一共{1}元", "没问题，{1}会提醒你{0}"]
+TOPICS = ["图书馆", "食堂", "体育馆", "高等数学", "英语四级", "奶茶", "篮球", "社团", "实验室", "咖啡",
+          "火锅", "自习室", "操场", "宿舍", "考研", "实习", "编程", "吉他", "摄影", "跑步"]
+
+
+def _round_amount(value: float) -> float:
+    return max(1.0, round(value, 1))
+
+
+def gen_budget(rng: random.Random, count: int, years: int, today: datetime):
+    """count 条账单，均匀分布在最近 years 年内；每月 1 号一笔生活费，其余按类别分布抽样"""
+    start = today - timedelta(days=365 * years)
+    days = max(1, (today - start).days)
+    cats = list(EXPENSE_CATEGORIES)
+    weights = [EXPENSE_CATEGORIES[c][0] for c in cats]
+    items = []
+    month = datetime(start.year, start.month, 1)
+    while month <= today and len(items) < count:
+        items.append(("income", 1500.0, "生活费", "家里转账", month))
+        month = (month + timedelta(days=32)).replace(day=1)
+    while len(items) < count:
+        day = start + timedelta(days=rng.randrange(days))
+        if rng.random() < 0.02:
+            items.append(("income", float(rng.choice([100, 200, 300, 500])), "兼职", "家教", day))
+            continue
+        # 周末外出多，休闲和餐饮的权重翻倍
+        if day.weekday() >= 5 and rng.random() < 0.3:
+            cat = rng.choice(["餐饮", "休闲娱乐"])
+        else:
+            cat = rng.choices(cats, weights)[0]
+        _, median, spread, notes = EXPENSE_CATEGORIES[cat]
+        amount = _round_amount(rng.lognormvariate(0, spread) * median)
+        items.append(("expense", amount, cat, rng.choice(notes), day))
+    items.sort(key=lambda x: x[4])
+    return {
+        "monthly_budget": 1500,
+        "category_budgets": {"餐饮": 800, "休闲娱乐": 200},
+        "records": [records.BudgetRecord(
+            id=i, type=t, amount=a, category=c, note=n, date=d.strftime("%Y-%m-%d"),
+            created_at=d.strftime("%Y-%m-%d") + f" {rng.randint(7, 23):02d}:{rng.randint(0, 59):02d}:00",
+        ) for i, (t, a, c, n, d) in enumerate(items, 1)],
+    }
+
+
+def gen_schedule(rng: random.Random, count: int, today: datetime):
+    data = []
+    for i in range(1, count + 1):
+        day = today + timedelta(days=rng.randint(-730, 730))
+        item = records.ScheduleItem(
+            id=i, date=day.strftime("%Y-%m-%d"),
+            time=f"{rng.randint(7, 21):02d}:{rng.choice(['00', '15', '30', '45'])}",
+            event=rng.choice(EVENTS), duration=rng.choice([30, 45, 60, 90, 120]),
+            created_at=(day - timedelta(days=rng.randint(0, 30))).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        if rng.random() < 0.05:
+            until = None
+            if rng.random() < 0.5:
+                until = (day + timedelta(days=rng.randint(30, 180))).strftime("%Y-%m-%d")
+            item["repeat"] = make_rule(rng.choice(["weekly", "biweekly"]), until)
+        data.append(item)
+    return data
+
+
+def gen_courses(rng: random.Random, count: int, today: datetime):
+    semester_start = today - timedelta(days=today.weekday() + 7 * rng.randint(0, 4))
+    courses = []
+    for _ in range(count):
+        first = rng.choice([1, 3, 5, 7, 9, 11])
+        span = rng.choice(["1-16", "1-8", "9-16", "1-18", "3-14"])
+        course = {"weekday": rng.randint(0, 6), "periods": [first, first + 1],
+                  "name": rng.choice(COURSE_NAMES), "location": f"{rng.choice(BUILDINGS)}{rng.randint(101, 520)}",
+                  "weeks": span}
+        if rng.random() < 0.2:
+            course["parity"] = rng.choice(["odd", "even"])
+        courses.append(course)
+    return {"semester": {"start": semester_start.strftime("%Y-%m-%d"), "weeks": 18},
+            "periods": PERIODS, "courses": courses}
+
+
+def gen_memories(rng: random.Random, count: int, today: datetime):
+    ts = today - timedelta(minutes=3 * count)
+    data = []
+    for i in range(1, count + 1):
+        role = "user" if i % 2 else "assistant"
+        template = rng.choice(USER_SAYINGS if role == "user" else ASSISTANT_SAYINGS)
+        when = rng.choice(["周一", "周三", "周五", "明天", "下午三点", "月底", str(rng.randint(50, 100))])
+        ts += timedelta(minutes=rng.randint(1, 5))
+        data.append(records.Memory(id=i, role=role, content=template.format(rng.choice(TOPICS), when),
+                                   timestamp=ts.strftime("%Y-%m-%d %H:%M:%S")))
+    return data
+
+
+def generate(user_id: str, budget: int = 10000, years: int = 3, schedule: int = 100000,
+             courses: int = 200, memories: int = 100000, seed: int = 42, today: datetime = None):
+    """在 user_id 的分区里生成全部数据集，返回每个数据集的条数"""
+    rng = random.Random(seed)
+    # 固定“今天”到日期，同一天内多次生成的数据完全一致
+    today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    with use_user(user_id):
+        # 各数据集用独立的随机流，调整一个数据集的数量不会改变其他数据集的内容
+        seeds = [rng.randrange(2 ** 32) for _ in range(4)]
+        budget_cli.save_data(gen_budget(random.Random(seeds[0]), budget, years, today))
+        schedule_cli.save_data(gen_schedule(random.Random(seeds[1]), schedule, today))
+        path = ensure_parent(user_path(COURSE_FILE))
+        records.dump_file(gen_courses(random.Random(seeds[2]), courses, today), path)
+        mark_changed(path)
+        memory_cli.save_data(gen_memories(random.Random(seeds[3]), memories, today))
+    return {"budget": budget, "schedule": schedule, "courses": courses, "memories": memories}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成大规模合成数据")
+    parser.add_argument("--user", required=True, help="写入哪个用户的分区")
+    parser.add_argument("--budget", type=int, default=10000, help="账单条数")
+    parser.add_argument("--years", type=int, default=3, help="账单跨越的年数")
+    parser.add_argument("--schedule", type=int, default=100000, help="日程条数")
+    parser.add_argument("--courses", type=int, default=200, help="课程条数")
+    parser.add_argument("--memories", type=int, default=100000, help="记忆条数")
+    parser.add_argument("--scale", type=float, default=1.0, help="所有条数乘以该系数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="分区已存在时先删除")
+    args = parser.parse_args()
+
+    target = user_dir(args.user)
+    if target.exists() and any(target.iterdir()):
+        if not args.force or args.user == os.getenv("DEFAULT_USER", "default"):
+            sys.exit(f"用户分区 {target} 已有数据；确认要覆盖时加 --force（默认用户不允许覆盖）")
+        shutil.rmtree(target)
+    n = lambda x: max(1, int(x * args.scale))
+    counts = generate(args.user, n(args.budget), args.years, n(args.schedule), n(args.courses),
+                      n(args.memories), args.seed)
+    sizes = {p.name: p.stat().st_size for p in target.iterdir() if p.is_file()}
+    print(f"已生成到 {target}：" + "，".join(f"{k} {v} 条" for k, v in counts.items()))
+    print("文件大小：" + "，".join(f"{k} {v / 1024:.0f}KB" for k, v in sorted(sizes.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import os
 import json
 import sys
@@ -7,20 +8,30 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agent.assistant import AssistantAgent
-from llm.gemini_client import GeminiClient
+from llm.router import create_client, percentile
 from prompts.prompt_manager import PromptManager
 from agent.tool_executor import ToolExecutor
+from agent.intent import IntentRouter
 import config
 
 class Evaluator:
-    def __init__(self, test_cases_path):
+    def __init__(self, test_cases_path, tier_policy=None, routing_model=None, fast_path=None):
         self.test_cases = self.load_test_cases(test_cases_path)
         
         # 初始化 Agent
-        llm = GeminiClient(api_key=config.GEMINI_API_KEY, model=config.GEMINI_MODEL)
+        llm = create_client(api_key=config.GEMINI_API_KEY, model=config.GEMINI_MODEL)
+        tier_policy = tier_policy or config.LLM_TIER_POLICY
+        routing_model = config.LLM_ROUTING_MODEL if routing_model is None else routing_model
+        routing_llm = None
+        if routing_model and tier_policy != "single":
+            routing_llm = create_client(api_key=config.GEMINI_API_KEY, model=routing_model)
         pm = PromptManager()
         executor = ToolExecutor()
-        self.agent = AssistantAgent(llm, pm, executor, max_history=5)
+        fast_path = config.INTENT_FAST_PATH if fast_path is None else fast_path
+        intent_router = IntentRouter(executor, threshold=config.INTENT_THRESHOLD) if fast_path else None
+        self.agent = AssistantAgent(llm, pm, executor, max_history=5,
+                                    routing_llm=routing_llm, tier_policy=tier_policy,
+                                    intent_router=intent_router)
         
     def load_test_cases(self, path):
         with open(path, 'r', encoding='utf-8') as f:
@@ -56,6 +67,11 @@ class Evaluator:
                     "duration": duration,
                     "error": None
                 }
+                # 分层统计：哪一层模型做出了调工具的决定，以及每层的调用耗时
+                calls_log = list(self.agent.turn_log)
+                metrics["decision_tier"] = next(
+                    (c["tier"] for c in calls_log if c["result"] == "tool_calls"), None)
+                metrics["llm_calls"] = [{"tier": c["tier"], "latency": c["latency"]} for c in calls_log]
                 
                 # 检查是否调用了工具（支持新格式：tool_calls 列表）
                 tool_call_content = None
@@ -125,10 +141,51 @@ class Evaluator:
         print(f"成功: {success}")
         print(f"失败: {total - success}")
         print(f"成功率: {(success/total*100):.2f}%")
+        self.print_tier_summary(results)
         print("="*30)
 
+    def print_tier_summary(self, results):
+        """按模型层级汇报：调工具决定的准确率，以及每次调用的平均 / p95 耗时"""
+        print("-"*30)
+        print(f"分层策略: {self.agent.tier_policy if self.agent.routing_llm else 'single'}")
+        summary = self.agent.tier_summary()
+        for tier, info in summary.items():
+            latencies = [c["latency"] for r in results for c in r.get("llm_calls", []) if c["tier"] == tier]
+            decided = [r for r in results if r.get("decision_tier") == tier]
+            accuracy = sum(1 for r in decided if r["success"]) / len(decided) if decided else None
+            print(f"[{tier}] 模型 {info['model']}: 调用 {info['calls']} 次，"
+                  f"平均 {percentile_ms(latencies, None)}ms，p95 {percentile_ms(latencies, 95)}ms")
+            print(f"    做出调工具决定 {len(decided)} 次，准确率 "
+                  f"{'-' if accuracy is None else f'{accuracy:.0%}'}；"
+                  f"无法解析 {info['invalid']} 次，出错 {info['errors']} 次，升级到回复模型 {info['escalations']} 次")
+        if self.agent.intent_router is not None:
+            stats = self.agent.intent_router.stats()
+            decided = [r for r in results if r.get("decision_tier") == "intent"]
+            accuracy = sum(1 for r in decided if r["success"]) / len(decided) if decided else None
+            print(f"[intent] 快速通道直接回答 {stats['served']}/{stats['total']} 条（{stats['share']:.0%}），"
+                  f"准确率 {'-' if accuracy is None else f'{accuracy:.0%}'}，"
+                  f"平均 {stats['fast_avg_ms'] or '-'}ms，估计共节省 {stats['saved_ms'] or '-'}ms")
+        durations = [r["duration"] for r in results if "duration" in r]
+        if durations:
+            print(f"单条用例耗时: 平均 {sum(durations) / len(durations):.2f}s，p95 {percentile(durations, 95):.2f}s")
+
+
+def percentile_ms(latencies, p):
+    """p 为 None 时返回平均值（毫秒）"""
+    if not latencies:
+        return "-"
+    value = sum(latencies) / len(latencies) if p is None else percentile(latencies, p)
+    return f"{value * 1000:.0f}"
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agent 工具调用评估")
+    parser.add_argument("--policy", choices=["single", "tiered", "tiered_fast"],
+                        help="分层策略（默认取 LLM_TIER_POLICY）")
+    parser.add_argument("--routing-model", help="路由模型（默认取 LLM_ROUTING_MODEL，空字符串表示不分层）")
+    parser.add_argument("--no-fast-path", action="store_true", help="关闭本地意图快速通道")
+    args = parser.parse_args()
     test_cases_file = os.path.join(os.path.dirname(__file__), "test_cases.json")
-    evaluator = Evaluator(test_cases_file)
+    evaluator = Evaluator(test_cases_file, tier_policy=args.policy, routing_model=args.routing_model,
+                          fast_path=False if args.no_fast_path else None)
     results = evaluator.run()
     evaluator.print_summary(results)
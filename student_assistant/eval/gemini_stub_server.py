@@ -0,0 +1,299 @@
+"""Gemini API 桩服务：离线测试 LLM 客户端（对冲、故障转移、熔断等）
+
+用法：
+    python eval/gemini_stub_server.py --port 8790 --delay 0.3 --jitter 0.1 --slow-prob 0.1 --slow-delay 5
+    python eval/gemini_stub_server.py --model-delay small=0.05 --model-invalid small=0.1   # 模拟分层模型
+    python eval/gemini_stub_server.py --rpm 60 --tpm 20000          # 模拟每个模型每分钟的请求数/token 数配额
+    GEMINI_BASE_URL=http://127.0.0.1:8790/v1beta GEMINI_API_KEY=stub python main.py
+
+POST /v1beta/models/<模型>:generateContent  按注入的延迟/错误率返回 Gemini 格式的响应（带 usageMetadata）
+POST /v1beta/cachedContents                 创建上下文缓存；PATCH/GET/DELETE /v1beta/cachedContents/<id> 续期/查询/删除
+GET  /stats                                 各模型收到的请求数、注入的慢请求数、错误数、被限流数和 token 用量
+
+设置 --rpm/--tpm 时按模型在 --quota-window 秒的滑动窗口内计数，超出时返回 429 RESOURCE_EXHAUSTED，
+错误详情带 RetryInfo.retryDelay（与 Gemini API 相同）。请求在到达时按输入 token 计入，返回后补上输出 token。
+
+token 数按“每个汉字 1 个、其他字符 4 个 1 个”估算，只用于比较缓存前后的差别。
+
+回复内容：如果最后一条消息是工具结果，返回最终回复；否则按关键词返回只读工具调用
+（天气、课程、日程、余额），都不匹配时直接回复。足够驱动 Agent 跑完整的 ReAct 循环。
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+KEYWORD_CALLS = [
+    (re.compile(r"天气|下雨|带伞|气温"), "weather", "query --date today"),
+    (re.compile(r"课"), "course", "query --date today"),
+    (re.compile(r"日程|安排|有什么事"), "schedule", "query --date today"),
+    (re.compile(r"余额|还剩|生活费"), "budget", "balance"),
+]
+
+_lock = threading.Lock()
+_stats = {}
+_caches = {}  # 缓存名 -> {"model", "tokens", "expires"}
+_cache_ids = itertools.count(1)
+_cache_stats = {"creates": 0, "renewals": 0, "expired_hits": 0}
+_windows = {}  # 模型 -> deque([到达时间, token 数])，配额的滑动窗口
+
+
+def _bump(model: str, key: str, amount: int = 1):
+    with _lock:
+        stats = _stats.setdefault(model, {"requests": 0, "slow": 0, "errors": 0, "invalid": 0,
+                                          "rate_limited": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        stats[key] += amount
+
+
+def estimate_tokens(text: str) -> int:
+    wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _parts_text(obj) -> str:
+    return "".join(p.get("text", "") for p in (obj or {}).get("parts") or [])
+
+
+def _parse_ttl(value, cap: float) -> float:
+    seconds = float(str(value or "3600s").rstrip("s"))
+    return min(seconds, cap) if cap else seconds
+
+
+def _expire_time(expires: float) -> str:
+    at = datetime.now(timezone.utc) + timedelta(seconds=max(0.0, expires - time.monotonic()))
+    return at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def admit(model: str, tokens: int, options):
+    """按配额放行一个请求：放行时返回窗口中的记录（之后补记输出 token），超出配额时返回建议的等待秒数"""
+    now = time.monotonic()
+    with _lock:
+        window = _windows.setdefault(model, deque())
+        while window and now - window[0][0] >= options.quota_window:
+            window.popleft()
+        over_rpm = options.rpm and len(window) + 1 > options.rpm
+        over_tpm = options.tpm and sum(e[1] for e in window) + tokens > options.tpm
+        if not over_rpm and not over_tpm:
+            entry = [now, tokens]
+            window.append(entry)
+            return entry
+        # 等到最早的记录移出窗口（TPM 超出时可能需要更多，客户端会再次收到 429）
+        return max(0.1, options.quota_window - (now - window[0][0])) if window else options.quota_window
+
+
+def scripted_reply(model: str, contents: list) -> str:
+    last = ""
+    if contents:
+        parts = contents[-1].get("parts") or [{}]
+        last = parts[0].get("text", "")
+    if last.startswith("工具 ") and "执行结果" in last:
+        return json.dumps({"tool_calls": [], "reply": f"[{model}] 已根据工具结果整理好了。"}, ensure_ascii=False)
+    for pattern, tool, args in KEYWORD_CALLS:
+        if pattern.search(last):
+            return json.dumps({"tool_calls": [{"tool": tool, "args": args}], "reply": None}, ensure_ascii=False)
+    return json.dumps({"tool_calls": [], "reply": f"[{model}] 收到：{last[:40]}"}, ensure_ascii=False)
+
+
+class Handler(BaseHTTPRequestHandler):
+    options = None
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        return json.loads(raw or b"{}")
+
+    def _not_found(self, message):
+        self._send(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+
+    def _live_cache(self, name):
+        """返回未过期的缓存；过期的顺手删掉"""
+        with _lock:
+            cache = _caches.get(name)
+            if cache is not None and time.monotonic() >= cache["expires"]:
+                del _caches[name]
+                _cache_stats["expired_hits"] += 1
+                cache = None
+            return cache
+
+    def _cache_view(self, name, cache):
+        return {"name": name, "model": f"models/{cache['model']}", "expireTime": _expire_time(cache["expires"]),
+                "usageMetadata": {"totalTokenCount": cache["tokens"]}}
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            with _lock:
+                return self._send(200, {**_stats, "_caches": {**_cache_stats, "active": len(_caches)}})
+        match = re.match(r"^/v1beta/(cachedContents/[^/]+)$", path)
+        if match:
+            cache = self._live_cache(match.group(1))
+            if cache is None:
+                return self._not_found(f"CachedContent not found: {match.group(1)}")
+            return self._send(200, self._cache_view(match.group(1), cache))
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_PATCH(self):
+        match = re.match(r"^/v1beta/(cachedContents/[^/]+)$", urlparse(self.path).path)
+        if not match:
+            return self._send(404, {"error": {"message": "not found"}})
+        name = match.group(1)
+        payload = self._read_json()
+        cache = self._live_cache(name)
+        if cache is None:
+            return self._not_found(f"CachedContent not found (or expired): {name}")
+        with _lock:
+            cache["expires"] = time.monotonic() + _parse_ttl(payload.get("ttl"), self.options.max_cache_ttl)
+            _cache_stats["renewals"] += 1
+        self._send(200, self._cache_view(name, cache))
+
+    def do_DELETE(self):
+        match = re.match(r"^/v1beta/(cachedContents/[^/]+)$", urlparse(self.path).path)
+        with _lock:
+            removed = match is not None and _caches.pop(match.group(1), None) is not None
+        if not removed:
+            return self._not_found("CachedContent not found")
+        self._send(200, {})
+
+    def _create_cache(self, payload):
+        model = str(payload.get("model", "")).split("/")[-1]
+        tokens = estimate_tokens(_parts_text(payload.get("systemInstruction")))
+        if tokens < self.options.min_cache_tokens:
+            return self._send(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT", "message":
+                                              f"Cached content is too small. total_token_count={tokens}, "
+                                              f"min_total_token_count={self.options.min_cache_tokens}"}})
+        name = f"cachedContents/stub{next(_cache_ids)}"
+        cache = {"model": model, "tokens": tokens,
+                 "expires": time.monotonic() + _parse_ttl(payload.get("ttl"), self.options.max_cache_ttl)}
+        with _lock:
+            _caches[name] = cache
+            _cache_stats["creates"] += 1
+        self._send(200, self._cache_view(name, cache))
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/v1beta/cachedContents":
+            return self._create_cache(self._read_json())
+        match = re.match(r"^/v1beta/models/([^/:]+):generateContent$", path)
+        if not match:
+            return self._send(404, {"error": {"message": f"unknown path {path}"}})
+        model = match.group(1)
+        payload = self._read_json()
+        _bump(model, "requests")
+        cached_tokens = 0
+        if payload.get("cachedContent"):
+            cache = self._live_cache(payload["cachedContent"])
+            if cache is None:
+                return self._not_found(f"CachedContent not found (or expired): {payload['cachedContent']}")
+            if cache["model"] != model:
+                return self._send(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                                  "message": "Model used by GenerateContent and CachedContent differ"}})
+            cached_tokens = cache["tokens"]
+        opts = self.options
+        prompt_tokens = cached_tokens + estimate_tokens(_parts_text(payload.get("system_instruction")))
+        prompt_tokens += sum(estimate_tokens(_parts_text(c)) for c in payload.get("contents", []))
+        quota = None
+        if opts.rpm or opts.tpm:
+            quota = admit(model, prompt_tokens, opts)
+            if not isinstance(quota, list):
+                _bump(model, "rate_limited")
+                return self._send(429, {"error": {
+                    "code": 429, "status": "RESOURCE_EXHAUSTED",
+                    "message": f"stub: quota exceeded for model {model}",
+                    "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{quota:.1f}s"}],
+                }})
+        base_delay = opts.model_delay.get(model, opts.delay)
+        delay = max(0.0, base_delay + random.uniform(-opts.jitter, opts.jitter))
+        if random.random() < opts.slow_prob:
+            _bump(model, "slow")
+            delay = opts.slow_delay
+        time.sleep(delay)
+        if random.random() < opts.error_rate:
+            _bump(model, "errors")
+            return self._send(503, {"error": {"code": 503, "message": "stub: injected error"}})
+        contents = payload.get("contents", [])
+        text = opts.reply if opts.reply is not None else scripted_reply(model, contents)
+        if random.random() < opts.model_invalid.get(model, 0.0):
+            # 模拟小模型偶尔输出不合格式的内容
+            _bump(model, "invalid")
+            text = "好的，我来帮你查一下"
+        if quota is not None:
+            with _lock:
+                quota[1] += estimate_tokens(text)
+        _bump(model, "prompt_tokens", prompt_tokens)
+        _bump(model, "cached_tokens", cached_tokens)
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": estimate_tokens(text),
+                 "totalTokenCount": prompt_tokens + estimate_tokens(text)}
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        self._send(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": usage,
+            "modelVersion": model,
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _per_model(items) -> dict:
+    values = {}
+    for item in items:
+        model, _, value = item.partition("=")
+        values[model.strip()] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini API 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--delay", type=float, default=0.2, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05, help="延迟的随机抖动（秒）")
+    parser.add_argument("--slow-prob", type=float, default=0.0, help="慢请求的概率")
+    parser.add_argument("--slow-delay", type=float, default=5.0, help="慢请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--reply", help="固定的回复文本（默认按关键词生成）")
+    parser.add_argument("--seed", type=int, help="随机种子，便于复现")
+    parser.add_argument("--model-delay", action="append", default=[], metavar="模型=秒",
+                        help="按模型覆盖基础延迟，可重复")
+    parser.add_argument("--model-invalid", action="append", default=[], metavar="模型=概率",
+                        help="该模型返回无法解析的文本的概率，可重复")
+    parser.add_argument("--min-cache-tokens", type=int, default=0,
+                        help="创建缓存所需的最少 token 数，不足时返回 400（模拟服务端限制）")
+    parser.add_argument("--rpm", type=int, default=0, help="每个模型每个窗口最多的请求数，0 表示不限")
+    parser.add_argument("--tpm", type=int, default=0, help="每个模型每个窗口最多的 token 数，0 表示不限")
+    parser.add_argument("--quota-window", type=float, default=60.0, help="配额的滑动窗口长度（秒）")
+    parser.add_argument("--max-cache-ttl", type=float, default=0,
+                        help="缓存 TTL 上限（秒），设得很小可以测试过期后重建")
+    args = parser.parse_args()
+    args.model_delay = _per_model(args.model_delay)
+    args.model_invalid = _per_model(args.model_invalid)
+    if args.seed is not None:
+        random.seed(args.seed)
+    Handler.options = args
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"Gemini 桩服务已启动: http://{args.host}:{args.port}/v1beta")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""对比单后端 GeminiClient 与 RouterClient（对冲 + 故障转移）的尾延迟
+
+脚本会在本地启动两个 Gemini 桩服务：
+- 主后端：平均 0.2s，但有 --slow-prob 的概率卡住 --slow-delay 秒，另有 --error-rate 的错误率
+- 备用后端：稳定的 0.3s
+然后分别用两种客户端发送相同数量的请求，打印 p50/p95/p99 以及路由统计。
+
+用法：
+    python eval/llm_router_bench.py --requests 100 --slow-prob 0.1 --slow-delay 3 --error-rate 0.05
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.base_client import LLMError
+from llm.gemini_client import GeminiClient
+from llm.router import RouterClient, percentile
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_stub_server.py")
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def start_stub(port, *extra):
+    proc = subprocess.Popen([sys.executable, STUB, "--port", str(port), "--seed", str(port), *extra],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.8)
+    return proc
+
+
+def run(client, n):
+    latencies, errors = [], 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            client.chat(MESSAGES)
+        except LLMError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+    return latencies, errors
+
+
+def report(name, latencies, errors):
+    ms = lambda p: percentile(latencies, p) * 1000
+    print(f"{name:<14} p50={ms(50):7.0f}ms  p95={ms(95):7.0f}ms  p99={ms(99):7.0f}ms  "
+          f"max={max(latencies, default=0) * 1000:7.0f}ms  errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 对冲请求基准")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--slow-prob", type=float, default=0.1)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+
+    primary_port, backup_port = args.port, args.port + 1
+    servers = [
+        start_stub(primary_port, "--delay", "0.2", "--jitter", "0.05", "--slow-prob", str(args.slow_prob),
+                   "--slow-delay", str(args.slow_delay), "--error-rate", str(args.error_rate)),
+        start_stub(backup_port, "--delay", "0.3", "--jitter", "0.02"),
+    ]
+    try:
+        primary_url = f"http://127.0.0.1:{primary_port}/v1beta"
+        backup_url = f"http://127.0.0.1:{backup_port}/v1beta"
+        single = GeminiClient("stub", "primary-model", base_url=primary_url, timeout=10)
+        router = RouterClient(
+            [("primary", GeminiClient("stub", "primary-model", base_url=primary_url, timeout=10)),
+             ("backup", GeminiClient("stub", "backup-model", base_url=backup_url, timeout=10))],
+            hedge_percentile=90, hedge_delay=0.5, min_samples=5, timeout=10,
+        )
+        print(f"{args.requests} 次请求，主后端慢请求概率 {args.slow_prob:.0%}（{args.slow_delay}s），错误率 {args.error_rate:.0%}\n")
+        report("单后端", *run(single, args.requests))
+        report("对冲路由", *run(router, args.requests))
+        stats = router.stats()
+        print(f"\n对冲 {stats['hedges']} 次，其中对冲请求胜出 {stats['hedge_wins']} 次；故障转移 {stats['failovers']} 次")
+        for name, b in stats["backends"].items():
+            print(f"  {name:<8} calls={b['calls']:<4} wins={b['wins']:<4} failures={b['failures']:<3} "
+                  f"p50={b['p50_ms']}ms p95={b['p95_ms']}ms breaker={b['breaker']}")
+    finally:
+        for s in servers:
+            s.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""客户端限流基准：多个会话同时对话、配额有限时，限流调度器能否避免 429 并公平分配配额
+
+脚本在本地启动按 --rpm/--tpm 限流的 Gemini 桩服务（窗口缩短为 --window 秒，便于快速跑完），模拟：
+- --sessions 个普通会话，各自依次进行 --turns 轮对话；
+- 1 个“重度”会话，用 --heavy-threads 个线程同时发起对话（例如批量评估或脚本）。
+每轮对话是一次选工具的调用加一次撰写回复的调用。依次比较三种客户端：
+- 不限流：直接调用 GeminiClient，超出配额的请求收到 429，整轮对话失败；
+- 限流（先来先服务）：所有请求共用一个令牌桶，按到达顺序放行；
+- 限流（优先级 + 会话公平）：回复优先于选工具，各会话轮流放行。
+打印成功率、服务端 429 次数、普通会话和重度会话的每轮耗时，以及两种优先级的排队时间。
+
+用法：
+    python eval/ratelimit_bench.py
+    python eval/ratelimit_bench.py --rpm 40 --tpm 4000 --window 10 --sessions 8 --heavy-threads 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.base_client import LLMError
+from llm.gemini_client import GeminiClient
+from llm.ratelimit import PRIORITY_REPLY, PRIORITY_ROUTING, RateLimitedClient, RateLimiter, use_request
+from llm.router import percentile
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gemini_stub_server.py")
+SYSTEM_PROMPT = "你是大学生小秘书，根据用户的问题选择工具或直接回复。" * 5
+ROUTING_MESSAGES = [{"role": "user", "content": "今天有什么课"}]
+REPLY_MESSAGES = ROUTING_MESSAGES + [
+    {"role": "assistant", "content": '{"tool_calls": [{"tool": "course", "args": "query --date today"}], "reply": null}'},
+    {"role": "user", "content": "工具 course 执行结果：08:00-09:40 高等数学 A301；14:00-15:40 大学物理 B102"},
+]
+
+
+def start_stub(port, args):
+    proc = subprocess.Popen([sys.executable, STUB, "--port", str(port), "--seed", str(port),
+                             "--delay", str(args.delay), "--jitter", "0.02", "--rpm", str(args.rpm),
+                             "--tpm", str(args.tpm), "--quota-window", str(args.window)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.8)
+    return proc
+
+
+def stub_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def one_turn(client, session, routing_priority):
+    """一轮对话：选工具 + 撰写回复，返回耗时；任一步失败返回 None"""
+    t0 = time.perf_counter()
+    try:
+        with use_request(session, routing_priority):
+            client.chat(ROUTING_MESSAGES, system_prompt=SYSTEM_PROMPT)
+        with use_request(session, PRIORITY_REPLY):
+            client.chat(REPLY_MESSAGES, system_prompt=SYSTEM_PROMPT)
+    except LLMError:
+        return None
+    return time.perf_counter() - t0
+
+
+def run(client, args, fair=True):
+    """并发跑所有会话，返回 {"light": [...], "heavy": [...]}，失败的轮次记为 None"""
+    results = {"light": [], "heavy": []}
+    lock = threading.Lock()
+
+    def worker(kind, session):
+        # 先来先服务：所有请求算作同一个会话、同一优先级，放行顺序只看到达时间
+        name = session if fair else "all"
+        priority = PRIORITY_ROUTING if fair else PRIORITY_REPLY
+        for _ in range(args.turns):
+            latency = one_turn(client, name, priority)
+            with lock:
+                results[kind].append(latency)
+
+    threads = [threading.Thread(target=worker, args=("light", f"user{i}")) for i in range(args.sessions)]
+    threads += [threading.Thread(target=worker, args=("heavy", "batch")) for _ in range(args.heavy_threads)]
+    # 重度会话先涌入，普通会话稍后到达
+    for t in threads[args.sessions:] + threads[:args.sessions]:
+        t.start()
+        time.sleep(0.01)
+    for t in threads:
+        t.join()
+    return results
+
+
+def report(name, results, rate_limited, elapsed, limiter=None):
+    total = sum(len(v) for v in results.values())
+    ok = sum(1 for v in results.values() for x in v if x is not None)
+    line = f"{name:<18} 成功 {ok}/{total}  429 {rate_limited:>3} 次  用时 {elapsed:5.1f}s"
+    for kind, label in (("light", "普通会话"), ("heavy", "重度会话")):
+        done = [x for x in results[kind] if x is not None]
+        if done:
+            line += f"  {label} p50={percentile(done, 50):5.2f}s p95={percentile(done, 95):5.2f}s"
+    print(line)
+    if limiter is not None:
+        stats = limiter.stats()
+        wait = lambda key: f"{stats[key]:.0f}ms" if stats[key] is not None else "-"
+        print(f"{'':<18} 排队 回复 p95={wait('reply_wait_p95_ms')}  选工具 p95={wait('routing_wait_p95_ms')}  "
+              f"最长队列 {stats['max_queue']}  排队超时 {stats['rejected']}  收到 429 {stats['throttled']} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 客户端限流基准")
+    parser.add_argument("--rpm", type=int, default=60, help="每个窗口的请求数配额")
+    parser.add_argument("--tpm", type=int, default=0, help="每个窗口的 token 配额，0 表示不限")
+    parser.add_argument("--window", type=float, default=10.0, help="配额窗口（秒），真实 API 为 60")
+    parser.add_argument("--delay", type=float, default=0.1, help="桩服务的响应延迟（秒）")
+    parser.add_argument("--sessions", type=int, default=6, help="普通会话数")
+    parser.add_argument("--heavy-threads", type=int, default=8, help="重度会话的并发线程数")
+    parser.add_argument("--turns", type=int, default=3, help="每个线程的对话轮数")
+    parser.add_argument("--max-wait", type=float, default=60.0, help="排队超时（秒）")
+    parser.add_argument("--port", type=int, default=8795)
+    args = parser.parse_args()
+
+    calls = (args.sessions + args.heavy_threads) * args.turns * 2
+    print(f"{args.sessions} 个普通会话 + 1 个重度会话（{args.heavy_threads} 线程），共 {calls} 次调用；"
+          f"配额 {args.rpm} 次" + (f" / {args.tpm} token" if args.tpm else "") + f" 每 {args.window:g}s\n")
+    modes = [("不限流", None, True), ("限流 先来先服务", "fifo", False), ("限流 优先级+公平", "fair", True)]
+    for i, (name, mode, fair) in enumerate(modes):
+        port = args.port + i
+        server = start_stub(port, args)
+        try:
+            base = GeminiClient("stub", "quota-model", base_url=f"http://127.0.0.1:{port}/v1beta", timeout=30)
+            limiter = None
+            client = base
+            if mode:
+                limiter = RateLimiter(args.rpm, args.tpm, period=args.window, max_wait=args.max_wait, name=name)
+                client = RateLimitedClient(base, limiter, retries=2)
+            t0 = time.perf_counter()
+            results = run(client, args, fair=fair)
+            elapsed = time.perf_counter() - t0
+            rate_limited = stub_stats(port).get("quota-model", {}).get("rate_limited", 0)
+            report(name, results, rate_limited, elapsed, limiter)
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
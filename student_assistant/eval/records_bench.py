@@ -0,0 +1,95 @@
+"""对比记录对象（tools/records.py）与原先 dict + json 的编解码速度和内存
+
+生成 N 条账单记录（纯内存，不读写用户数据），分别测量：
+1. 解码：原先 json.loads 得到 dict 列表，现在 loads + 逐条校验成 BudgetRecord；
+2. 编码：原先 json.dumps(indent=2)，现在 dumps_bytes（紧凑格式，用于工具输出）和 file_bytes（缩进格式，用于数据文件）；
+3. 每条记录常驻内存（tracemalloc 统计，含字段值本身）。
+安装了 msgspec 时编解码走 msgspec，否则走标准库 json，输出第一行会注明。
+
+用法：
+    python eval/records_bench.py --records 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import records
+from tools.records import BudgetRecord
+
+CATEGORIES = ["餐饮", "交通出行", "学习用品", "休闲娱乐", "日用品", "饮品"]
+NOTES = ["食堂午饭", "地铁", "打印资料", "看电影", "洗发水", "奶茶", "晚饭", ""]
+
+
+def make_raw(n: int, rng: random.Random):
+    return [{
+        "id": i,
+        "type": "income" if rng.random() < 0.05 else "expense",
+        "amount": float(rng.randint(300, 12000)) / 100,
+        "category": rng.choice(CATEGORIES),
+        "note": rng.choice(NOTES),
+        "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "created_at": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+    } for i in range(1, n + 1)]
+
+
+def best_of(fn, repeat: int):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def measure_memory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="记录对象与 dict 的编解码速度和内存对比")
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3, help="每项测量重复几次取最快")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    n = args.records
+    raw = make_raw(n, random.Random(args.seed))
+    old_text = json.dumps({"monthly_budget": 1500, "records": raw}, ensure_ascii=False, indent=2)
+    print(f"编解码后端: {'msgspec' if records.msgspec is not None else '标准库 json（未安装 msgspec）'}，{n} 条账单")
+
+    t_old, _ = best_of(lambda: json.loads(old_text)["records"], args.repeat)
+    new_bytes = records.dumps_bytes({"monthly_budget": 1500, "records": raw})
+    t_new, decoded = best_of(
+        lambda: records.decode_list(BudgetRecord, records.loads(new_bytes)["records"], "bench"), args.repeat)
+    print(f"解码: dict {t_old * 1000:.0f}ms，记录对象（含校验）{t_new * 1000:.0f}ms")
+
+    t_old, _ = best_of(lambda: json.dumps({"records": raw}, ensure_ascii=False, indent=2), args.repeat)
+    t_new, _ = best_of(lambda: records.dumps_bytes({"records": decoded}), args.repeat)
+    t_file, file_data = best_of(lambda: records.file_bytes({"records": decoded}), args.repeat)
+    print(f"编码: json indent=2 {t_old * 1000:.0f}ms，dumps_bytes {t_new * 1000:.0f}ms，file_bytes {t_file * 1000:.0f}ms")
+    print(f"大小: 原先 {len(old_text.encode('utf-8')) / 1024:.0f}KB，紧凑 {len(new_bytes) / 1024:.0f}KB，"
+          f"数据文件 {len(file_data) / 1024:.0f}KB")
+
+    text = new_bytes.decode("utf-8")
+    dict_mem, dicts = measure_memory(lambda: json.loads(text)["records"])
+    del dicts
+    rec_mem, recs = measure_memory(
+        lambda: records.decode_list(BudgetRecord, json.loads(text)["records"], "bench"))
+    del recs
+    print(f"内存: dict {dict_mem / n:.0f}B/条，记录对象 {rec_mem / n:.0f}B/条（{rec_mem / dict_mem:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""测量提醒调度器在大量日程下的构建、增量更新和空闲开销
+
+在临时用户分区里写入 N 条日程（约 5% 为重复日程，结束后删除），然后：
+1. 全量构建堆的耗时；
+2. 逐条修改日程后，按变更流增量更新的耗时；
+3. 空闲运行若干秒的 CPU 占用，对比“每个检查间隔重新读取并扫描 schedule.json”的朴素做法；
+4. 一次处理未来 24 小时内到期的提醒的耗时。
+
+用法：
+    python eval/reminder_bench.py --items 100000 --idle 5
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import schedule_cli
+from tools.reminders import ReminderScheduler
+from tools.userdata import use_user, user_dir
+
+EVENTS = ["社团例会", "小组讨论", "图书馆自习", "健身", "家教", "实验报告"]
+
+
+def seed(items: int, rng: random.Random):
+    today = datetime.now()
+    data = []
+    for i in range(1, items + 1):
+        day = (today + timedelta(days=rng.randint(-30, 365))).strftime("%Y-%m-%d")
+        item = {"id": i, "date": day, "time": f"{rng.randint(7, 21):02d}:{rng.choice(['00', '30'])}",
+                "event": rng.choice(EVENTS), "duration": 60}
+        if rng.random() < 0.05:
+            item["repeat"] = {"freq": "weekly", "interval": rng.choice([1, 2])}
+        data.append(item)
+    schedule_cli.save_data(data)
+
+
+def naive_scan(lead: timedelta) -> int:
+    """朴素做法：每次检查都读入整个文件，找出接下来一个检查间隔内要提醒的日程"""
+    now = datetime.now()
+    due = 0
+    for item in schedule_cli.load_data():
+        try:
+            start = datetime.strptime(f"{item['date']} {item['time']}", "%Y-%m-%d %H:%M")
+        except (KeyError, ValueError):
+            continue
+        if now <= start - lead < now + timedelta(minutes=1):
+            due += 1
+    return due
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提醒调度器的开销测量")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--updates", type=int, default=20, help="修改多少条日程来测量增量更新")
+    parser.add_argument("--idle", type=float, default=5, help="空闲运行多少秒来测量 CPU 占用")
+    parser.add_argument("--interval", type=float, default=2, help="检查间隔（秒）")
+    parser.add_argument("--user", default="bench_reminders")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if user_dir(args.user).exists():
+        sys.exit(f"用户分区 {args.user} 已存在，为避免改动已有数据请换一个 --user")
+    rng = random.Random(args.seed)
+    try:
+        with use_user(args.user):
+            seed(args.items, rng)
+        scheduler = ReminderScheduler(args.user, sinks=[], check_interval=args.interval)
+
+        t0 = time.perf_counter()
+        scheduler.load()
+        print(f"全量构建: {args.items} 条日程 {(time.perf_counter() - t0) * 1000:.0f}ms，"
+              f"堆中 {scheduler.stats()['heap']} 项（已过去的一次性日程不入堆）")
+
+        with use_user(args.user):
+            ids = rng.sample(range(1, args.items + 1), args.updates)
+            for i in ids:
+                schedule_cli.update_schedule(i, time="23:00")
+        t0 = time.perf_counter()
+        scheduler.refresh()
+        print(f"增量更新: {scheduler.stats()['applied']} 条变更 {(time.perf_counter() - t0) * 1000:.2f}ms")
+
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        deadline = wall0 + args.idle
+        while time.perf_counter() < deadline:
+            time.sleep(min(scheduler.step(), max(0.0, deadline - time.perf_counter())))
+        cpu = time.process_time() - cpu0
+        wall = time.perf_counter() - wall0
+        print(f"空闲 {wall:.1f}s: 调度器 CPU {cpu * 1000:.1f}ms（{cpu / wall:.2%}）")
+
+        with use_user(args.user):
+            t0 = time.perf_counter()
+            naive_scan(scheduler.lead)
+            scan = time.perf_counter() - t0
+        print(f"朴素重扫: 每次 {scan * 1000:.0f}ms，每 {args.interval:g}s 一次约占 {scan / args.interval:.1%} CPU")
+
+        t0 = time.perf_counter()
+        fired = scheduler.due(time.time() + 86400)
+        print(f"未来 24 小时到期 {len(fired)} 条提醒，出堆耗时 {(time.perf_counter() - t0) * 1000:.1f}ms")
+    finally:
+        shutil.rmtree(user_dir(args.user), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
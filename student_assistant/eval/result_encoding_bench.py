@@ -0,0 +1,102 @@
+"""测量工具结果的紧凑编码相对原样 JSON 节省的 token
+
+用真实的工具 CLI 产生结果：默认在临时用户分区里写入一批账单和日程（结束后删除），
+也可以用 --user 指向已有用户、--no-seed 直接测量现有数据。每个调用分别用
+json.dumps 和 ResultEncoder 编码，按与 Gemini 桩服务相同的方法估算 token。
+
+用法：
+    python eval/result_encoding_bench.py --records 200
+    python eval/result_encoding_bench.py --user default --no-seed
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.result_format import ResultEncoder
+from agent.tool_executor import ToolExecutor
+from gemini_stub_server import estimate_tokens
+from tools.userdata import user_dir
+
+CATEGORIES = ["餐饮", "交通出行", "学习用品", "休闲娱乐", "日用品", "饮品"]
+NOTES = ["食堂午饭", "地铁", "打印资料", "看电影", "洗发水", "奶茶", "晚饭", ""]
+EVENTS = ["社团例会", "小组讨论", "图书馆自习", "健身", "家教", "实验报告"]
+
+
+def seed(executor: ToolExecutor, records: int, rng: random.Random):
+    ops = []
+    for _ in range(records):
+        note = rng.choice(NOTES)
+        op = f"add --amount {rng.randint(3, 120)} --category {rng.choice(CATEGORIES)}"
+        ops.append(op + (f" --note {note}" if note else ""))
+    executor.execute_batch("budget", ops)
+    today = datetime.now()
+    ops = []
+    for i in range(max(10, records // 10)):
+        day = (today + timedelta(days=rng.randint(0, 13))).strftime("%Y-%m-%d")
+        ops.append(f"add --date {day} --time {rng.randint(8, 21):02d}:{rng.choice(['00', '30'])} "
+                   f"--event {rng.choice(EVENTS)} --duration {rng.choice([30, 60, 90, 120])}")
+    executor.execute_batch("schedule", ops)
+
+
+def calls():
+    today = datetime.now()
+    end = (today + timedelta(days=13)).strftime("%Y-%m-%d")
+    return [
+        ("budget", "list"),
+        ("budget", f"list --month {today.strftime('%Y-%m')}"),
+        ("budget", "stats"),
+        ("budget", "balance"),
+        ("schedule", "week"),
+        ("schedule", f"range --start {today.strftime('%Y-%m-%d')} --end {end}"),
+        ("course", "query --weekday 周三"),
+        ("course", "free --date today"),
+        ("weather", "query --date tomorrow"),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工具结果编码的 token 对比")
+    parser.add_argument("--records", type=int, default=200, help="写入的账单条数（日程为其 1/10）")
+    parser.add_argument("--max-rows", type=int, default=20, help="表格最多显示的行数")
+    parser.add_argument("--user", default="bench_encoding", help="在哪个用户分区里测量")
+    parser.add_argument("--no-seed", action="store_true", help="不写入数据，直接测量现有数据")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    executor = ToolExecutor(user_id=args.user)
+    created = not args.no_seed and not user_dir(args.user).exists()
+    if not args.no_seed:
+        if not created:
+            sys.exit(f"用户分区 {args.user} 已存在，为避免改动已有数据请换一个 --user 或加 --no-seed")
+        seed(executor, args.records, random.Random(args.seed))
+    encoder = ResultEncoder(max_rows=args.max_rows)
+    full_encoder = ResultEncoder(max_rows=10 ** 9)
+    json_encoder = ResultEncoder(mode="json")
+    total_json = total_full = total_table = 0
+    try:
+        # “表格”只换编码不截断；“截断后”再加上行数上限
+        print(f"{'调用':<52}{'JSON':>8}{'表格':>8}{'截断后':>8}{'减少':>8}")
+        for tool, call_args in calls():
+            result = executor.execute(tool, call_args)
+            before = estimate_tokens(json_encoder.encode(tool, result))
+            full = estimate_tokens(full_encoder.encode(tool, result))
+            after = estimate_tokens(encoder.encode(tool, result))
+            total_json += before
+            total_full += full
+            total_table += after
+            print(f"{tool + ' ' + call_args:<52}{before:>8}{full:>8}{after:>8}{1 - after / before:>8.0%}")
+        print(f"{'合计':<52}{total_json:>8}{total_full:>8}{total_table:>8}{1 - total_table / total_json:>8.0%}")
+        print(f"只换编码减少 {1 - total_full / total_json:.0%}，加上 {args.max_rows} 行上限后减少 "
+              f"{1 - total_table / total_json:.0%}")
+    finally:
+        if created:
+            shutil.rmtree(user_dir(args.user), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
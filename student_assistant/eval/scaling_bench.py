@@ -0,0 +1,248 @@
+"""规模基准：数据量从小到大时，每个 CLI 子命令和每个网页路由的耗时如何增长
+
+对每个规模 N 用 eval/datagen.py 生成一个临时用户（账单、日程、记忆各 N 条，课程 N/100 条），然后：
+- CLI：在全新的子进程里运行每个子命令若干次取最小值（子进程耗时的噪声只会往上加），
+  再减去该工具不带子命令时的启动耗时，得到真正花在数据上的时间；增删改按 add → update → delete 串起来，数据量基本不变；
+- 网页：用 TestClient 在进程内请求各个页面和接口，分别记录首次请求（冷缓存）和之后的中位数。
+最后按 log-log 拟合每一项的增长指数（约 1 为线性，约 0 为与数据量无关），
+结果追加到 data/scaling_bench.jsonl，与最近几次同规模的记录比较，变慢明显时标记为回归。
+
+用法：
+    python eval/scaling_bench.py                          # 默认规模 1000,10000,100000
+    python eval/scaling_bench.py --sizes 1000,5000 --runs 3 --only schedule
+    python eval/scaling_bench.py --check                  # 有回归时以非零状态退出
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+os.chdir(BASE_DIR)  # 模板目录等按项目根目录的相对路径解析
+
+from config import DATA_DIR, ENV_STAMP_VAR
+from eval.datagen import generate
+from eval.startup_bench import _git_commit, load_history
+from tools.userdata import user_dir
+
+HISTORY_FILE = DATA_DIR / "scaling_bench.jsonl"
+# 与 startup_bench 相同的回归判定：慢 20% 且超过 5ms
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_MS = 5.0
+
+_today = datetime.now()
+TODAY = _today.strftime("%Y-%m-%d")
+NEXT_WEEK = (_today + timedelta(days=7)).strftime("%Y-%m-%d")
+MONTH = _today.strftime("%Y-%m")
+
+# 只读子命令: (工具, 名称, 参数)
+CLI_QUERIES = [
+    ("budget", "balance", ["balance"]),
+    ("budget", "list", ["list", "--month", MONTH]),
+    ("budget", "stats", ["stats"]),
+    ("budget", "report", ["report"]),
+    ("schedule", "query", ["query", "--date", TODAY]),
+    ("schedule", "range", ["range", "--start", TODAY, "--end", NEXT_WEEK]),
+    ("schedule", "week", ["week"]),
+    ("schedule", "conflicts", ["conflicts", "--date", TODAY, "--time", "10:00"]),
+    ("schedule", "free", ["free", "--duration", "90"]),
+    ("course", "query", ["query", "--date", TODAY]),
+    ("course", "now", ["now"]),
+    ("course", "free", ["free"]),
+    ("course", "export-ics", ["export-ics", "--output", "{tmp}/bench.ics"]),
+    ("memory", "query", ["query", "--keyword", "图书馆"]),
+]
+# 写操作链：第一步的返回里取出 id，后面的步骤用 {id} 引用
+CLI_CHAINS = [
+    ("budget", [("add", ["add", "--amount", "12.5", "--category", "餐饮", "--note", "基准"]),
+                ("update", ["update", "--id", "{id}", "--amount", "13"]),
+                ("set-budget", ["set-budget", "--amount", "1500"]),
+                ("delete", ["delete", "--id", "{id}"])]),
+    ("schedule", [("add", ["add", "--date", TODAY, "--time", "23:00", "--event", "基准", "--repeat", "weekly"]),
+                  ("skip", ["skip", "--id", "{id}", "--date", NEXT_WEEK]),
+                  ("update", ["update", "--id", "{id}", "--event", "基准2"]),
+                  ("delete", ["delete", "--id", "{id}"])]),
+    ("memory", [("save", ["save", "--role", "user", "--content", "基准测试"])]),
+]
+WEB_ROUTES = ["/", "/budget/", "/budget/stats", "/schedule/", "/schedule/week",
+              f"/schedule/range?start={TODAY}&end={NEXT_WEEK}", f"/schedule/free?date={TODAY}",
+              "/course/", "/course/now", "/course/free"]
+
+
+def _cli(tool: str, args, env: dict):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, f"tools/{tool}_cli.py", *args], cwd=BASE_DIR, env=env,
+                          capture_output=True, text=True)
+    ms = (time.perf_counter() - t0) * 1000
+    try:
+        out = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, json.JSONDecodeError):
+        out = {}
+    return ms, out
+
+
+def _cli_env(user_id: str) -> dict:
+    env = os.environ.copy()
+    env.pop(ENV_STAMP_VAR, None)
+    env["STUDENT_USER"] = user_id
+    return env
+
+
+def measure_startup(runs: int) -> dict:
+    """各工具不带子命令（只打印帮助）的耗时，即解释器启动加导入，与数据量无关"""
+    env = _cli_env("bench_scale_startup")
+    tools = sorted({t for t, _, _ in CLI_QUERIES} | {t for t, _ in CLI_CHAINS})
+    return {t: min(_cli(t, [], env)[0] for _ in range(max(runs, 5))) for t in tools}
+
+
+def bench_cli(user_id: str, runs: int, only: str, tmp: str, startup: dict) -> dict:
+    env = _cli_env(user_id)
+    results = {}
+
+    def record(name, times, tool):
+        results[name] = round(max(0.0, min(times) - startup[tool]), 2)
+
+    for tool, name, args in CLI_QUERIES:
+        key = f"cli {tool} {name}"
+        if only and only not in key:
+            continue
+        args = [a.format(tmp=tmp) for a in args]
+        _cli(tool, args, env)  # 预热：建立索引缓存等
+        record(key, [_cli(tool, args, env)[0] for _ in range(runs)], tool)
+    for tool, steps in CLI_CHAINS:
+        if only and only not in f"cli {tool}":
+            continue
+        times = {name: [] for name, _ in steps}
+        for _ in range(runs):
+            new_id = None
+            for name, args in steps:
+                ms, out = _cli(tool, [a.format(id=new_id) for a in args], env)
+                times[name].append(ms)
+                new_id = out.get("id", new_id)
+        for name, values in times.items():
+            record(f"cli {tool} {name}", values, tool)
+    return results
+
+
+def bench_web(user_id: str, runs: int, only: str) -> dict:
+    # 测试进程相当于可信代理，直接用 X-User-Id 选择用户，不走登录
+    os.environ["TRUST_USER_HEADER"] = "true"
+    from fastapi.testclient import TestClient
+    from web.app import app
+
+    client = TestClient(app)
+    headers = {"x-user-id": user_id}
+    results = {}
+    for route in WEB_ROUTES:
+        key = f"web {route.split('?')[0]}"
+        if only and only not in key:
+            continue
+        t0 = time.perf_counter()
+        client.get(route, headers=headers)
+        cold = (time.perf_counter() - t0) * 1000
+        warm = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            client.get(route, headers=headers)
+            warm.append((time.perf_counter() - t0) * 1000)
+        results[key] = round(statistics.median(warm), 2)
+        results[f"{key} (首次)"] = round(cold, 2)
+    return results
+
+
+def growth_exponent(sizes, values):
+    """对 log(耗时) ~ log(规模) 做最小二乘，返回斜率；耗时太小（噪声为主）时返回 None"""
+    points = [(math.log(n), math.log(v)) for n, v in zip(sizes, values) if v and v >= 0.5]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    den = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / den if den else None
+
+
+def baseline_for(history, size: int, name: str, window: int = 5):
+    values = [r["results"][str(size)][name] for r in history[-window:]
+              if name in r.get("results", {}).get(str(size), {})]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据规模基准")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的数据规模")
+    parser.add_argument("--runs", type=int, default=5, help="每项测量次数")
+    parser.add_argument("--only", help="只测名称包含该字符串的项，如 schedule、web")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="保留生成的临时用户数据")
+    parser.add_argument("--history", default=str(HISTORY_FILE), help="历史记录文件")
+    parser.add_argument("--no-record", action="store_true", help="只测量，不写入历史")
+    parser.add_argument("--check", action="store_true", help="有回归时以状态码 1 退出")
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+    history_path = Path(args.history)
+    history = load_history(history_path)
+    results = {}
+    regressions = []
+
+    startup = measure_startup(args.runs)
+    print("CLI 启动耗时：" + "，".join(f"{t} {ms:.0f}ms" for t, ms in startup.items()), flush=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            user_id = f"bench_scale_{n}"
+            shutil.rmtree(user_dir(user_id), ignore_errors=True)
+            t0 = time.perf_counter()
+            generate(user_id, budget=n, schedule=n, courses=max(10, n // 100), memories=n, seed=args.seed)
+            print(f"规模 {n}: 生成数据 {time.perf_counter() - t0:.1f}s", flush=True)
+            try:
+                results[n] = {**bench_cli(user_id, args.runs, args.only, tmp, startup),
+                              **bench_web(user_id, args.runs, args.only)}
+            finally:
+                if not args.keep:
+                    shutil.rmtree(user_dir(user_id), ignore_errors=True)
+
+    names = list(results[sizes[0]])
+    print(f"\n{'项目（毫秒）':<32}" + "".join(f"{n:>10}" for n in sizes) + f"{'增长指数':>10}")
+    for name in names:
+        values = [results[n].get(name) for n in sizes]
+        exp = growth_exponent(sizes, values)
+        cells = ""
+        for n, v in zip(sizes, values):
+            base = baseline_for(history, n, name)
+            flag = ""
+            if base and v > base * REGRESSION_RATIO and v - base > REGRESSION_MIN_MS:
+                regressions.append(f"{name} @ {n}")
+                flag = "⚠"
+            cells += f"{v:>9.1f}{flag or ' '}"
+        print(f"{name:<32}{cells}{(f'{exp:.2f}' if exp is not None else '-'):>10}")
+
+    if not args.no_record:
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "results": {str(n): r for n, r in results.items()},
+        }
+        with open(history_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\n已记录到 {history_path}（共 {len(history) + 1} 次）")
+
+    if regressions:
+        print(f"\n变慢: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""快照基准：增量快照相对整份复制省下多少时间和空间，恢复到某个时间点要多久
+
+用 eval/datagen.py 生成一个临时用户，在临时目录里建快照库（不碰 data/snapshots），依次测量：
+- 首次快照：所有文件都要切块、压缩、写入；
+- 无变化：只 stat 一遍文件；
+- 改一条账单、追加一条日程：只有变化的块和分组需要写入；
+- 恢复：把账单恢复到首次快照；
+并与每次把数据文件整份复制一遍（zip 备份的做法）的耗时和大小对比。
+
+用法：
+    python eval/snapshot_bench.py
+    python eval/snapshot_bench.py --size 100000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import BUDGET_FILE, DATA_DIR
+from eval.datagen import generate
+from tools import budget_cli, schedule_cli
+from tools.snapshot import SnapshotStore
+from tools.userdata import use_user, user_dir, user_path
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - t0) * 1000, result
+
+
+def full_copy(src: Path, dst: Path) -> int:
+    shutil.copytree(src, dst)
+    return sum(p.stat().st_size for p in dst.iterdir())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量快照基准")
+    parser.add_argument("--size", type=int, default=20000, help="账单、日程、记忆各多少条")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    user_id = "bench_snapshot"
+    shutil.rmtree(user_dir(user_id), ignore_errors=True)
+    generate(user_id, budget=args.size, schedule=args.size, courses=max(10, args.size // 100),
+             memories=args.size, seed=args.seed)
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        store = SnapshotStore(root=tmp / "snapshots")
+        copy_ms, copy_bytes = timed(full_copy, user_dir(user_id), tmp / "copy")
+        rows = [("整份复制", copy_ms, copy_bytes, copy_bytes)]
+
+        def snap(name):
+            ms, r = timed(store.take, force=False)
+            rows.append((name, ms, r.get("new_bytes", 0), r.get("read_bytes", 0)))
+            return r
+
+        first = snap("首次快照")["id"]
+        snap("无变化")
+        with use_user(user_id):
+            data = budget_cli.load_data()
+            data["records"][len(data["records"]) // 2]["amount"] += 1
+            budget_cli.save_data(data)
+        snap("改一条账单")
+        with use_user(user_id):
+            items = schedule_cli.load_data()
+            items.append({**items[-1], "id": items[-1]["id"] + 1, "event": "基准"})
+            schedule_cli.save_data(items)
+        snap("追加一条日程")
+
+        with use_user(user_id):
+            rel = user_path(BUDGET_FILE).relative_to(DATA_DIR).as_posix()
+        ms, r = timed(store.restore, first, [rel])
+        rows.append(("恢复账单", ms, 0, 0))
+
+        print(f"{'操作':<12}{'耗时(ms)':>10}{'写入(KB)':>12}{'读取(KB)':>12}")
+        for name, ms, written, read in rows:
+            print(f"{name:<12}{ms:>10.1f}{written / 1024:>12.1f}{read / 1024:>12.1f}")
+        stats = store.stats()
+        print(f"\n快照库：{stats['snapshots']} 个快照，{stats['objects']} 个对象，共 {stats['object_bytes'] / 1024:.0f}KB；"
+              f"同样次数的整份复制约 {copy_bytes * stats['snapshots'] / 1024:.0f}KB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(user_dir(user_id), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
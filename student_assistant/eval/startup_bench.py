@@ -0,0 +1,187 @@
+"""冷启动基准：测量 main.py、各个 tools/*_cli.py 和 web/app.py 的启动耗时
+
+每个入口在全新的解释器里用 `-X importtime` 运行多次（脚本带 --help，只走到解析参数为止；
+web/app.py 只导入不启动服务），记录墙钟时间中位数和导入耗时最多的模块。
+结果追加到 data/startup_bench.jsonl，与最近几次记录的中位数比较，变慢明显时标记为回归。
+
+用法：
+    python eval/startup_bench.py                 # 测量并记录
+    python eval/startup_bench.py --runs 10 --top 5
+    python eval/startup_bench.py --check         # 有回归时以非零状态退出（可放进 CI）
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+
+from config import DATA_DIR, ENV_STAMP_VAR
+
+HISTORY_FILE = DATA_DIR / "startup_bench.jsonl"
+# 比最近记录的中位数慢 20% 且超过 5ms 才算回归，避免噪声误报
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_MS = 5.0
+# 解释器自身启动时导入的模块（含 site 里 .pth 带进来的包），与项目代码无关
+STARTUP_MODULES = {"site", "encodings", "_io", "marshal", "posix", "_frozen_importlib_external",
+                   "time", "zipimport", "_codecs", "codecs", "io", "abc", "stat", "genericpath",
+                   "posixpath", "os", "_sitebuiltins", "encodings.utf_8"}
+
+
+def _script_snippet(rel_path: str) -> str:
+    return (f"import runpy, sys; sys.argv = [{rel_path!r}, '--help']; "
+            f"runpy.run_path({rel_path!r}, run_name='__main__')")
+
+
+def discover_targets():
+    targets = {"main.py": _script_snippet("main.py")}
+    for cli in sorted((BASE_DIR / "tools").glob("*_cli.py")):
+        rel = f"tools/{cli.name}"
+        targets[rel] = _script_snippet(rel)
+    targets["web/app.py"] = "import sys; sys.path.insert(0, '.'); import web.app"
+    return targets
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 [(模块, 自身微秒, 累计微秒, 嵌套深度)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            head, cumulative, name = line.split("|", 2)
+            self_us = head.split(":", 1)[1]
+            # 模块名前每多两个空格表示多嵌套一层
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            rows.append((name.strip(), int(self_us), int(cumulative), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_once(snippet: str, env: dict):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", snippet], cwd=BASE_DIR, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    return wall_ms, proc.returncode, parse_importtime(proc.stderr)
+
+
+def measure(name: str, snippet: str, runs: int, top: int) -> dict:
+    env = os.environ.copy()
+    # 模拟真正的冷启动：不继承父进程已经解析好的 .env
+    env.pop(ENV_STAMP_VAR, None)
+    run_once(snippet, env)  # 预热一次，让 __pycache__ 就绪
+    walls, imports = [], []
+    rows = []
+    returncode = 0
+    for _ in range(runs):
+        wall_ms, returncode, rows = run_once(snippet, env)
+        walls.append(wall_ms)
+        imports.append(sum(r[1] for r in rows) / 1000)
+    # 按累计耗时列出最慢的顶层导入（由入口直接触发的那一层）
+    heaviest = sorted((r for r in rows if r[3] == 0 and r[0] not in STARTUP_MODULES),
+                      key=lambda r: r[2], reverse=True)[:top]
+    return {
+        "wall_ms": round(statistics.median(walls), 2),
+        "wall_min_ms": round(min(walls), 2),
+        "import_ms": round(statistics.median(imports), 2),
+        "modules": len(rows),
+        "returncode": returncode,
+        "top": [{"module": m, "self_ms": round(s / 1000, 2), "cumulative_ms": round(c / 1000, 2)}
+                for m, s, c, _ in heaviest],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_history(path: Path):
+    if not path.exists():
+        return []
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def baseline_for(history, name: str, window: int = 5):
+    values = [r["results"][name]["wall_ms"] for r in history[-window:] if name in r.get("results", {})]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口冷启动基准")
+    parser.add_argument("--runs", type=int, default=5, help="每个入口运行次数")
+    parser.add_argument("--top", type=int, default=3, help="每个入口列出最慢的几个导入")
+    parser.add_argument("--only", help="只测包含该字符串的入口")
+    parser.add_argument("--history", default=str(HISTORY_FILE), help="历史记录文件")
+    parser.add_argument("--no-record", action="store_true", help="只测量，不写入历史")
+    parser.add_argument("--check", action="store_true", help="有回归时以状态码 1 退出")
+    args = parser.parse_args()
+
+    history_path = Path(args.history)
+    history = load_history(history_path)
+    results = {}
+    regressions = []
+
+    print(f"{'入口':<24}{'墙钟中位数':>12}{'导入':>10}{'基线':>10}{'变化':>10}")
+    for name, snippet in discover_targets().items():
+        if args.only and args.only not in name:
+            continue
+        r = measure(name, snippet, args.runs, args.top)
+        results[name] = r
+        base = baseline_for(history, name)
+        delta = ""
+        if base:
+            change = r["wall_ms"] - base
+            delta = f"{change:+.1f}ms"
+            if r["wall_ms"] > base * REGRESSION_RATIO and change > REGRESSION_MIN_MS:
+                regressions.append(name)
+                delta += " ⚠"
+        base_str = f"{base:.1f}ms" if base else "-"
+        print(f"{name:<24}{r['wall_ms']:>10.1f}ms{r['import_ms']:>8.1f}ms{base_str:>10}{delta:>10}")
+        for t in r["top"]:
+            print(f"    {t['module']:<40} 累计 {t['cumulative_ms']:.1f}ms")
+        if r["returncode"] not in (0,):
+            print(f"    ⚠ 退出码 {r['returncode']}")
+
+    if not args.no_record and results:
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "results": {k: {"wall_ms": v["wall_ms"], "import_ms": v["import_ms"], "modules": v["modules"]}
+                        for k, v in results.items()},
+        }
+        with open(history_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\n已记录到 {history_path}（共 {len(history) + 1} 次）")
+
+    if regressions:
+        print(f"\n启动变慢: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
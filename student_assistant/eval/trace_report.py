@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+from collections import defaultdict
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+def load_spans(path):
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(spans):
+    """按 span 名称汇总耗时，并统计每轮对话内各环节的耗时占比"""
+    by_name = defaultdict(list)
+    for s in spans:
+        by_name[s["name"]].append(s["duration_ms"])
+
+    print("=" * 72)
+    print(f"{'span':<22}{'count':>8}{'total(s)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+    print("-" * 72)
+    for name in sorted(by_name, key=lambda n: -sum(by_name[n])):
+        d = by_name[name]
+        print(f"{name:<22}{len(d):>8}{sum(d) / 1000:>12.2f}"
+              f"{percentile(d, 50):>10.1f}{percentile(d, 95):>10.1f}{max(d):>10.1f}")
+
+    # 每轮对话（agent.turn）拆解：LLM / 工具 / 其它
+    turns = {s["trace_id"]: s for s in spans if s["name"] == "agent.turn"}
+    if not turns:
+        return
+    llm_ms = defaultdict(float)
+    tool_ms = defaultdict(float)
+    spawn_ms = defaultdict(float)
+    for s in spans:
+        if s["trace_id"] not in turns:
+            continue
+        if s["name"] == "llm.chat":
+            llm_ms[s["trace_id"]] += s["duration_ms"]
+        elif s["name"] == "tool.execute":
+            tool_ms[s["trace_id"]] += s["duration_ms"]
+            spawn_ms[s["trace_id"]] += s["attrs"].get("spawn_ms", 0)
+
+    total = sum(t["duration_ms"] for t in turns.values())
+    llm_total = sum(llm_ms.values())
+    tool_total = sum(tool_ms.values())
+    print("=" * 72)
+    print(f"对话轮数: {len(turns)}，平均每轮 {total / len(turns) / 1000:.2f}s")
+    if total:
+        print(f"  LLM 调用: {llm_total / 1000:.2f}s ({llm_total / total * 100:.1f}%)")
+        print(f"  工具调用: {tool_total / 1000:.2f}s ({tool_total / total * 100:.1f}%)，"
+              f"其中进程启动 {sum(spawn_ms.values()) / 1000:.2f}s")
+        other = total - llm_total - tool_total
+        print(f"  其它:     {other / 1000:.2f}s ({other / total * 100:.1f}%)")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else str(config.TRACE_FILE)
+    if not os.path.exists(path):
+        print(f"未找到追踪文件: {path}（请设置 TRACE_ENABLED=true 后运行 Agent）")
+        sys.exit(1)
+    summarize(load_spans(path))
@@ -0,0 +1,77 @@
+"""天气预报桩服务：离线环境下给 HttpProvider 用
+
+用法：
+    python eval/weather_stub_server.py --port 8765 --delay 0.2
+    WEATHER_PROVIDER=http WEATHER_API_URL=http://127.0.0.1:8765 python main.py
+
+GET /forecast?location=..&date=..  返回与 StubProvider 相同的确定性数据
+GET /stats                         返回收到的预报请求数，用来验证缓存与请求合并的效果
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.weather_provider import StubProvider
+
+_provider = StubProvider()
+_lock = threading.Lock()
+_requests = {"forecast": 0}
+
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with _lock:
+                return self._send(200, dict(_requests))
+        if url.path != "/forecast":
+            return self._send(404, {"error": "not found"})
+        query = parse_qs(url.query)
+        location = query.get("location", [""])[0]
+        date = query.get("date", [""])[0]
+        if not location or not date:
+            return self._send(400, {"error": "需要 location 和 date 参数"})
+        with _lock:
+            _requests["forecast"] += 1
+        if self.delay:
+            time.sleep(self.delay)
+        self._send(200, _provider.fetch(location, date))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天气预报桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="每次预报请求的模拟延迟（秒）")
+    args = parser.parse_args()
+    Handler.delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"天气桩服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""提醒 webhook 桩服务：离线环境下接收 WebhookSink 的投递
+
+用法：
+    python eval/webhook_stub_server.py --port 8766
+    python tools/reminders.py --sinks console,webhook --webhook-url http://127.0.0.1:8766/hook
+
+POST /hook       记录收到的提醒（JSON）并打印一行
+GET  /received   返回收到的全部提醒
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_lock = threading.Lock()
+_received = []
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/hook":
+            return self._send(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "请求体不是 JSON"})
+        with _lock:
+            _received.append(payload)
+        print(f"[webhook] {payload.get('user')} {payload.get('start')} {payload.get('title')}", flush=True)
+        self._send(200, {"ok": True})
+
+    def do_GET(self):
+        if self.path != "/received":
+            return self._send(404, {"error": "not found"})
+        with _lock:
+            self._send(200, {"count": len(_received), "data": list(_received)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提醒 webhook 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"webhook 桩服务已启动: http://{args.host}:{args.port}/hook")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
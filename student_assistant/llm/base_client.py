@@ -1,13 +1,29 @@
+class LLMError(Exception):
+    """LLM 调用失败（网络错误、超时、HTTP 错误等），上层可据此重试或切换后端"""
+
+
+class RateLimitError(LLMError):
+    """超出 API 配额（HTTP 429）或在客户端排队超时；retry_after 为建议的重试等待秒数（未知时为 None）"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class BaseLLMClient:
     """LLM客户端基类，定义统一接口"""
-    def chat(self, messages: list[dict], system_prompt: str = None) -> str:
+    def chat(self, messages: list[dict], system_prompt: str = None, system_context: str = None) -> str:
         """发送消息并获取回复
         
         Args:
             messages: 对话历史，格式 [{"role": "user/assistant", "content": "..."}]
-            system_prompt: 系统提示词
+            system_prompt: 系统提示词（静态部分，可被服务端缓存）
+            system_context: 每次请求都会变化的系统信息（如当前日期时间），不参与缓存
             
         Returns:
             str: LLM的回复内容
+
+        Raises:
+            LLMError: 请求失败
         """
         raise NotImplementedError
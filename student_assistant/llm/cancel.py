@@ -0,0 +1,105 @@
+"""可取消的 LLM 请求尝试
+
+RouterClient 为每次尝试（主请求、对冲、故障转移）创建一个 CancelScope，放进该尝试线程的上下文。
+GeminiClient 用 scope.session() 发请求：这个会话建立的连接都登记在 scope 上，落选时 cancel()
+直接关闭这些 socket，阻塞在等响应上的请求立即失败，不再占着连接；RateLimitedClient 看到
+scope 已取消也不再排队、重试，不再消耗 RPM/TPM 配额。
+"""
+import socket
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+from .base_client import LLMError
+
+
+class CancelledError(LLMError):
+    """请求所属的尝试已被取消（例如对冲时另一个请求先返回了）"""
+
+
+class CancelScope:
+    def __init__(self):
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._conns = set()
+        self._session = None
+
+    def check(self):
+        if self.cancelled:
+            raise CancelledError("LLM 请求已取消")
+
+    def session(self):
+        """本次尝试专用的 requests 会话；已取消时抛出 CancelledError"""
+        with self._lock:
+            self.check()
+            if self._session is None:
+                self._session = _tracked_session(self)
+            return self._session
+
+    def _register(self, conn):
+        with self._lock:
+            if not self.cancelled:
+                self._conns.add(conn)
+                return
+        _shutdown(conn)
+
+    def cancel(self):
+        """取消本次尝试：关闭它打开的连接；请求已经完成时只是释放会话"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            conns, self._conns = self._conns, set()
+            session, self._session = self._session, None
+        for conn in conns:
+            _shutdown(conn)
+        if session is not None:
+            session.close()
+
+
+def _shutdown(conn):
+    # 只 shutdown 不 close：另一个线程可能还阻塞在这个 socket 上，由它在出错后自行关闭，避免文件描述符被复用
+    sock = getattr(conn, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _tracked_session(scope: CancelScope):
+    """连接建立后登记到 scope 上的 requests 会话"""
+    # requests 导入较慢（约 0.1s），推迟到第一次真正调用时
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def tracked(pool_cls):
+        class Connection(pool_cls.ConnectionCls):
+            def connect(self):
+                super().connect()
+                scope._register(self)
+
+        return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": Connection})
+
+    class Adapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": tracked(HTTPConnectionPool),
+                "https": tracked(HTTPSConnectionPool),
+            }
+
+    session = requests.Session()
+    adapter = Adapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# 当前线程所属的尝试，由 RouterClient 在启动尝试时设置；不经过 RouterClient 时为 None
+_scope: ContextVar[Optional[CancelScope]] = ContextVar("llm_cancel_scope", default=None)
+
+
+def current_scope() -> Optional[CancelScope]:
+    return _scope.get()
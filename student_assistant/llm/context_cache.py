@@ -0,0 +1,78 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class ContextCache:
+    """管理服务端缓存的静态系统提示（Gemini cachedContents）
+
+    同一段静态提示只创建一次缓存；剩余有效期不足 renew_margin 秒时续期，续期失败或服务端
+    报告缓存不存在时重新创建。创建失败（例如提示太短，达不到服务端的最小缓存长度）时，
+    这段提示在 retry_after 秒内不再尝试缓存，调用方改为随请求内联发送。
+    """
+
+    def __init__(self, create: Callable[[str, int], str], renew: Callable[[str, int], None],
+                 ttl: int = 3600, renew_margin: Optional[float] = None, retry_after: float = 600):
+        self._create = create
+        self._renew = renew
+        self.ttl = ttl
+        self.renew_margin = renew_margin if renew_margin is not None else min(300.0, ttl * 0.1)
+        self.retry_after = retry_after
+        self._entries: Dict[str, Dict] = {}  # 提示的哈希 -> {"name", "expires"} 或 {"failed_until"}
+        self._lock = threading.Lock()
+        self.creates = 0
+        self.renewals = 0
+        self.invalidations = 0
+        self.failures = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[str]:
+        """返回这段提示对应的缓存名；不能缓存时返回 None"""
+        key = self.key(text)
+        # 创建和续期都是网络请求，持锁期间其他线程等待同一结果，避免重复创建
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and "failed_until" in entry:
+                if now < entry["failed_until"]:
+                    return None
+                entry = None
+            if entry is not None and now < entry["expires"]:
+                if entry["expires"] - now > self.renew_margin:
+                    return entry["name"]
+                try:
+                    self._renew(entry["name"], self.ttl)
+                    entry["expires"] = time.monotonic() + self.ttl
+                    self.renewals += 1
+                    return entry["name"]
+                except Exception:
+                    pass  # 续期失败就重新创建
+            try:
+                name = self._create(text, self.ttl)
+            except Exception:
+                self.failures += 1
+                self._entries[key] = {"failed_until": now + self.retry_after}
+                return None
+            self.creates += 1
+            self._entries[key] = {"name": name, "expires": time.monotonic() + self.ttl}
+            return name
+
+    def invalidate(self, text: str):
+        """服务端报告缓存已失效（过期或被删除）时调用，下次 get 会重新创建"""
+        with self._lock:
+            if self._entries.pop(self.key(text), None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": sum(1 for e in self._entries.values() if "name" in e),
+                "creates": self.creates,
+                "renewals": self.renewals,
+                "invalidations": self.invalidations,
+                "failures": self.failures,
+            }
@@ -1,19 +1,118 @@
-import requests
 import json
-import time
-from .base_client import BaseLLMClient
+import threading
+from .base_client import BaseLLMClient, LLMError, RateLimitError
+from .cancel import current_scope
+from .context_cache import ContextCache
+from tracing import tracer
+
+def _retry_after(response):
+    """429 响应建议的重试秒数：优先 Retry-After 头，其次 Gemini 错误详情里的 RetryInfo.retryDelay（如 "12s"）"""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        details = response.json()["error"].get("details") or []
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    for detail in details:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if delay:
+            try:
+                return float(str(delay).rstrip("s"))
+            except ValueError:
+                continue
+    return None
+
+
+def _request_error(e) -> LLMError:
+    """把 requests 的异常转换成 LLMError；配额用尽（429）转换成 RateLimitError，上层据此排队重试"""
+    response = getattr(e, "response", None)
+    if response is not None and response.status_code == 429:
+        return RateLimitError(f"API请求超出配额: {response.text[:200]}", retry_after=_retry_after(response))
+    if response is not None and response.text:
+        return LLMError(f"API请求失败: {response.text[:500]}")
+    return LLMError(f"API请求失败: {str(e)}")
+
+
+def _cache_gone(response) -> bool:
+    """引用的 cachedContent 已失效：404/403，或错误信息提到 cachedContent 的 400；其他 400 是请求本身的问题"""
+    if response.status_code in (403, 404):
+        return True
+    return response.status_code == 400 and "cachedContent" in response.text
+
 
 class GeminiClient(BaseLLMClient):
     """Gemini API客户端实现"""
-    
-    def __init__(self, api_key: str, model: str = "gemini-1.5-flash"):
+
+    DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+    def __init__(self, api_key: str, model: str = "gemini-1.5-flash", base_url: str = None, timeout: float = 30,
+                 context_cache: bool = False, cache_ttl: int = 3600):
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta"
-    
-    def chat(self, messages: list[dict], system_prompt: str = None) -> str:
+        # base_url 可指向本地桩服务（eval/gemini_stub_server.py）做离线测试
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        # 可选：静态系统提示放进服务端缓存（cachedContents），每次请求只引用缓存名
+        self.cache = ContextCache(self._create_cache, self._renew_cache, ttl=cache_ttl) if context_cache else None
+        # 用量统计（来自响应的 usageMetadata）
+        self._usage_lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.request_bytes = 0
+        # 每个线程最近一次请求的用量，供限流器按实际 token 数修正配额
+        self._local = threading.local()
+
+    def _request(self, method: str, path: str, payload: dict = None, params: dict = None) -> dict:
+        # requests 导入较慢（约 0.1s），推迟到第一次真正调用时
+        import requests
+        url = f"{self.base_url}/{path}"
+        query = {"key": self.api_key, **(params or {})}
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        try:
+            response = requests.request(method, url, params=query, data=body,
+                                        headers={"Content-Type": "application/json"}, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            raise _request_error(e) from e
+
+    def _create_cache(self, text: str, ttl: int) -> str:
+        with tracer.span("llm.cache_create", model=self.model, chars=len(text)):
+            result = self._request("POST", "cachedContents", {
+                "model": f"models/{self.model}",
+                "systemInstruction": {"parts": [{"text": text}]},
+                "ttl": f"{ttl}s",
+            })
+            return result["name"]
+
+    def _renew_cache(self, name: str, ttl: int):
+        with tracer.span("llm.cache_renew", model=self.model):
+            self._request("PATCH", name, {"ttl": f"{ttl}s"}, params={"updateMask": "ttl"})
+
+    def _record_usage(self, usage: dict, span):
+        prompt = usage.get("promptTokenCount", 0)
+        cached = usage.get("cachedContentTokenCount", 0)
+        output = usage.get("candidatesTokenCount", 0)
+        span.set("prompt_tokens", prompt)
+        span.set("cached_tokens", cached)
+        self._local.usage = usage
+        with self._usage_lock:
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.cached_tokens += cached
+            self.output_tokens += output
+
+    def chat(self, messages: list[dict], system_prompt: str = None, system_context: str = None) -> str:
+        # requests 导入较慢（约 0.1s），推迟到第一次真正调用时
+        import requests
         url = f"{self.base_url}/models/{self.model}:generateContent?key={self.api_key}"
-        
+
         # 转换消息格式为Gemini格式
         contents = []
         for msg in messages:
@@ -23,33 +122,80 @@ class GeminiClient(BaseLLMClient):
                 "role": role,
                 "parts": [{"text": msg["content"]}]
             })
-        
-        payload = {"contents": contents}
-        
-        # Gemini的system instruction单独设置
-        if system_prompt:
-            payload["system_instruction"] = {
-                "parts": [{"text": system_prompt}]
+
+        self._local.usage = None
+        with tracer.span("llm.chat", model=self.model, messages=len(contents)) as span:
+            cache_name = self.cache.get(system_prompt) if self.cache is not None and system_prompt else None
+            for attempt in range(2):
+                payload = {"contents": contents}
+                if cache_name:
+                    # 静态提示已在服务端缓存；缓存内容不能再带 system_instruction，动态部分放在对话最前面
+                    payload["cachedContent"] = cache_name
+                    if system_context:
+                        payload["contents"] = [{"role": "user", "parts": [{"text": system_context}]}] + contents
+                else:
+                    # Gemini的system instruction单独设置
+                    instruction = "\n\n".join(p for p in (system_prompt, system_context) if p)
+                    if instruction:
+                        payload["system_instruction"] = {
+                            "parts": [{"text": instruction}]
+                        }
+                span.set("cached_content", bool(cache_name))
+                try:
+                    body = json.dumps(payload).encode("utf-8")
+                    span.set("request_bytes", len(body))
+                    with self._usage_lock:
+                        self.request_bytes += len(body)
+                    # 经 RouterClient 发出时用本次尝试的会话，落选时连接会被直接断开
+                    scope = current_scope()
+                    http = scope.session() if scope is not None else requests
+                    response = http.post(
+                        url, data=body, headers={"Content-Type": "application/json"}, timeout=self.timeout
+                    )
+                    span.set("status_code", response.status_code)
+                    span.set("response_bytes", len(response.content))
+                    if cache_name and attempt == 0 and _cache_gone(response):
+                        # 缓存过期或被删除：重新创建后重试一次
+                        span.set("cache_miss", True)
+                        self.cache.invalidate(system_prompt)
+                        cache_name = self.cache.get(system_prompt)
+                        continue
+                    response.raise_for_status()
+
+                    result = response.json()
+                    self._record_usage(result.get("usageMetadata") or {}, span)
+
+                    # 安全地提取内容
+                    if "candidates" in result and len(result["candidates"]) > 0:
+                        candidate = result["candidates"][0]
+                        span.set("finish_reason", candidate.get("finishReason"))
+                        if "content" in candidate and "parts" in candidate["content"]:
+                            return candidate["content"]["parts"][0]["text"]
+                        elif "finishReason" in candidate:
+                            return f"[API返回结束原因: {candidate['finishReason']}]"
+
+                    return f"[API返回格式异常: {json.dumps(result)}]"
+
+                except requests.exceptions.RequestException as e:
+                    span.set("error", type(e).__name__)
+                    # 抛给上层：由 Agent 报错，或由 RouterClient 切换到其他后端
+                    raise _request_error(e) from e
+
+    def last_usage(self):
+        """当前线程最近一次 chat 的 usageMetadata；请求失败或没有返回用量时为 None"""
+        return getattr(self._local, "usage", None)
+
+    def stats(self) -> dict:
+        """输入 token 用量；cached_tokens 是命中服务端缓存、按折扣计费且不必重复上传的部分"""
+        with self._usage_lock:
+            data = {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "output_tokens": self.output_tokens,
+                "request_bytes": self.request_bytes,
+                "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
             }
-        
-        try:
-            response = requests.post(url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            # 安全地提取内容
-            if "candidates" in result and len(result["candidates"]) > 0:
-                candidate = result["candidates"][0]
-                if "content" in candidate and "parts" in candidate["content"]:
-                    return candidate["content"]["parts"][0]["text"]
-                elif "finishReason" in candidate:
-                    return f"[API返回结束原因: {candidate['finishReason']}]"
-            
-            return f"[API返回格式异常: {json.dumps(result)}]"
-            
-        except requests.exceptions.RequestException as e:
-            # 简单重试或报错
-            if hasattr(e.response, "text"):
-                return f"API请求失败: {e.response.text}"
-            return f"API请求失败: {str(e)}"
+        if self.cache is not None:
+            data["cache"] = self.cache.stats()
+        return data
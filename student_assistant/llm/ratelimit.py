@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Tuple
+
+from .base_client import BaseLLMClient, LLMError, RateLimitError
+from .cancel import CancelledError, current_scope
+from .router import percentile
+from tracing import tracer
+
+# 排队优先级：数值小的先发。撰写最终回复的请求优先于选工具的轮次，用户等的就是它
+PRIORITY_REPLY = 0
+PRIORITY_ROUTING = 1
+PRIORITY_NAMES = {PRIORITY_REPLY: "reply", PRIORITY_ROUTING: "routing"}
+
+# 当前请求所属的会话和优先级，由 Agent 在调用 LLM 前设置
+_request: ContextVar[Tuple[str, int]] = ContextVar("llm_request", default=("default", PRIORITY_REPLY))
+
+
+def current_request() -> Tuple[str, int]:
+    return _request.get()
+
+
+@contextmanager
+def use_request(session: str, priority: int = PRIORITY_REPLY):
+    token = _request.set((session, priority))
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：每个汉字 1 个，其他字符 4 个 1 个"""
+    wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+class TokenBucket:
+    """按配额补充的令牌桶
+
+    容量取配额的 1/10，补充速率取其余 9/10：任意一个 period 窗口内最多发出“容量 + 补充量”即配额数量，
+    服务端按滑动窗口计数时也不会超。桶里不够一次请求的量时，等桶满即可放行并记为欠账（余量为负），
+    这样估计 token 数大于容量的请求也不会永远排不上。
+    """
+
+    BURST_RATIO = 0.1
+
+    def __init__(self, quota: int, period: float = 60.0):
+        self.quota = quota
+        self.capacity = max(1.0, quota * self.BURST_RATIO)
+        self.rate = max(quota - self.capacity, 1.0) / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """还要等多少秒才能取走 amount"""
+        self._refill(now)
+        need = min(amount, self.capacity) - self.level
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= amount
+
+    def adjust(self, amount: float):
+        """按实际用量补记（正数多扣，负数退还）"""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """共享的 RPM/TPM 调度器
+
+    所有请求先排队：先按优先级，同一优先级内按会话公平排队（开始时间公平排队：每个会话的请求依次编号，
+    轮流放行，某个会话一次涌入很多请求也只是排在自己后面）。只有队首请求会等配额，放行后唤醒下一个。
+    收到服务端 429 时按其建议的时间暂停放行；排队超过 max_wait 秒时放弃，抛出 RateLimitError。
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, period: float = 60.0, max_wait: float = 30.0, name: str = ""):
+        self.name = name
+        self.requests = TokenBucket(rpm, period) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, period) if tpm > 0 else None
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._queue = []  # 堆：(优先级, 会话内序号, 到达序号)
+        self._seq = itertools.count()
+        self._session_tags: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._paused_until = 0.0
+        # 统计
+        self._waits = {p: deque(maxlen=1000) for p in PRIORITY_NAMES}
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.max_queue = 0
+
+    def _delay(self, tokens: float, now: float) -> float:
+        delay = max(0.0, self._paused_until - now)
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1, now))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens, now))
+        return delay
+
+    def acquire(self, tokens: float = 0, priority: int = PRIORITY_REPLY, session: str = "default") -> float:
+        """排队直到配额允许发出一个预计消耗 tokens 的请求，返回排队秒数"""
+        t0 = time.monotonic()
+        deadline = t0 + self.max_wait
+        with self._cond:
+            tag = max(self._vtime, self._session_tags.get(session, 0.0)) + 1
+            self._session_tags[session] = tag
+            entry = (priority, tag, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            self.max_queue = max(self.max_queue, len(self._queue))
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(tokens, now) if self._queue[0] == entry else None
+                    if delay == 0:
+                        break
+                    # 队首要等配额时，能否在期限内等到是确定的，不必干等到超时
+                    if now >= deadline or (delay is not None and now + delay > deadline):
+                        self.rejected += 1
+                        raise RateLimitError(
+                            f"LLM 配额不足：预计排队超过 {self.max_wait:g}s（{self.name or '默认'}）",
+                            retry_after=delay)
+                    self._cond.wait(min(delay, deadline - now) if delay is not None else deadline - now)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            now = time.monotonic()
+            if self.requests is not None:
+                self.requests.take(1, now)
+            if self.tokens is not None:
+                self.tokens.take(tokens, now)
+            self._vtime = tag
+            if not self._queue:
+                # 没人排队时各会话的历史不再影响公平性
+                self._session_tags.clear()
+            self.granted += 1
+            waited = now - t0
+            self._waits[priority].append(waited)
+            self._cond.notify_all()
+        return waited
+
+    def settle(self, estimated: float, actual: float):
+        """请求完成后按实际 token 用量修正 TPM 桶"""
+        if self.tokens is None or actual == estimated:
+            return
+        with self._cond:
+            self.tokens.adjust(actual - estimated)
+            self._cond.notify_all()
+
+    def release(self, tokens: float):
+        """放行后没有发出的请求退还配额"""
+        with self._cond:
+            if self.requests is not None:
+                self.requests.adjust(-1)
+            if self.tokens is not None:
+                self.tokens.adjust(-tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """服务端返回 429：seconds 秒内不再放行任何请求"""
+        with self._cond:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            data = {
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "throttled": self.throttled,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+            }
+            waits = {p: list(w) for p, w in self._waits.items()}
+        for p, name in PRIORITY_NAMES.items():
+            samples = waits[p]
+            data[f"{name}_wait_p50_ms"] = round(percentile(samples, 50) * 1000, 1) if samples else None
+            data[f"{name}_wait_p95_ms"] = round(percentile(samples, 95) * 1000, 1) if samples else None
+            data[f"{name}_wait_max_ms"] = round(max(samples) * 1000, 1) if samples else None
+        return data
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(key: str, rpm: int = 0, tpm: int = 0, max_wait: float = 30.0) -> RateLimiter:
+    """同一个配额（同一服务地址下的同一模型）在进程内共用一个调度器"""
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(rpm, tpm, max_wait=max_wait, name=key)
+        return limiter
+
+
+def all_stats() -> Dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.stats() for key, limiter in limiters.items()}
+
+
+class RateLimitedClient(BaseLLMClient):
+    """在 LLM 客户端前面排队：按共享调度器的配额发出请求，收到 429 时暂停调度器并重新排队"""
+
+    # 预估的输出 token 数，请求完成后按实际用量修正
+    OUTPUT_TOKENS = 256
+    # 429 没有给出重试时间时暂停的秒数
+    DEFAULT_RETRY_AFTER = 5.0
+
+    def __init__(self, client: BaseLLMClient, limiter: RateLimiter, retries: int = 2):
+        self.client = client
+        self.limiter = limiter
+        self.retries = retries
+        self.model = getattr(client, "model", None)
+
+    def chat(self, messages: list[dict], system_prompt: str = None, system_context: str = None) -> str:
+        session, priority = current_request()
+        text = "".join(m["content"] for m in messages) + (system_prompt or "") + (system_context or "")
+        estimated = estimate_tokens(text) + self.OUTPUT_TOKENS
+        scope = current_scope()
+        for attempt in range(self.retries + 1):
+            if scope is not None:
+                scope.check()
+            with tracer.span("llm.queue", priority=PRIORITY_NAMES.get(priority), attempt=attempt) as span:
+                waited = self.limiter.acquire(estimated, priority, session)
+                span.set("wait_ms", round(waited * 1000, 1))
+            if scope is not None and scope.cancelled:
+                # 排队期间已经落选：不再发出，配额还给别人
+                self.limiter.release(estimated)
+                raise CancelledError("LLM 请求已取消")
+            try:
+                reply = self.client.chat(messages=messages, system_prompt=system_prompt,
+                                         system_context=system_context)
+            except RateLimitError as e:
+                # 被拒绝的请求不消耗 token 配额
+                self.limiter.settle(estimated, 0)
+                self.limiter.pause(e.retry_after or self.DEFAULT_RETRY_AFTER)
+                if attempt == self.retries:
+                    raise
+                continue
+            except LLMError:
+                self.limiter.settle(estimated, 0)
+                raise
+            usage = self.client.last_usage() if hasattr(self.client, "last_usage") else None
+            if usage:
+                self.limiter.settle(estimated, usage.get("totalTokenCount", estimated))
+            return reply
+
+    def stats(self) -> Dict:
+        data = self.client.stats() if hasattr(self.client, "stats") else {}
+        return {**data, "rate_limit": self.limiter.stats()}
+
@@ -0,0 +1,328 @@
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from .base_client import BaseLLMClient, LLMError
+from .cancel import CancelScope, _scope
+from tracing import tracer
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断；cooldown 秒后放行一个试探请求，成功则恢复"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Backend:
+    """一个 LLM 后端及其滚动延迟统计和熔断器"""
+
+    def __init__(self, name: str, client: BaseLLMClient, breaker: CircuitBreaker, window: int = 200):
+        self.name = name
+        self.client = client
+        self.breaker = breaker
+        self.latencies = deque(maxlen=window)  # 最近成功请求的耗时（秒）
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.wins = 0  # 作为最先返回的结果被采用的次数
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, latency: float):
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.successes += 1
+                self.latencies.append(latency)
+            else:
+                self.failures += 1
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self.latencies)
+        return percentile(samples, p) if samples else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = list(self.latencies)
+            data = {
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "wins": self.wins,
+            }
+        data["p50_ms"] = round(percentile(samples, 50) * 1000, 1) if samples else None
+        data["p95_ms"] = round(percentile(samples, 95) * 1000, 1) if samples else None
+        data["breaker"] = self.breaker.state
+        return data
+
+
+class RouterClient(BaseLLMClient):
+    """在多个后端（模型/服务）之间路由的 LLM 客户端
+
+    - 对冲：主请求超过其滚动延迟的 hedge_percentile 分位仍未返回时，向下一个可用后端
+      （没有其他后端时向同一后端）再发一次，采用先返回的结果
+    - 故障转移：请求出错时立即改用下一个后端
+    - 熔断：连续失败的后端暂时跳过，冷却后放行一个试探请求
+
+    每次尝试有自己的 CancelScope：结果确定后（采用、出错或超时）取消其余尝试，尚未发出的不再发出，
+    进行中的直接断开连接，不占连接也不再消耗配额；被取消的尝试不计入延迟统计和熔断。
+    """
+
+    def __init__(self, backends: List[Tuple[str, BaseLLMClient]], hedge_percentile: float = 95,
+                 hedge_delay: float = 3.0, min_samples: int = 10, max_hedges: int = 1,
+                 timeout: float = 30, breaker_failures: int = 3, breaker_cooldown: float = 30):
+        if not backends:
+            raise ValueError("RouterClient 至少需要一个后端")
+        self.backends = [Backend(name, client, CircuitBreaker(breaker_failures, breaker_cooldown))
+                         for name, client in backends]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.timeout = timeout
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    def _hedge_after(self, backend: Backend) -> float:
+        """主请求发出多久后对冲：样本足够时取滚动分位数，否则用默认值"""
+        if len(backend.latencies) < self.min_samples:
+            return self.hedge_delay
+        return backend.latency_percentile(self.hedge_percentile)
+
+    def _pick(self, exclude) -> Optional[Backend]:
+        for backend in self.backends:
+            if backend not in exclude and backend.breaker.allow():
+                return backend
+        return None
+
+    def _launch(self, backend: Backend, kind: str, messages, system_prompt, system_context,
+                results: "queue.Queue") -> CancelScope:
+        scope = CancelScope()
+
+        def run():
+            if scope.cancelled:
+                return
+            t0 = time.perf_counter()
+            try:
+                reply = backend.client.chat(messages=messages, system_prompt=system_prompt,
+                                            system_context=system_context)
+                ok, value = True, reply
+            except Exception as e:
+                if scope.cancelled:
+                    # 是我们断开的，不算后端的失败
+                    return
+                ok, value = False, e
+            latency = time.perf_counter() - t0
+            backend.record(ok, latency)
+            results.put((backend, kind, ok, value))
+
+        # 带上调用方的上下文（会话、优先级等），后端的限流器按它排队
+        ctx = contextvars.copy_context()
+        ctx.run(_scope.set, scope)
+        threading.Thread(target=ctx.run, args=(run,), name=f"llm-{backend.name}-{kind}", daemon=True).start()
+        return scope
+
+    def chat(self, messages: list[dict], system_prompt: str = None, system_context: str = None) -> str:
+        with tracer.span("llm.router") as span:
+            with self._lock:
+                self.requests += 1
+            deadline = time.monotonic() + self.timeout
+            results: "queue.Queue" = queue.Queue()
+            scopes = []
+            tried = []
+            errors = []
+            inflight = 0
+            hedges = 0
+            attempts = 1
+
+            primary = self._pick(tried)
+            if primary is None:
+                span.set("outcome", "all_open")
+                raise LLMError("所有 LLM 后端都处于熔断状态")
+            tried.append(primary)
+            scopes.append(self._launch(primary, "primary", messages, system_prompt, system_context, results))
+            inflight += 1
+            hedge_at = time.monotonic() + self._hedge_after(primary)
+
+            try:
+                while inflight:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        break
+                    wait = deadline - now
+                    can_hedge = hedges < self.max_hedges
+                    if can_hedge:
+                        wait = min(wait, max(0.0, hedge_at - now))
+                    try:
+                        backend, kind, ok, value = results.get(timeout=wait)
+                    except queue.Empty:
+                        if can_hedge and time.monotonic() >= hedge_at:
+                            # 主请求太慢：优先换一个后端，没有就向同一后端重复发送
+                            target = self._pick(tried) or primary
+                            if target not in tried:
+                                tried.append(target)
+                            scopes.append(self._launch(target, "hedge", messages, system_prompt, system_context,
+                                                       results))
+                            inflight += 1
+                            attempts += 1
+                            hedges += 1
+                            with self._lock:
+                                self.hedges += 1
+                            span.set("hedged", target.name)
+                        continue
+
+                    inflight -= 1
+                    if ok:
+                        with backend._lock:
+                            backend.wins += 1
+                        if kind == "hedge":
+                            with self._lock:
+                                self.hedge_wins += 1
+                        span.set("winner", backend.name)
+                        span.set("winner_kind", kind)
+                        return value
+
+                    errors.append(f"{backend.name}: {value}")
+                    fallback = self._pick(tried)
+                    if fallback is not None:
+                        tried.append(fallback)
+                        scopes.append(self._launch(fallback, "failover", messages, system_prompt, system_context,
+                                                   results))
+                        inflight += 1
+                        attempts += 1
+                        with self._lock:
+                            self.failovers += 1
+                        span.set("failover", fallback.name)
+            finally:
+                # 取消其余尝试：尚未发出的不再发出，进行中的断开连接
+                for scope in scopes:
+                    scope.cancel()
+                span.set("attempts", attempts)
+
+            span.set("outcome", "timeout" if not errors else "error")
+            if not errors:
+                raise LLMError(f"LLM 请求超时（{self.timeout}s）")
+            raise LLMError("所有 LLM 后端请求失败: " + "; ".join(errors))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            data = {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failovers": self.failovers,
+            }
+        data["backends"] = {b.name: b.stats() for b in self.backends}
+        return data
+
+    def usage(self) -> Dict:
+        """汇总各后端的 token 用量"""
+        total = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        for backend in self.backends:
+            stats = getattr(backend.client, "stats", None)
+            if stats is None:
+                continue
+            data = stats()
+            for key in total:
+                total[key] += data.get(key, 0)
+        prompt = total["prompt_tokens"]
+        total["cached_ratio"] = round(total["cached_tokens"] / prompt, 3) if prompt else 0.0
+        return total
+
+
+def parse_backend_spec(spec: str, default_base_url: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """"模型" 或 "模型@base_url" -> (模型, base_url)"""
+    if "@" in spec:
+        model, base_url = spec.split("@", 1)
+        return model.strip(), base_url.strip()
+    return spec.strip(), default_base_url
+
+
+def _gemini(api_key: str, model: str, base_url: Optional[str]) -> BaseLLMClient:
+    """一个 GeminiClient，前面套上该模型的共享限流器（同一地址下的同一模型共用配额）"""
+    import config
+    from .gemini_client import GeminiClient
+    from .ratelimit import RateLimitedClient, get_limiter
+
+    client = GeminiClient(api_key=api_key, model=model, base_url=base_url, timeout=config.LLM_TIMEOUT,
+                          context_cache=config.GEMINI_CONTEXT_CACHE, cache_ttl=config.GEMINI_CACHE_TTL)
+    rpm, tpm = config.LLM_RATE_LIMITS.get(model, (config.LLM_RPM, config.LLM_TPM))
+    limiter = get_limiter(f"{model}@{client.base_url}", rpm, tpm, max_wait=config.LLM_RATE_MAX_WAIT)
+    return RateLimitedClient(client, limiter, retries=config.LLM_RATE_RETRIES)
+
+
+def create_client(api_key: str = None, model: str = None) -> BaseLLMClient:
+    """按配置创建 LLM 客户端：没有配置备用后端时就是单个（限流的）GeminiClient，否则用 RouterClient 包起来"""
+    import config
+
+    api_key = api_key or config.GEMINI_API_KEY
+    model = model or config.GEMINI_MODEL
+    primary = _gemini(api_key, model, config.GEMINI_BASE_URL)
+    if not config.LLM_FALLBACKS:
+        return primary
+    backends = [(model, primary)]
+    for spec in config.LLM_FALLBACKS:
+        fb_model, base_url = parse_backend_spec(spec, config.GEMINI_BASE_URL)
+        name = fb_model if base_url == config.GEMINI_BASE_URL else spec
+        backends.append((name, _gemini(api_key, fb_model, base_url)))
+    return RouterClient(
+        backends,
+        hedge_percentile=config.LLM_HEDGE_PERCENTILE,
+        hedge_delay=config.LLM_HEDGE_DELAY,
+        timeout=config.LLM_TIMEOUT,
+        breaker_failures=config.LLM_BREAKER_FAILURES,
+        breaker_cooldown=config.LLM_BREAKER_COOLDOWN,
+    )
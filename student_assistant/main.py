@@ -1,3 +1,4 @@
+import argparse
 import sys
 from pathlib import Path
 
@@ -5,13 +6,28 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent
 sys.path.append(str(BASE_DIR))
 
-from config import GEMINI_API_KEY, GEMINI_MODEL, MAX_HISTORY_COUNT
-from llm.gemini_client import GeminiClient
+from config import (GEMINI_API_KEY, GEMINI_MODEL, MAX_HISTORY_COUNT, PREFETCH_ENABLED,
+                    HISTORY_ENABLED, HISTORY_MEMORY_CAP, SESSIONS_DIR, DEFAULT_USER,
+                    LLM_ROUTING_MODEL, LLM_TIER_POLICY, INTENT_FAST_PATH, INTENT_THRESHOLD,
+                    GEMINI_CONTEXT_CACHE, TOOL_RESULT_FORMAT, TOOL_RESULT_MAX_ROWS, TOOL_RESULT_REFS)
+from llm import ratelimit
+from llm.router import RouterClient, create_client
 from prompts.prompt_manager import PromptManager
 from agent.tool_executor import ToolExecutor
 from agent.assistant import AssistantAgent
+from agent.prefetcher import Prefetcher
+from agent.intent import IntentRouter
+from agent.result_format import ResultEncoder, ResultStore
+from agent.history import HistoryStore
+from tools.userdata import set_user, user_path
 
 def main():
+    arg_parser = argparse.ArgumentParser(description="大学生随身小秘书")
+    arg_parser.add_argument("--session", default="default", help="会话名，重启后用同名会话可接着聊")
+    arg_parser.add_argument("--no-history", action="store_true", help="不保存对话历史")
+    arg_parser.add_argument("--user", default=DEFAULT_USER, help="用户名，每个用户的数据相互独立")
+    options = arg_parser.parse_args()
+
     print("正在初始化 Agent...")
     
     # 检查 API Key
@@ -21,16 +37,36 @@ def main():
 
     # 1. 初始化模块
     try:
-        llm = GeminiClient(api_key=GEMINI_API_KEY, model=GEMINI_MODEL)
+        # 配置了 LLM_FALLBACKS 时得到带对冲/故障转移的 RouterClient，否则就是单个 GeminiClient
+        llm = create_client(api_key=GEMINI_API_KEY, model=GEMINI_MODEL)
+        # 分层模型：选工具的轮次交给低延迟的路由模型
+        routing_llm = None
+        if LLM_ROUTING_MODEL and LLM_TIER_POLICY != "single":
+            routing_llm = create_client(api_key=GEMINI_API_KEY, model=LLM_ROUTING_MODEL)
         prompt_manager = PromptManager()
-        executor = ToolExecutor()
+        set_user(options.user)
+        executor = ToolExecutor(user_id=options.user)
+        prefetcher = Prefetcher(executor) if PREFETCH_ENABLED else None
+        intent_router = IntentRouter(executor, threshold=INTENT_THRESHOLD) if INTENT_FAST_PATH else None
+        history_store = None
+        if HISTORY_ENABLED and not options.no_history:
+            history_store = HistoryStore(options.session, base_dir=user_path(SESSIONS_DIR))
         
         # 2. 组装 Agent
         agent = AssistantAgent(
             llm_client=llm,
             prompt_manager=prompt_manager,
             tool_executor=executor,
-            max_history=MAX_HISTORY_COUNT
+            max_history=MAX_HISTORY_COUNT,
+            prefetcher=prefetcher,
+            history_store=history_store,
+            memory_cap=HISTORY_MEMORY_CAP,
+            routing_llm=routing_llm,
+            tier_policy=LLM_TIER_POLICY,
+            intent_router=intent_router,
+            result_encoder=ResultEncoder(max_rows=TOOL_RESULT_MAX_ROWS, store=ResultStore(TOOL_RESULT_REFS),
+                                         mode=TOOL_RESULT_FORMAT),
+            session=options.session,
         )
     except Exception as e:
         print(f"初始化失败: {e}")
@@ -40,6 +76,8 @@ def main():
     print("🎓 大学生随身小秘书 (Gemini驱动)")
     print("输入 'exit' 或 'quit' 退出")
     print("================================================")
+    if history_store is not None and agent.history:
+        print(f"[会话 {options.session}] 已恢复最近 {len(agent.history)} 条历史消息")
 
     # 3. 交互循环
     while True:
@@ -62,5 +100,26 @@ def main():
         except Exception as e:
             print(f"\n发生错误: {e}")
 
+    if agent.prefetcher is not None:
+        stats = agent.prefetcher.stats()
+        print(f"[预取统计] 命中率 {stats['hit_rate']:.0%}，浪费率 {stats['waste_rate']:.0%} ({stats})")
+        agent.prefetcher.shutdown()
+    if intent_router is not None:
+        stats = intent_router.stats()
+        print(f"[快速通道统计] 直接回答 {stats['share']:.0%} 的请求，估计节省 {stats['saved_ms'] or 0:.0f}ms ({stats})")
+    if isinstance(llm, RouterClient):
+        print(f"[LLM 路由统计] {llm.stats()}")
+    if GEMINI_CONTEXT_CACHE:
+        usage = llm.usage() if isinstance(llm, RouterClient) else llm.stats()
+        print(f"[上下文缓存] 输入 token {usage['prompt_tokens']}，其中命中缓存 {usage['cached_tokens']}"
+              f"（{usage['cached_ratio']:.0%}）")
+    if routing_llm is not None:
+        print(f"[分层模型统计] {agent.tier_summary()}")
+    for key, stats in ratelimit.all_stats().items():
+        if stats["granted"] or stats["rejected"]:
+            print(f"[限流统计] {key}: {stats}")
+    if history_store is not None:
+        history_store.close()
+
 if __name__ == "__main__":
     main()
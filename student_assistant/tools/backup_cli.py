@@ -0,0 +1,105 @@
+import argparse
+import sys
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from config import (BUDGET_FILE, COURSE_FILE, DATA_DIR, MEMORY_FILE, SCHEDULE_FILE,
+                        SNAPSHOT_KEEP_DAILY, SNAPSHOT_KEEP_LAST, SNAPSHOT_KEEP_WEEKLY)
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import (BUDGET_FILE, COURSE_FILE, DATA_DIR, MEMORY_FILE, SCHEDULE_FILE,
+                        SNAPSHOT_KEEP_DAILY, SNAPSHOT_KEEP_LAST, SNAPSHOT_KEEP_WEEKLY)
+
+from tools import snapshot, stream
+from tools.userdata import current_user, ensure_parent, user_path
+
+# 备份包含的数据文件（按当前用户映射到其分区）
+BACKUP_FILES = [BUDGET_FILE, SCHEDULE_FILE, COURSE_FILE, MEMORY_FILE]
+DATASETS = {"budget": BUDGET_FILE, "schedule": SCHEDULE_FILE, "course": COURSE_FILE, "memory": MEMORY_FILE}
+
+def create_backup(output):
+    """把当前用户的数据文件打包成 zip，返回打包的文件列表"""
+    files = [user_path(p) for p in BACKUP_FILES]
+    files = [p for p in files if p.exists()]
+    output = ensure_parent(Path(output))
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i, path in enumerate(files, 1):
+            zf.write(path, arcname=path.name)
+            stream.progress(i, len(files), f"已打包 {path.name}")
+    return {
+        "success": True,
+        "file": str(output),
+        "user": current_user(),
+        "files": [p.name for p in files],
+        "bytes": output.stat().st_size,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def restore_scope(dataset=None, all_users=False):
+    """要恢复的文件（相对数据目录）：默认当前用户的全部数据文件，可只选一个数据集；all_users 时为 None 表示全部"""
+    if all_users:
+        return None
+    files = [DATASETS[dataset]] if dataset else BACKUP_FILES
+    return [user_path(p).relative_to(DATA_DIR).as_posix() for p in files]
+
+def run_snapshot_command(args):
+    store = snapshot.store
+    if args.command == "snapshot":
+        return store.take("manual", note=args.note, force=args.force)
+    if args.command == "snapshots":
+        data = store.list()
+        return {"success": True, "count": len(data), "data": data[-args.limit:] if args.limit else data,
+                **store.stats()}
+    if args.command == "restore":
+        files = restore_scope(args.dataset, args.all_users)
+        return store.restore(args.to, files, dry_run=args.dry_run, progress=stream.progress)
+    if args.command == "prune":
+        return store.prune(args.keep_last, args.keep_daily, args.keep_weekly, dry_run=args.dry_run)
+    return None
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="数据备份工具")
+    subparsers = parser.add_subparsers(dest="command", help="子命令")
+
+    create_parser = subparsers.add_parser("create", help="把当前用户的数据打包成 zip")
+    create_parser.add_argument("--output", required=True, help="输出的 zip 文件")
+
+    snap_parser = subparsers.add_parser("snapshot", help="给整个数据目录拍一个增量快照")
+    snap_parser.add_argument("--note", help="备注")
+    snap_parser.add_argument("--force", action="store_true", help="数据没有变化也生成快照")
+
+    list_parser = subparsers.add_parser("snapshots", help="列出快照")
+    list_parser.add_argument("--limit", type=int, default=20, help="只列出最近几个，0 表示全部")
+
+    restore_parser = subparsers.add_parser("restore", help="把数据恢复到某个快照")
+    restore_parser.add_argument("--to", required=True, help="快照号，或时间点 YYYY-MM-DD[ HH:MM]（取该时间之前最后一个快照）")
+    restore_parser.add_argument("--dataset", choices=sorted(DATASETS), help="只恢复一个数据集，默认全部")
+    restore_parser.add_argument("--all-users", action="store_true", help="恢复所有用户的数据，默认只恢复当前用户")
+    restore_parser.add_argument("--dry-run", action="store_true", help="只列出会被恢复的文件")
+
+    prune_parser = subparsers.add_parser("prune", help="按保留策略删除旧快照")
+    prune_parser.add_argument("--keep-last", type=int, default=SNAPSHOT_KEEP_LAST)
+    prune_parser.add_argument("--keep-daily", type=int, default=SNAPSHOT_KEEP_DAILY)
+    prune_parser.add_argument("--keep-weekly", type=int, default=SNAPSHOT_KEEP_WEEKLY)
+    prune_parser.add_argument("--dry-run", action="store_true", help="只列出会被删除的快照")
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
+    if args.command == "create":
+        return create_backup(args.output)
+    return run_snapshot_command(args)
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    try:
+        result = run_command(args)
+    except snapshot.SnapshotError as e:
+        result = {"success": False, "error": str(e)}
+    if result is None:
+        parser.print_help()
+    else:
+        stream.print_result(result)
@@ -0,0 +1,57 @@
+# 工具 CLI 的批处理支持
+# batch 子命令接收一个 JSON 数组，每项是一条普通子命令的参数字符串（与 LLM 的 args 相同），
+# 例如 ["add --amount 25 --category 餐饮", "add --amount 18 --category 饮品"]。
+# 各 CLI 在批处理期间共享一份已加载的数据，最后只保存一次。
+import json
+import shlex
+import sys
+from typing import Callable, List, Optional
+
+
+def read_ops(raw: Optional[str]) -> list:
+    """从 --ops 参数或标准输入读取操作列表"""
+    if raw is None:
+        raw = sys.stdin.read()
+    ops = json.loads(raw)
+    if not isinstance(ops, list):
+        raise ValueError("batch 的输入必须是 JSON 数组")
+    return ops
+
+
+def _to_argv(op) -> List[str]:
+    if isinstance(op, str):
+        return shlex.split(op)
+    if isinstance(op, list):
+        return [str(x) for x in op]
+    raise ValueError(f"无法识别的操作: {op!r}")
+
+
+def run_ops(parser, run_command: Callable, ops: list) -> List[dict]:
+    """按顺序执行每个操作，返回与 ops 一一对应的结果"""
+    results = []
+    for op in ops:
+        try:
+            argv = _to_argv(op)
+            if not argv or argv[0] == "batch":
+                raise ValueError("批处理中不能为空或嵌套 batch")
+            args = parser.parse_args(argv)
+        except SystemExit:
+            results.append({"success": False, "error": f"参数错误: {op}"})
+            continue
+        except ValueError as e:
+            results.append({"success": False, "error": str(e)})
+            continue
+        try:
+            result = run_command(args)
+            if result is None:
+                result = {"success": False, "error": f"不支持的子命令: {argv[0]}"}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        results.append(result)
+    return results
+
+
+def add_batch_parser(subparsers):
+    batch_parser = subparsers.add_parser("batch", help="批量执行多条子命令（一次加载、一次保存）")
+    batch_parser.add_argument("--ops", help='JSON 数组，如 ["add ...", "add ..."]；省略时从标准输入读取')
+    return batch_parser
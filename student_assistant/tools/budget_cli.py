@@ -1,5 +1,4 @@
 import argparse
-import json
 import sys
 from datetime import datetime
 from pathlib import Path
@@ -10,22 +9,51 @@ except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
     from config import BUDGET_FILE
 
+from tools import batch, changefeed, records, stream
+from tools.records import BudgetRecord
+from tools.userdata import ensure_parent, mark_changed, stores, user_path
+
+# 批处理事务：批内所有操作共享同一份数据，结束时统一保存一次
+_txn = None
+# 数据变更事件（Web 页面据此实时刷新）
+changes = changefeed.Recorder("budget")
+
 def load_data():
-    if not BUDGET_FILE.exists():
+    if _txn is not None:
+        return _txn["data"]
+    path = user_path(BUDGET_FILE)
+    if not path.exists():
         # 初始化结构
         init_data = {"monthly_budget": 1500, "category_budgets": {}, "records": []}
         save_data(init_data)
         return init_data
     
     try:
-        with open(BUDGET_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        data = records.load_file(path)
+    except records.DecodeError:
         return {"monthly_budget": 1500, "category_budgets": {}, "records": []}
+    if not isinstance(data, dict):
+        raise records.RecordError(f"{path.name}: 顶层必须是对象")
+    data["records"] = records.decode_list(BudgetRecord, data.get("records", []), path.name)
+    return data
 
 def save_data(data):
-    with open(BUDGET_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if _txn is not None:
+        _txn["data"] = data
+        _txn["dirty"] = True
+        return
+    path = ensure_parent(user_path(BUDGET_FILE))
+    records.dump_file(data, path)
+    mark_changed(path)
+
+def read_data():
+    """只读命令用的数据：文件没有变化时复用已解码的结果，调用方不能修改它"""
+    if _txn is not None:
+        return _txn["data"]
+    path = user_path(BUDGET_FILE)
+    if not path.exists():
+        return load_data()
+    return stores.get("budget", path, load_data)
 
 def add_record(amount, category, type="expense", note=""):
     data = load_data()
@@ -34,18 +62,22 @@ def add_record(amount, category, type="expense", note=""):
     if data["records"]:
         new_id = max(r["id"] for r in data["records"]) + 1
         
-    record = {
-        "id": new_id,
-        "type": type,
-        "amount": float(amount),
-        "category": category,
-        "note": note,
-        "date": datetime.now().strftime("%Y-%m-%d"),
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    try:
+        record = BudgetRecord(
+            id=new_id,
+            type=type,
+            amount=float(amount),
+            category=category,
+            note=note,
+            date=datetime.now().strftime("%Y-%m-%d"),
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    except ValueError as e:
+        return {"success": False, "message": str(e)}
     
     data["records"].append(record)
     save_data(data)
+    changes("add", new_id, record)
     
     # 计算当前余额
     bal = calculate_balance(data)
@@ -61,27 +93,32 @@ def delete_record(record_id):
         return {"success": False, "message": "未找到指定ID的记录"}
         
     save_data(data)
+    changes("delete", record_id)
     return {"success": True, "message": "记录已删除"}
 
 def update_record(record_id, amount=None, note=None):
     data = load_data()
-    found = False
+    found = None
     for r in data["records"]:
         if r["id"] == record_id:
-            if amount is not None: r["amount"] = float(amount)
-            if note is not None: r["note"] = note
-            found = True
+            try:
+                if amount is not None: r["amount"] = float(amount)
+                if note is not None: r["note"] = note
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+            found = r
             break
             
     if not found:
         return {"success": False, "message": "未找到指定ID的记录"}
         
     save_data(data)
+    changes("update", record_id, found)
     return {"success": True, "message": "记录已更新"}
 
 def calculate_balance(data=None):
     if data is None:
-        data = load_data()
+        data = read_data()
         
     # 默认只计算当月（简单起见，这里简化为计算所有记录，或者只计算当月预算剩余）
     # 逻辑：余额 = 月预算 - 当月支出 + 当月收入 (更复杂的逻辑可以后续扩展)
@@ -108,18 +145,21 @@ def calculate_balance(data=None):
         "monthly_expense": expense
     }
 
+def iter_records(month=None, category=None, date=None):
+    """按条件逐条产出账单记录；流式输出时不必先构造完整的结果列表"""
+    if date == "today":
+        date = datetime.now().strftime("%Y-%m-%d")
+    for r in read_data()["records"]:
+        if month and not r["date"].startswith(month):
+            continue
+        if date and r["date"] != date:
+            continue
+        if category and r["category"] != category:
+            continue
+        yield r
+
 def list_records(month=None, category=None, date=None):
-    data = load_data()
-    records = data["records"]
-    
-    if month:
-        records = [r for r in records if r["date"].startswith(month)]
-    if date:
-        target_date = date
-        if date == "today": target_date = datetime.now().strftime("%Y-%m-%d")
-        records = [r for r in records if r["date"] == target_date]
-    if category:
-        records = [r for r in records if r["category"] == category]
+    records = list(iter_records(month, category, date))
         
     return {
         "success": True,
@@ -128,7 +168,7 @@ def list_records(month=None, category=None, date=None):
     }
 
 def get_stats(month=None):
-    data = load_data()
+    data = read_data()
     if not month:
         month = datetime.now().strftime("%Y-%m")
         
@@ -141,6 +181,42 @@ def get_stats(month=None):
         
     return {"success": True, "month": month, "data": stats}
 
+def year_report(year=None):
+    """全年收支报告：按月的收入/支出、按类别的支出及占比、最大的几笔支出"""
+    year = str(year or datetime.now().year)
+    stream.progress(0, 1, "读取账单")
+    data = read_data()
+    all_records = data["records"]
+    months = {f"{year}-{m:02d}": {"income": 0.0, "expense": 0.0, "count": 0} for m in range(1, 13)}
+    categories = {}
+    largest = []
+    total = len(all_records)
+    for i, r in enumerate(all_records, 1):
+        if i % 20000 == 0:
+            stream.progress(i, total, f"已统计 {i}/{total} 条")
+        month = months.get(r["date"][:7])
+        if month is None:
+            continue
+        month[r["type"]] += r["amount"]
+        month["count"] += 1
+        if r["type"] == "expense":
+            categories[r["category"]] = categories.get(r["category"], 0) + r["amount"]
+            largest.append(r)
+    income = sum(m["income"] for m in months.values())
+    expense = sum(m["expense"] for m in months.values())
+    largest.sort(key=lambda r: r["amount"], reverse=True)
+    stream.progress(total, total, "统计完成")
+    return {
+        "success": True,
+        "year": year,
+        "income": round(income, 2),
+        "expense": round(expense, 2),
+        "months": [{"month": k, **{f: round(v, 2) for f, v in m.items()}} for k, m in months.items()],
+        "categories": [{"category": c, "amount": round(a, 2), "ratio": round(a / expense, 4) if expense else 0}
+                       for c, a in sorted(categories.items(), key=lambda x: x[1], reverse=True)],
+        "largest": largest[:10],
+    }
+
 def set_budget(amount, category=None):
     data = load_data()
     if category:
@@ -151,9 +227,36 @@ def set_budget(amount, category=None):
         msg = f"已设置月总预算为 {amount}"
         
     save_data(data)
+    changes("set-budget", category=category, amount=float(amount))
     return {"success": True, "message": msg}
 
-if __name__ == "__main__":
+def import_csv(file, preset="auto", mapping=None, encoding="utf-8-sig",
+               batch_size=None, progress=None):
+    """流式导入账单 CSV；file 可以是路径或已打开的文本流"""
+    # 导入模块依赖 hashlib/csv，只在导入账单时才加载，不拖慢其他子命令的启动
+    from tools import budget_import
+    if preset != "auto" and preset not in budget_import.PRESETS:
+        return {"success": False, "message": f"不支持的账单格式: {preset}"}
+    batch_size = batch_size or budget_import.DEFAULT_BATCH_SIZE
+    data = load_data()
+    try:
+        mapping_conf = budget_import.load_mapping(mapping) if isinstance(mapping, str) else (mapping or {})
+        if isinstance(file, (str, Path)):
+            with open(file, 'r', encoding=encoding, newline='') as f:
+                stats = budget_import.import_records(data, f, save_data, preset, mapping_conf, batch_size, progress)
+        else:
+            stats = budget_import.import_records(data, file, save_data, preset, mapping_conf, batch_size, progress)
+    except UnicodeDecodeError:
+        return {"success": False, "message": "文件编码不匹配，支付宝导出文件请尝试 --encoding gbk"}
+    except (OSError, ValueError, KeyError) as e:
+        return {"success": False, "message": f"导入失败: {e}"}
+    if stats["imported"]:
+        # 批量导入只发一条汇总事件，页面整体刷新账单列表
+        changes("import", count=stats["imported"])
+    
+    return {"success": True, "message": f"已导入 {stats['imported']} 条记录", **stats}
+
+def build_parser():
     parser = argparse.ArgumentParser(description="生活费管理工具")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
@@ -187,26 +290,93 @@ if __name__ == "__main__":
     stats_parser = subparsers.add_parser("stats", help="统计")
     stats_parser.add_argument("--month", help="YYYY-MM")
     
+    # report
+    report_parser = subparsers.add_parser("report", help="全年收支报告")
+    report_parser.add_argument("--year", type=int, help="年份，默认今年")
+    
     # set-budget
     budget_parser = subparsers.add_parser("set-budget", help="设置预算")
     budget_parser.add_argument("--amount", required=True, type=float)
     budget_parser.add_argument("--category")
     
-    args = parser.parse_args()
+    # import
+    import_parser = subparsers.add_parser("import", help="导入支付宝/微信/银行账单 CSV")
+    import_parser.add_argument("--file", required=True, help="CSV 文件路径")
+    import_parser.add_argument("--preset", default="auto", help="账单格式 auto/alipay/wechat/bank/generic")
+    import_parser.add_argument("--mapping", help="类别映射 JSON 文件")
+    import_parser.add_argument("--encoding", default="utf-8-sig", help="文件编码，支付宝一般为 gbk")
+    import_parser.add_argument("--batch-size", type=int, help="每导入多少条报告一次进度，默认 5000")
     
+    # batch
+    batch.add_batch_parser(subparsers)
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
     if args.command == "add":
-        print(json.dumps(add_record(args.amount, args.category, args.type, args.note), ensure_ascii=False))
+        return add_record(args.amount, args.category, args.type, args.note)
     elif args.command == "delete":
-        print(json.dumps(delete_record(args.id), ensure_ascii=False))
+        return delete_record(args.id)
     elif args.command == "update":
-        print(json.dumps(update_record(args.id, args.amount, args.note), ensure_ascii=False))
+        return update_record(args.id, args.amount, args.note)
     elif args.command == "balance":
-        print(json.dumps(calculate_balance(), ensure_ascii=False))
+        return calculate_balance()
     elif args.command == "list":
-        print(json.dumps(list_records(args.month, args.category, args.date), ensure_ascii=False))
+        return list_records(args.month, args.category, args.date)
     elif args.command == "stats":
-        print(json.dumps(get_stats(args.month), ensure_ascii=False))
+        return get_stats(args.month)
+    elif args.command == "report":
+        return year_report(args.year)
     elif args.command == "set-budget":
-        print(json.dumps(set_budget(args.amount, args.category), ensure_ascii=False))
+        return set_budget(args.amount, args.category)
+    elif args.command == "import":
+        return import_csv(args.file, args.preset, args.mapping, args.encoding, args.batch_size)
+    return None
+
+def run_batch(ops):
+    """批量执行：整个批次只加载一次、保存一次"""
+    global _txn
+    _txn = {"data": load_data(), "dirty": False}
+    changes.begin()
+    try:
+        results = batch.run_ops(build_parser(), run_command, ops)
+    except BaseException:
+        changes.discard()
+        raise
+    finally:
+        txn, _txn = _txn, None
+    if txn["dirty"]:
+        save_data(txn["data"])
+    # 数据落盘后再发布批内的全部变更
+    changes.commit()
+    return {"success": True, "count": len(results), "results": results,
+            "balance": calculate_balance(txn["data"])["balance"]}
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if args.command == "batch":
+        try:
+            print(records.dumps(run_batch(batch.read_ops(args.ops))))
+        except records.RecordError as e:
+            print(records.dumps({"success": False, "error": str(e)}))
+        except ValueError as e:
+            print(records.dumps({"success": False, "error": f"批处理输入无效: {e}"}))
+    elif args.command == "import":
+        # 进度写到 stderr，stdout 只保留最终 JSON
+        report = lambda s: print(f"[导入进度] 已读取 {s['rows']} 行，导入 {s['imported']} 条，重复 {s['duplicates']} 条", file=sys.stderr)
+        print(records.dumps(import_csv(args.file, args.preset, args.mapping, args.encoding, args.batch_size, report)))
+    elif args.command == "list" and stream.enabled():
+        # 边过滤边输出，读取方拿够行数后可以提前结束
+        stream.emit({"success": True}, iter_records(args.month, args.category, args.date))
     else:
-        parser.print_help()
+        try:
+            result = run_command(args)
+        except records.RecordError as e:
+            # 数据文件里有不合规的记录：报出文件和记录位置，而不是抛出堆栈
+            result = {"success": False, "error": str(e)}
+        if result is None:
+            parser.print_help()
+        else:
+            stream.print_result(result)
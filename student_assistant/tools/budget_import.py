@@ -0,0 +1,253 @@
+# 支付宝/微信/银行 CSV 账单的流式导入
+# 逐行解析 CSV，按列映射成 budget 记录；按内容哈希去重，整个导入只分配一次 ID 区间，结束时保存一次。
+# 解析是流式的（不把 CSV 读进内存），但导入的记录要加入账单数据一起保存，内存占用与导入的条数成正比。
+import csv
+import hashlib
+import json
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from tools.records import BudgetRecord
+
+# 各导出格式的列名（按优先级列出候选列名）
+PRESETS = {
+    "alipay": {
+        "date": ["交易创建时间", "交易时间", "付款时间"],
+        "amount": ["金额（元）", "金额(元)", "金额"],
+        "type": ["收/支"],
+        "category": ["交易分类", "类型"],
+        "note": ["商品名称", "商品说明", "交易对方"],
+        "trade_id": ["交易号", "交易订单号"],
+    },
+    "wechat": {
+        "date": ["交易时间"],
+        "amount": ["金额(元)", "金额（元）"],
+        "type": ["收/支"],
+        "category": ["交易类型"],
+        "note": ["商品", "交易对方"],
+        "trade_id": ["交易单号"],
+    },
+    "bank": {
+        "date": ["交易日期", "记账日期", "交易时间"],
+        "amount": ["交易金额", "金额"],
+        "type": ["收/支", "借贷标志"],
+        "category": ["摘要", "交易类型"],
+        "note": ["对方户名", "备注", "摘要"],
+        "trade_id": ["流水号"],
+    },
+    "generic": {
+        "date": ["date"],
+        "amount": ["amount"],
+        "type": ["type"],
+        "category": ["category"],
+        "note": ["note"],
+        "trade_id": ["id"],
+    },
+}
+
+INCOME_WORDS = ("收入", "income", "贷", "入账")
+EXPENSE_WORDS = ("支出", "expense", "借", "出账")
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def load_mapping(path: Optional[str]) -> Dict:
+    """读取类别映射配置：{"categories": {原类别: 新类别}, "keywords": {备注关键词: 类别}, "columns": {...}}"""
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def record_hash(timestamp: str, type: str, amount: float, note: str, trade_id: str = "",
+                occurrence: int = 0) -> str:
+    """去重用的哈希：有交易号时只看交易号；否则看完整的交易时间和内容，
+    同一文件里完全相同的行（同一分钟买了两杯咖啡）按出现次序区分，重复导入同一文件时次序不变"""
+    key = trade_id or f"{timestamp}|{type}|{amount:.2f}|{note}|{occurrence}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def legacy_hash(date: str, type: str, amount: float, note: str) -> str:
+    """旧版本（只按日期）的哈希，用于识别升级前已经导入过的行"""
+    return hashlib.sha1(f"{date}|{type}|{amount:.2f}|{note}".encode("utf-8")).hexdigest()[:16]
+
+
+def _parse_amount(text: str) -> float:
+    cleaned = re.sub(r"[^\d.\-]", "", text or "")
+    return float(cleaned)
+
+
+# 交易时间的格式 -> 规范化后的格式（保留源文件的精度）
+_DATE_FORMATS = (
+    ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S"), ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M"),
+    ("%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S"), ("%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M"),
+    ("%Y-%m-%d", "%Y-%m-%d"), ("%Y/%m/%d", "%Y-%m-%d"), ("%Y%m%d", "%Y-%m-%d"),
+)
+
+
+def _parse_timestamp(text: str) -> str:
+    """返回 YYYY-MM-DD[ HH:MM[:SS]]，前 10 个字符就是日期"""
+    text = (text or "").strip()
+    for fmt, out in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime(out)
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的日期: {text}")
+
+
+def _parse_type(text: str, amount: float) -> Optional[str]:
+    text = (text or "").strip().lower()
+    if any(w in text for w in INCOME_WORDS):
+        return "income"
+    if any(w in text for w in EXPENSE_WORDS):
+        return "expense"
+    if not text:
+        # 没有收支列时按金额正负判断
+        return "income" if amount > 0 else "expense"
+    return None  # “不计收支”等
+
+
+def _resolve_columns(header: List[str], columns: Dict[str, List[str]]) -> Optional[Dict[str, int]]:
+    names = [h.strip() for h in header]
+    resolved = {}
+    for field, candidates in columns.items():
+        for c in candidates:
+            if c in names:
+                resolved[field] = names.index(c)
+                break
+    if "date" in resolved and "amount" in resolved:
+        return resolved
+    return None
+
+
+def _find_header(reader: Iterator[List[str]], preset: str, mapping: Dict):
+    """跳过导出文件开头的说明行，找到表头；返回 (列索引, 使用的格式)"""
+    if mapping.get("columns"):
+        candidates = {"custom": {k: v if isinstance(v, list) else [v] for k, v in mapping["columns"].items()}}
+    elif preset == "auto":
+        candidates = PRESETS
+    else:
+        candidates = {preset: PRESETS[preset]}
+    for row in reader:
+        for name, columns in candidates.items():
+            resolved = _resolve_columns(row, columns)
+            if resolved:
+                return resolved, name
+    return None, None
+
+
+def _map_category(raw_category: str, note: str, mapping: Dict) -> str:
+    categories = mapping.get("categories", {})
+    if raw_category in categories:
+        return categories[raw_category]
+    for keyword, category in mapping.get("keywords", {}).items():
+        if keyword in note:
+            return category
+    return raw_category or mapping.get("default_category", "其他")
+
+
+def iter_rows(lines: Iterable[str], preset: str = "auto", mapping: Optional[Dict] = None,
+              stats: Optional[Dict] = None) -> Iterator[dict]:
+    """逐行解析 CSV，产出规范化后的记录（不含 id），无法解析的行计入 stats["errors"]"""
+    mapping = mapping or {}
+    stats = stats if stats is not None else {}
+    reader = csv.reader(lines)
+    cols, used = _find_header(reader, preset, mapping)
+    if cols is None:
+        raise ValueError("未找到可识别的表头，请指定 --preset 或在映射文件中配置 columns")
+    stats["format"] = used
+
+    def cell(row, field):
+        i = cols.get(field)
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    # 没有交易号的行按内容计数，完全相同的行各自得到不同的哈希
+    occurrences = Counter()
+
+    for row in reader:
+        if not row or not any(c.strip() for c in row):
+            continue
+        stats["rows"] = stats.get("rows", 0) + 1
+        try:
+            amount = _parse_amount(cell(row, "amount"))
+            type_ = _parse_type(cell(row, "type"), amount)
+            if type_ is None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+                continue
+            timestamp = _parse_timestamp(cell(row, "date"))
+            note = cell(row, "note")
+            category = _map_category(cell(row, "category"), note, mapping)
+        except ValueError:
+            stats["errors"] = stats.get("errors", 0) + 1
+            continue
+        amount = abs(amount)
+        trade_id = cell(row, "trade_id")
+        occurrence = 0
+        if not trade_id:
+            content = (timestamp, type_, amount, note)
+            occurrence = occurrences[content]
+            occurrences[content] += 1
+        yield {
+            "type": type_,
+            "amount": amount,
+            "category": category,
+            "note": note,
+            "date": timestamp[:10],
+            "import_hash": record_hash(timestamp, type_, amount, note, trade_id, occurrence),
+            "legacy_hash": None if trade_id else legacy_hash(timestamp[:10], type_, amount, note),
+        }
+
+
+def import_records(data: Dict, lines: Iterable[str], commit: Callable[[Dict], None],
+                   preset: str = "auto", mapping: Optional[Dict] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """把 CSV 行流式导入到 data["records"]，全部解析完后调用一次 commit(data)；每满一批报告一次进度
+
+    中途出错（例如编码不对）时什么都不保存，不会留下导入了一半的账单。
+    """
+    records = data.setdefault("records", [])
+    seen = {r["import_hash"] for r in records if r.get("import_hash")}
+    # 升级前导入的记录用的是旧哈希：每条旧记录最多抵掉一行，当时被误判为重复的行这次会导入
+    legacy = Counter(seen)
+    # 一次性分配 ID 区间：从当前最大 ID 之后顺序递增
+    next_id = max((r["id"] for r in records), default=0) + 1
+    first_id = next_id
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    stats = {"rows": 0, "imported": 0, "duplicates": 0, "skipped": 0, "errors": 0}
+
+    imported: List[BudgetRecord] = []
+
+    for rec in iter_rows(lines, preset, mapping, stats):
+        if rec["import_hash"] in seen:
+            stats["duplicates"] += 1
+            continue
+        if legacy[rec["legacy_hash"]] > 0:
+            legacy[rec["legacy_hash"]] -= 1
+            stats["duplicates"] += 1
+            continue
+        seen.add(rec["import_hash"])
+        imported.append(BudgetRecord(
+            id=next_id,
+            type=rec["type"],
+            amount=rec["amount"],
+            category=rec["category"],
+            note=rec["note"],
+            date=rec["date"],
+            created_at=created_at,
+            import_hash=rec["import_hash"],
+        ))
+        next_id += 1
+        stats["imported"] += 1
+        if progress and stats["imported"] % batch_size == 0:
+            progress(dict(stats))
+
+    if imported:
+        records.extend(imported)
+        commit(data)
+
+    stats["id_range"] = [first_id, next_id - 1] if stats["imported"] else []
+    return stats
@@ -0,0 +1,201 @@
+# 数据变更流
+# 每个用户分区一个只追加的 changes.jsonl，每行一条变更事件：
+#   {"version": 12, "ts": 1700000000.123, "entity": "budget", "op": "add", "id": 5, "record": {...}}
+# version 在同一用户内单调递增。写入在数据文件保存之后进行，并用文件锁保证多个进程（Web 进程、
+# Agent 调用的工具子进程）写入时版本号不重复、不乱序。读取方记住上次读到的字节位置，
+# 只需 stat 一次就知道有没有新事件（见 web/changes.py）。
+# 文件超过 CHANGEFEED_MAX_BYTES 时只保留最近 CHANGEFEED_KEEP 条；落后太多的读取方收到 reset，整体刷新。
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只有单进程写入时才可靠
+    fcntl = None
+
+try:
+    from config import CHANGES_FILE, CHANGEFEED_MAX_BYTES, CHANGEFEED_KEEP
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import CHANGES_FILE, CHANGEFEED_MAX_BYTES, CHANGEFEED_KEEP
+
+from tools import records
+from tools.userdata import ensure_parent, user_path
+
+
+def feed_path(user_id: Optional[str] = None) -> Path:
+    return user_path(CHANGES_FILE, user_id)
+
+
+def event(entity: str, op: str, record_id=None, record: Optional[Dict] = None, **extra) -> Dict:
+    """构造一条尚未编号的变更事件；version/ts 在 publish 时填入"""
+    ev = {"entity": entity, "op": op, "id": record_id}
+    if record is not None:
+        ev["record"] = record
+    ev.update(extra)
+    return ev
+
+
+@contextmanager
+def _locked(f):
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _last_version(f) -> int:
+    """从文件末尾往回读最后一行取版本号，不读整个文件"""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    chunk = 4096
+    while True:
+        start = max(0, end - chunk)
+        f.seek(start)
+        tail = f.read(end - start)
+        lines = tail.rstrip(b"\n").split(b"\n")
+        if len(lines) > 1 or start == 0:
+            break
+        chunk *= 4
+    for line in reversed(lines):
+        try:
+            return int(json.loads(line)["version"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return 0
+
+
+def publish(events: Iterable[Dict], user_id: Optional[str] = None) -> int:
+    """给事件依次编号并追加到当前用户的变更流，返回最后一个版本号（没有事件时返回 0）"""
+    events = list(events)
+    if not events:
+        return 0
+    path = ensure_parent(feed_path(user_id))
+    now = round(time.time(), 3)
+    while True:
+        with open(path, "a+b") as f, _locked(f):
+            try:
+                if os.fstat(f.fileno()).st_ino != os.stat(path).st_ino:
+                    continue  # 等锁期间文件被另一个进程压缩替换，重新打开
+            except FileNotFoundError:
+                continue
+            version = _last_version(f)
+            lines = []
+            for ev in events:
+                version += 1
+                lines.append(records.dumps({"version": version, "ts": now, **ev}))
+            f.seek(0, os.SEEK_END)
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            if f.tell() > CHANGEFEED_MAX_BYTES:
+                _compact(path, f, CHANGEFEED_KEEP)
+            return version
+
+
+def _compact(path: Path, f, keep: int):
+    """只保留最近 keep 条：写临时文件后原子替换；已打开旧文件的读取方通过 inode 变化发现"""
+    f.seek(0)
+    lines = f.read().splitlines()[-keep:]
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as out:
+        out.write(b"\n".join(lines) + b"\n")
+    os.replace(tmp, path)
+
+
+class Recorder:
+    """CLI 模块里的事件收集：普通调用立即发布；批处理期间先攒着，数据保存后一次发布"""
+
+    def __init__(self, entity: str):
+        self.entity = entity
+        self._pending: Optional[List[Dict]] = None
+
+    def begin(self):
+        self._pending = []
+
+    def commit(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            self._publish(pending)
+
+    def discard(self):
+        self._pending = None
+
+    def __call__(self, op: str, record_id=None, record: Optional[Dict] = None, **extra):
+        ev = event(self.entity, op, record_id, record, **extra)
+        if self._pending is not None:
+            self._pending.append(ev)
+            return
+        self._publish([ev])
+
+    @staticmethod
+    def _publish(events: List[Dict]):
+        try:
+            publish(events)
+        except OSError as e:
+            # 变更流只影响页面的实时刷新，写不进去不能让数据写入失败
+            print(f"[changefeed] 发布失败: {e}", file=sys.stderr)
+
+
+def read_since(cursor: Optional[Tuple[int, int]], user_id: Optional[str] = None) -> Tuple[List[Dict], Tuple[int, int], bool]:
+    """从游标 (inode, 字节位置) 读到文件末尾，返回 (事件列表, 新游标, 文件是否被替换过)
+
+    只返回完整的行；写入方正写到一半的最后一行留到下次读取。文件被压缩替换（inode 变化）时
+    返回 replaced=True 且不读取，调用方应改用 events_after 按版本号补齐。
+    """
+    path = feed_path(user_id)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return [], (0, 0), cursor is not None and cursor[0] != 0
+    # 游标 inode 为 0 表示上次读取时文件还不存在
+    ino, offset = cursor if cursor and cursor[0] else (st.st_ino, 0)
+    if ino != st.st_ino or st.st_size < offset:
+        return [], (st.st_ino, 0), True
+    if st.st_size == offset:
+        return [], (ino, offset), False
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(st.st_size - offset)
+    cut = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:cut].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            continue
+    return events, (ino, offset + cut), False
+
+
+def events_after(version: int, user_id: Optional[str] = None) -> Tuple[List[Dict], Tuple[int, int], bool]:
+    """读出版本号大于 version 的事件（断线重连或文件被压缩后用），返回 (事件列表, 游标, 是否已有事件被丢弃)"""
+    events, cursor, _ = read_since(None, user_id)
+    missed = bool(events) and events[0]["version"] > version + 1
+    return [e for e in events if e["version"] > version], cursor, missed
+
+
+def tail(user_id: Optional[str] = None) -> Tuple[Tuple[int, int], int]:
+    """当前文件末尾的游标和最新版本号，新的读取方从这里开始只看之后的事件"""
+    try:
+        with open(feed_path(user_id), "rb") as f:
+            st = os.fstat(f.fileno())
+            return (st.st_ino, st.st_size), _last_version(f)
+    except FileNotFoundError:
+        return (0, 0), 0
+
+
+def current_version(user_id: Optional[str] = None) -> int:
+    path = feed_path(user_id)
+    try:
+        with open(path, "rb") as f:
+            return _last_version(f)
+    except FileNotFoundError:
+        return 0
@@ -1,5 +1,4 @@
 import argparse
-import json
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -10,6 +9,10 @@ except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
     from config import COURSE_FILE
 
+from tools import batch, records, stream
+from tools.timetable import Timetable
+from tools.userdata import ensure_parent, mark_changed, stores, user_path
+
 DEFAULT_COURSES = [
     {"weekday": 0, "time": "08:00-09:40", "name": "高等数学", "location": "A301"},
     {"weekday": 0, "time": "14:00-15:40", "name": "大学物理", "location": "B102"},
@@ -21,17 +24,36 @@ DEFAULT_COURSES = [
 ]
 
 def load_data():
-    if not COURSE_FILE.exists():
+    path = user_path(COURSE_FILE)
+    if not path.exists():
         # 初始化默认数据
-        with open(COURSE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(DEFAULT_COURSES, f, ensure_ascii=False, indent=2)
-        return DEFAULT_COURSES
+        records.dump_file(DEFAULT_COURSES, ensure_parent(path))
+        mark_changed(path)
+        return records.decode_courses(DEFAULT_COURSES)
     
     try:
-        with open(COURSE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        raw = records.load_file(path)
+    except records.DecodeError:
         return []
+    return records.decode_courses(raw, path.name)
+
+def get_timetable():
+    """获取当前用户编译好的课表；courses.json 未变化时直接复用"""
+    path = user_path(COURSE_FILE)
+    if not path.exists():
+        load_data()
+    return stores.get("timetable", path, lambda: Timetable(load_data()))
+
+def parse_date(date_str):
+    """today/tomorrow/YYYY-MM-DD -> date；无效时返回 None"""
+    if date_str == 'today':
+        return datetime.now().date()
+    elif date_str == 'tomorrow':
+        return (datetime.now() + timedelta(days=1)).date()
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
 
 def get_weekday_from_date(date_str):
     if date_str == 'today':
@@ -45,9 +67,12 @@ def get_weekday_from_date(date_str):
     except ValueError:
         return -1
 
-def query_courses(date=None, weekday=None):
-    data = load_data()
+WEEKDAYS_ZH = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+def query_courses(date=None, weekday=None, week=None):
+    timetable = get_timetable()
     target_weekday = -1
+    target_week = week
     
     if weekday:
         weekdays_map = {
@@ -57,35 +82,122 @@ def query_courses(date=None, weekday=None):
             "周五": 4, "周六": 5, "周日": 6
         }
         target_weekday = weekdays_map.get(str(weekday).lower(), -1)
+        if target_week is None and target_weekday != -1:
+            # 按星期查询时默认是本周
+            target_week = timetable.week_of(datetime.now().date())
     elif date:
-        target_weekday = get_weekday_from_date(date)
+        day = parse_date(date)
+        if day is not None:
+            target_weekday = day.weekday()
+            target_week = timetable.week_of(day)
     
     if target_weekday == -1:
         return {"success": False, "message": "日期或星期格式无效"}
         
-    results = [c for c in data if c['weekday'] == target_weekday]
-    # 按时间排序
-    results.sort(key=lambda x: x['time'])
-    
-    weekdays_zh = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+    # 查表即可，课表在编译时已按时间排好序
+    results = list(timetable.lookup(target_week, target_weekday))
     
-    return {
+    result = {
         "success": True, 
-        "weekday": weekdays_zh[target_weekday],
+        "weekday": WEEKDAYS_ZH[target_weekday],
         "data": results
     }
+    if timetable.semester_start is not None:
+        result["week"] = target_week
+    return result
 
-if __name__ == "__main__":
+def current_course(now=None):
+    """当前正在上的课和今天的下一节课"""
+    now = now or datetime.now()
+    current, upcoming = get_timetable().current_and_next(now)
+    return {"success": True, "time": now.strftime("%Y-%m-%d %H:%M"), "current": current, "next": upcoming}
+
+def free_periods(date="today"):
+    """某天没有课的时间段（08:00-22:00）"""
+    day = parse_date(date)
+    if day is None:
+        return {"success": False, "message": "日期格式无效"}
+    free = get_timetable().free_periods(day)
+    return {"success": True, "date": day.strftime("%Y-%m-%d"),
+            "data": [{"start": s, "end": e} for s, e in free]}
+
+def export_ics(out, start=None, end=None):
+    """把课表逐行写入 out（文件对象），返回写出的课程实例数"""
+    timetable = get_timetable()
+    start_day = parse_date(start) if start else None
+    end_day = parse_date(end) if end else None
+    count = 0
+    for line in timetable.iter_ics(start_day, end_day):
+        if line == "BEGIN:VEVENT\r\n":
+            count += 1
+        out.write(line)
+    return count
+
+def build_parser():
     parser = argparse.ArgumentParser(description="课程表查询工具")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
     query_parser = subparsers.add_parser("query", help="查询课程")
     query_parser.add_argument("--date", help="日期 YYYY-MM-DD/today/tomorrow")
     query_parser.add_argument("--weekday", help="星期 monday/周一")
+    query_parser.add_argument("--week", type=int, help="教学周（仅按星期查询时使用）")
     
-    args = parser.parse_args()
+    subparsers.add_parser("now", help="当前/下一节课")
+    
+    free_parser = subparsers.add_parser("free", help="某天的空闲时段")
+    free_parser.add_argument("--date", default="today", help="日期 YYYY-MM-DD/today/tomorrow")
     
+    ics_parser = subparsers.add_parser("export-ics", help="导出 ICS 日历")
+    ics_parser.add_argument("--output", help="输出文件，默认写到标准输出")
+    ics_parser.add_argument("--start", help="开始日期，默认学期第一周")
+    ics_parser.add_argument("--end", help="结束日期，默认学期最后一周")
+    
+    # batch
+    batch.add_batch_parser(subparsers)
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
     if args.command == "query":
-        print(json.dumps(query_courses(args.date, args.weekday), ensure_ascii=False))
+        return query_courses(args.date, args.weekday, args.week)
+    elif args.command == "now":
+        return current_course()
+    elif args.command == "free":
+        return free_periods(args.date)
+    elif args.command == "export-ics":
+        if not args.output:
+            return {"success": False, "error": "批处理中导出 ICS 需要指定 --output"}
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            count = export_ics(f, args.start, args.end)
+        return {"success": True, "file": args.output, "count": count}
+    return None
+
+def run_batch(ops):
+    """批量执行多条查询，只启动一次进程"""
+    results = batch.run_ops(build_parser(), run_command, ops)
+    return {"success": True, "count": len(results), "results": results}
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if args.command == "batch":
+        try:
+            print(records.dumps(run_batch(batch.read_ops(args.ops))))
+        except records.RecordError as e:
+            print(records.dumps({"success": False, "error": str(e)}))
+        except ValueError as e:
+            print(records.dumps({"success": False, "error": f"批处理输入无效: {e}"}))
+    elif args.command == "export-ics" and not args.output:
+        # 直接流式写到标准输出
+        export_ics(sys.stdout, args.start, args.end)
     else:
-        parser.print_help()
+        try:
+            result = run_command(args)
+        except records.RecordError as e:
+            # 数据文件里有不合规的记录：报出文件和记录位置，而不是抛出堆栈
+            result = {"success": False, "error": str(e)}
+        if result is None:
+            parser.print_help()
+        else:
+            stream.print_result(result)
@@ -0,0 +1,126 @@
+# 跨进程的数据版本号
+# data/versions.db（SQLite，WAL 模式）里每个 (用户, 数据集) 一行版本号，数据集即数据文件名（budget、schedule……）。
+# 工具子进程和各个 Web worker 每次保存数据文件后 bump 一次（userdata.mark_changed）；进程内缓存（userdata.StoreCache）把版本号
+# 作为缓存签名的一部分，版本号没变就复用，变了只重建对应的数据集。
+#
+# 检查很便宜：先查 PRAGMA data_version（只看 WAL 索引，不读数据页），自上次检查以来没有其他连接提交过
+# 就直接用进程内记住的版本号；有提交时才重新读当前用户的几行。自己的 bump 不会改变本连接的 data_version，
+# 所以 bump 后直接更新进程内的记录。
+#
+# 数据库不可用（只读目录等）时版本号恒为 0，缓存退回只按文件 mtime/size 判断，与原先行为一致。
+import os
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    from config import VERSIONS_DB
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import VERSIONS_DB
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    user TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user, dataset)
+) WITHOUT ROWID
+"""
+
+
+def dataset_of(path: Path) -> str:
+    """数据文件对应的数据集名，如 budget.json -> budget"""
+    return Path(path).stem
+
+
+class DataVersions:
+    def __init__(self, path: Path = VERSIONS_DB):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 打开连接的进程；fork 出的 worker 不能沿用父进程的连接
+        self._pid = None
+        self._failed = False
+        # 上次检查时的 PRAGMA data_version；变化说明有其他连接提交过
+        self._seen = None
+        # user -> {dataset: version}，只保存访问过的用户
+        self._known: Dict[str, Dict[str, int]] = {}
+        self.checks = 0
+        self.reloads = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._failed:
+            return None
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        self._seen = None
+        self._known.clear()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+        except (sqlite3.Error, OSError) as e:
+            print(f"[数据版本] 无法打开 {self.path}，退回按文件 mtime 判断缓存: {e}", file=sys.stderr)
+            self._failed = True
+            return None
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def _refresh(self, conn: sqlite3.Connection):
+        self.checks += 1
+        seen = conn.execute("PRAGMA data_version").fetchone()[0]
+        if seen != self._seen:
+            self._seen = seen
+            self._known.clear()
+
+    def get(self, dataset: str, user_id: str) -> int:
+        """当前版本号；从未写入过的数据集为 0"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                self._refresh(conn)
+                known = self._known.get(user_id)
+                if known is None:
+                    self.reloads += 1
+                    rows = conn.execute("SELECT dataset, version FROM versions WHERE user = ?", (user_id,))
+                    known = self._known[user_id] = dict(rows.fetchall())
+            except sqlite3.Error:
+                return 0
+            return known.get(dataset, 0)
+
+    def bump(self, dataset: str, user_id: str) -> int:
+        """数据集被写入后调用，返回新的版本号"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return 0
+            try:
+                # 先确认此前其他连接的提交已经反映到 _known，再记下自己的这一次
+                self._refresh(conn)
+                version = conn.execute(
+                    "INSERT INTO versions (user, dataset, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT (user, dataset) DO UPDATE SET version = version + 1 RETURNING version",
+                    (user_id, dataset)).fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"[数据版本] 更新 {user_id}/{dataset} 失败: {e}", file=sys.stderr)
+                return 0
+            known = self._known.get(user_id)
+            if known is not None:
+                known[dataset] = version
+            return version
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"available": self._conn is not None, "checks": self.checks, "reloads": self.reloads,
+                    "users": len(self._known)}
+
+
+versions = DataVersions()
@@ -1,5 +1,4 @@
 import argparse
-import json
 import sys
 from datetime import datetime
 from pathlib import Path
@@ -10,18 +9,35 @@ except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
     from config import MEMORY_FILE
 
+from tools import batch, changefeed, records, stream
+from tools.records import Memory
+from tools.userdata import ensure_parent, mark_changed, user_path
+
+# 批处理事务：批内所有操作共享同一份数据，结束时统一保存一次
+_txn = None
+# 数据变更事件（Web 页面据此实时刷新）
+changes = changefeed.Recorder("memory")
+
 def load_data():
-    if not MEMORY_FILE.exists():
+    if _txn is not None:
+        return _txn["data"]
+    path = user_path(MEMORY_FILE)
+    if not path.exists():
         return []
     try:
-        with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        raw = records.load_file(path)
+    except records.DecodeError:
         return []
+    return records.decode_list(Memory, raw, path.name)
 
 def save_data(data):
-    with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if _txn is not None:
+        _txn["data"] = data
+        _txn["dirty"] = True
+        return
+    path = ensure_parent(user_path(MEMORY_FILE))
+    records.dump_file(data, path)
+    mark_changed(path)
 
 def save_memory(role, content):
     data = load_data()
@@ -30,15 +46,19 @@ def save_memory(role, content):
     if data:
         new_id = max(item['id'] for item in data) + 1
         
-    new_item = {
-        "id": new_id,
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    try:
+        new_item = Memory(
+            id=new_id,
+            role=role,
+            content=content,
+            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    except records.RecordError as e:
+        return {"success": False, "message": str(e)}
     
     data.append(new_item)
     save_data(data)
+    changes("add", new_id, new_item)
     return {"success": True, "message": "已保存记忆"}
 
 def query_memory(keyword):
@@ -54,7 +74,7 @@ def query_memory(keyword):
     
     return {"success": True, "data": results[:5]} # 最多返回5条
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(description="记忆检索工具")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
@@ -67,11 +87,54 @@ if __name__ == "__main__":
     save_parser.add_argument("--role", required=True, choices=["user", "assistant"])
     save_parser.add_argument("--content", required=True)
     
-    args = parser.parse_args()
-    
+    # batch
+    batch.add_batch_parser(subparsers)
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
     if args.command == "query":
-        print(json.dumps(query_memory(args.keyword), ensure_ascii=False))
+        return query_memory(args.keyword)
     elif args.command == "save":
-        print(json.dumps(save_memory(args.role, args.content), ensure_ascii=False))
+        return save_memory(args.role, args.content)
+    return None
+
+def run_batch(ops):
+    """批量执行：整个批次只加载一次、保存一次"""
+    global _txn
+    _txn = {"data": load_data(), "dirty": False}
+    changes.begin()
+    try:
+        results = batch.run_ops(build_parser(), run_command, ops)
+    except BaseException:
+        changes.discard()
+        raise
+    finally:
+        txn, _txn = _txn, None
+    if txn["dirty"]:
+        save_data(txn["data"])
+    # 数据落盘后再发布批内的全部变更
+    changes.commit()
+    return {"success": True, "count": len(results), "results": results}
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if args.command == "batch":
+        try:
+            print(records.dumps(run_batch(batch.read_ops(args.ops))))
+        except records.RecordError as e:
+            print(records.dumps({"success": False, "error": str(e)}))
+        except ValueError as e:
+            print(records.dumps({"success": False, "error": f"批处理输入无效: {e}"}))
     else:
-        parser.print_help()
+        try:
+            result = run_command(args)
+        except records.RecordError as e:
+            # 数据文件里有不合规的记录：报出文件和记录位置，而不是抛出堆栈
+            result = {"success": False, "error": str(e)}
+        if result is None:
+            parser.print_help()
+        else:
+            stream.print_result(result)
@@ -0,0 +1,464 @@
+# 数据记录的类型定义与编解码
+# 账单、日程、课程、记忆四类记录用 __slots__ 类表示：加载时逐字段校验并做无损的类型转换
+# （例如 "12.5" -> 12.5），缺字段、类型不对在读入时就报出“哪个文件第几条记录的哪个字段”，
+# 而不是在 calculate_balance 深处变成 KeyError。每条记录不再带一个 dict，取值有限的字段（类型、类别、
+# 日期）共用同一个字符串对象，常驻内存不到 dict 的一半（见 eval/records_bench.py）。
+#
+# 记录同时支持原有的字典写法（r["amount"]、r.get("note")、"repeat" in r、dict(r)），
+# 工具和 Web 端的现有代码不用改；模板里也可以直接用属性 record.amount。
+# 值为 None 的可选字段视同不存在，编码时省略，与原先的 JSON 文件逐字段一致。
+#
+# 编码统一走 dumps/dump_file：安装了 msgspec 时用它（比标准库 json 快数倍），否则用标准库 json。
+# 工具输出用紧凑格式；数据文件保持原先的两格缩进（不转义中文），仍可手工编辑和逐行 diff。
+# dump_file 先写临时文件再原子替换，保存失败不会留下半个数据文件。
+# 工具输出、数据文件、变更流和 ToolExecutor 的解析都用这里的函数。
+import json
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖：没有安装时退回标准库 json
+    msgspec = None
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TIME_RE = re.compile(r"^\d{1,2}:\d{2}$")
+
+REQUIRED = object()
+
+
+class RecordError(ValueError):
+    """数据文件中的记录不符合类型定义"""
+
+
+def _check_int(value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    raise TypeError
+
+
+def _check_float(value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    if isinstance(value, str):
+        return float(value)
+    raise TypeError
+
+
+def _check_sym(value):
+    if type(value) is str:
+        return sys.intern(value)
+    return sys.intern(_check_str(value))
+
+
+def _check_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError
+
+
+def _check_date(value):
+    if isinstance(value, str) and _DATE_RE.match(value):
+        return sys.intern(value)
+    raise TypeError
+
+
+def _check_time(value):
+    if isinstance(value, str) and _TIME_RE.match(value.strip()):
+        hour, minute = value.strip().split(":")
+        if int(hour) < 24 and int(minute) < 60:
+            return value
+    raise TypeError
+
+
+def _check_dict(value):
+    if isinstance(value, dict):
+        return value
+    raise TypeError
+
+
+def _check_list(value):
+    if isinstance(value, list):
+        return value
+    raise TypeError
+
+
+def _check_any(value):
+    return value
+
+
+# 类型名 -> (校验/转换函数, 报错时的说明, 无需转换的 Python 类型)
+# 值恰好是第三项的类型时跳过校验函数（绝大多数记录走这条路）；None 表示总要调用校验函数。
+# sym 是取值有限的字符串（类型、类别），解码时 intern，多条记录共用一个对象。
+CHECKS = {
+    "int": (_check_int, "整数", int),
+    "float": (_check_float, "数字", float),
+    "str": (_check_str, "字符串", str),
+    "sym": (_check_sym, "字符串", None),
+    "date": (_check_date, "YYYY-MM-DD 格式的日期", None),
+    "time": (_check_time, "HH:MM 格式的时间", None),
+    "dict": (_check_dict, "对象", dict),
+    "list": (_check_list, "数组", list),
+    "any": (_check_any, "任意值", object),
+}
+
+
+class Record:
+    """记录基类；子类用 FIELDS 声明 (字段名, 类型名, 默认值)，默认值为 REQUIRED 表示必填"""
+
+    __slots__ = ("_extra",)
+    FIELDS: Tuple[Tuple[str, str, Any], ...] = ()
+    # 字段值的可选取值范围 {字段名: 允许的值}
+    CHOICES: Dict[str, Tuple] = {}
+
+    def __init__(self, **values):
+        # 直接构造的记录与读入的记录一样逐字段校验，不合法的值在保存之前就报出来
+        self._assign(values)
+
+    @classmethod
+    def decode(cls, raw, where: str = ""):
+        """校验并转换一条原始记录（来自 JSON 的 dict）；where 是出错时报告的位置"""
+        try:
+            return cls._decode(raw)
+        except RecordError as e:
+            if not where:
+                raise
+            raise RecordError(f"{where}: {e}") from None
+
+    @classmethod
+    def _decode(cls, raw):
+        if isinstance(raw, cls):
+            return raw
+        if not isinstance(raw, dict):
+            raise RecordError(f"记录必须是对象，实际是 {type(raw).__name__}")
+        obj = cls.__new__(cls)
+        obj._assign(raw)
+        return obj
+
+    @classmethod
+    def _convert(cls, name, check, exact, choices, value):
+        if type(value) is not exact and exact is not object:
+            try:
+                value = check(value)
+            except (TypeError, ValueError):
+                kind = cls._KINDS[name]
+                raise RecordError(f"字段 {name} 应为{CHECKS[kind][1]}，实际是 {value!r}") from None
+        if choices and value not in choices:
+            raise RecordError(f"字段 {name} 只能是 {'/'.join(choices)}，实际是 {value!r}")
+        return value
+
+    def _assign(self, raw: Dict):
+        found = 0
+        for name, check, exact, default, choices in self._SPEC:
+            value = raw.get(name)
+            if value is None:
+                if default is REQUIRED:
+                    raise RecordError(f"缺少字段 {name}")
+                value = default
+            else:
+                found += 1
+                value = self._convert(name, check, exact, choices, value)
+            setattr(self, name, value)
+        extra = None
+        if len(raw) > found:
+            # 有未声明的字段（或值为 null 的字段）：未声明的原样保留，编码时写回
+            known = self._NAMES
+            extra = {k: v for k, v in raw.items() if k not in known} or None
+        self._extra = extra
+        self.validate()
+
+    def validate(self):
+        """跨字段的校验，子类按需覆盖"""
+
+    def to_dict(self) -> Dict:
+        data = {}
+        for name, _, default in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None or default is REQUIRED:
+                data[name] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    # ---- 与 dict 兼容的写法 ----
+
+    def __getitem__(self, key):
+        if key in self._NAMES:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._NAMES:
+            # 修改已有记录的字段同样校验（update_* 在保存前就能发现不合法的值）
+            name, check, exact, default, choices = self._FIELD_SPEC[key]
+            if value is None:
+                if default is REQUIRED:
+                    raise RecordError(f"缺少字段 {name}")
+            else:
+                value = self._convert(name, check, exact, choices, value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._NAMES and getattr(self, key) is not None:
+            setattr(self, key, None)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._NAMES = frozenset(name for name, _, _ in cls.FIELDS)
+        cls._KINDS = {name: kind for name, kind, _ in cls.FIELDS}
+        # decode 用的预展开字段表：(字段名, 校验函数, 无需转换的类型, 默认值, 可选取值)
+        cls._SPEC = tuple((name, CHECKS[kind][0], CHECKS[kind][2], default, cls.CHOICES.get(name))
+                          for name, kind, default in cls.FIELDS)
+        cls._FIELD_SPEC = {spec[0]: spec for spec in cls._SPEC}
+
+
+class BudgetRecord(Record):
+    FIELDS = (
+        ("id", "int", REQUIRED),
+        ("type", "sym", REQUIRED),
+        ("amount", "float", REQUIRED),
+        ("category", "sym", ""),
+        ("note", "str", ""),
+        ("date", "date", REQUIRED),
+        ("created_at", "str", None),
+        ("import_hash", "str", None),
+    )
+    CHOICES = {"type": ("expense", "income")}
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+
+class ScheduleItem(Record):
+    FIELDS = (
+        ("id", "int", REQUIRED),
+        ("date", "date", REQUIRED),
+        ("time", "time", REQUIRED),
+        ("event", "str", REQUIRED),
+        ("duration", "int", None),
+        ("created_at", "str", None),
+        ("repeat", "dict", None),
+    )
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+
+class Course(Record):
+    FIELDS = (
+        ("name", "str", REQUIRED),
+        ("weekday", "int", REQUIRED),
+        ("time", "str", None),
+        ("periods", "list", None),
+        ("location", "str", None),
+        ("weeks", "any", None),
+        ("parity", "str", None),
+    )
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+    def validate(self):
+        if not 0 <= self.weekday <= 6:
+            raise RecordError(f"字段 weekday 应在 0-6 之间，实际是 {self.weekday}")
+        if self.time is None and not self.periods:
+            raise RecordError("课程需要 time 或 periods")
+
+
+class Memory(Record):
+    FIELDS = (
+        ("id", "int", REQUIRED),
+        ("role", "sym", REQUIRED),
+        ("content", "str", REQUIRED),
+        ("timestamp", "str", None),
+    )
+    __slots__ = tuple(name for name, _, _ in FIELDS)
+
+
+def decode_list(cls, items, source: str) -> List:
+    """校验一个记录列表；出错时指出文件名和第几条记录（从 1 开始）"""
+    if not isinstance(items, list):
+        raise RecordError(f"{source}: 记录列表必须是数组")
+    decode = cls._decode
+    out = []
+    for i, raw in enumerate(items, 1):
+        try:
+            out.append(decode(raw))
+        except RecordError as e:
+            raise RecordError(f"{source} 第 {i} 条记录: {e}") from None
+    return out
+
+
+def decode_courses(raw, source: str = "courses.json"):
+    """课表文件有列表（旧格式）和 {"semester", "periods", "courses"}（新格式）两种写法"""
+    if isinstance(raw, dict):
+        return dict(raw, courses=decode_list(Course, raw.get("courses") or [], source))
+    return decode_list(Course, raw or [], source)
+
+
+# ---- 编解码 ----
+
+def to_builtins(obj):
+    """把结果里的记录对象换成 dict（交给只认 dict 的代码，如结果编码、流式输出之外的调用方）"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, dict):
+        return {k: to_builtins(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_builtins(v) for v in obj]
+    return obj
+
+
+def _default(obj):
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"无法编码 {type(obj).__name__}")
+
+
+if msgspec is not None:
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+    def dumps_bytes(obj) -> bytes:
+        return _encoder.encode(obj)
+
+    def loads(data):
+        return _decoder.decode(data)
+
+    def file_bytes(obj) -> bytes:
+        return msgspec.json.format(_encoder.encode(obj), indent=2)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+    def dumps_bytes(obj) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
+
+    _file_encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+
+    def file_bytes(obj) -> bytes:
+        # 缩进时标准库走纯 Python 编码器，先整体转成 dict 比逐条回调 default 快
+        return _file_encoder.encode(to_builtins(obj)).encode("utf-8")
+
+
+def dumps(obj) -> str:
+    """紧凑 JSON 文本（不转义中文）；记录对象按 to_dict 编码"""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+# 目录也要 fsync 才能保证改名落盘；Windows 下不能打开目录，跳过
+_O_DIRECTORY = getattr(os, "O_DIRECTORY", None)
+# 导入时读一次 umask（os.umask 只能先改再改回，不适合在多线程里调用）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path: Path, data: bytes, sync: bool = True):
+    """先写同目录下的临时文件并落盘，再原子替换：写到一半出错或断电时原文件保持完整
+
+    临时文件名由 mkstemp 生成，同一进程里多个线程同时保存同一个文件也各写各的，最后一次替换生效。
+    sync 时替换后再同步目录，保证改名本身也已落盘。
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # mkstemp 建的文件只有属主可读写，改成原文件（或新建文件时默认）的权限
+            try:
+                mode = os.stat(path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o666 & ~_UMASK
+            if os.chmod in os.supports_fd:
+                os.chmod(f.fileno(), mode)
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    if sync and _O_DIRECTORY is not None:
+        dir_fd = os.open(path.parent, os.O_RDONLY | _O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def dump_file(obj, path: Path):
+    write_atomic(Path(path), file_bytes(obj))
+
+
+def load_file(path: Path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+# 解码失败（文件不是合法 JSON）时的异常类型
+DecodeError = (json.JSONDecodeError, msgspec.DecodeError) if msgspec is not None else (json.JSONDecodeError,)
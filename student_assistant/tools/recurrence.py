@@ -0,0 +1,69 @@
+# 重复日程（类 RRULE）的惰性展开
+# 重复日程在 schedule.json 中只存一条：date 为首次发生日期，repeat 描述规则，例如
+#   {"freq": "weekly", "interval": 2, "until": "2026-06-30", "exdates": ["2026-05-01"]}
+# 查询时只在窗口内按需生成发生日期，成本与窗口长度有关，与总发生次数无关。
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+FREQ_DAYS = {"daily": 1, "weekly": 7}
+
+# CLI/Web 上的快捷写法 -> (freq, interval)
+REPEAT_PRESETS = {
+    "daily": ("daily", 1),
+    "weekly": ("weekly", 1),
+    "biweekly": ("weekly", 2),
+}
+
+
+def _parse(date_str: str):
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+
+def make_rule(repeat: str, until: Optional[str] = None, exdates=None) -> dict:
+    """根据快捷写法生成 repeat 规则；不支持的写法抛 ValueError"""
+    if repeat not in REPEAT_PRESETS:
+        raise ValueError(f"不支持的重复规则: {repeat}")
+    freq, interval = REPEAT_PRESETS[repeat]
+    rule = {"freq": freq, "interval": interval}
+    if until:
+        _parse(until)
+        rule["until"] = until
+    if exdates:
+        rule["exdates"] = sorted(set(exdates))
+    return rule
+
+
+def is_recurring(item: dict) -> bool:
+    return isinstance(item.get("repeat"), dict)
+
+
+def iter_occurrence_dates(item: dict, start_date: str, end_date: str) -> Iterator[str]:
+    """生成 item 在 [start_date, end_date] 内的所有发生日期"""
+    rule = item["repeat"]
+    step = FREQ_DAYS.get(rule.get("freq"), 7) * max(1, int(rule.get("interval", 1)))
+    first = _parse(item["date"])
+    window_start, window_end = _parse(start_date), _parse(end_date)
+    if rule.get("until"):
+        window_end = min(window_end, _parse(rule["until"]))
+    if window_end < first:
+        return
+
+    # 直接跳到窗口内的第一次发生，而不是从首次日期逐个迭代
+    offset = (window_start - first).days
+    k = max(0, -(-offset // step))
+    current = first + timedelta(days=k * step)
+    exdates = set(rule.get("exdates", ()))
+    while current <= window_end:
+        d = current.isoformat()
+        if d not in exdates:
+            yield d
+        current += timedelta(days=step)
+
+
+def occurrences(item: dict, start_date: str, end_date: str) -> Iterator[dict]:
+    """生成窗口内的发生实例，实例保留原日程的 id，date 为当次日期"""
+    for d in iter_occurrence_dates(item, start_date, end_date):
+        occ = dict(item)
+        occ["date"] = d
+        occ["series_start"] = item["date"]
+        yield occ
@@ -0,0 +1,434 @@
+# 日程与课程提醒
+# 每个提醒来源（一条日程、一条重复日程、整张课表）是一个按时间递增的“下一次提醒”迭代器，
+# 堆里每个来源只放一项 (提醒时刻, 序号, 来源键, 代次, 开始时间, 类型, 原始记录)，相当于多路归并：
+# 到期项取出后只推进这一个来源的迭代器，重复日程和课表不会预先展开。
+# 日程变化时按变更流（tools/changefeed.py）只替换对应的来源，旧堆项靠代次号惰性丢弃；
+# 课表文件变化时只重建课表来源。两次提醒之间只睡眠，每隔 REMINDER_CHECK_INTERVAL 秒 stat 一次
+# 变更流和课表文件，不重新扫描 schedule.json，空闲时的 CPU 占用与日程数量无关。
+#
+# 同一数据目录只允许一个进程投递提醒：调度前先抢 data/reminders.lock 上的文件锁，
+# 多个 Web worker（uvicorn --workers N）或 Web 端加独立守护进程同时开启时，只有抢到锁的那个投递，
+# 其余的定期重试，持锁进程退出后由其中一个接替。
+#
+# 用法（独立守护进程；Web 端设置 REMINDERS_ENABLED=true 时在后台任务里运行同样的调度器）：
+#     python tools/reminders.py --sinks console,webhook --webhook-url http://127.0.0.1:8766/hook
+#     python tools/reminders.py --upcoming 10
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，不做进程间互斥
+    fcntl = None
+
+try:
+    from config import COURSE_FILE, REMINDER_LOCK_FILE
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import COURSE_FILE, REMINDER_LOCK_FILE
+
+from tools import changefeed, course_cli, schedule_cli
+from tools.recurrence import is_recurring, iter_occurrence_dates
+from tools.userdata import use_user, user_path
+
+# 重复日程不设截止日期时迭代器的窗口终点；迭代是惰性的，不会真的展开到这一天
+FAR_FUTURE = "9999-12-31"
+COURSE_KEY = ("course", None)
+
+# (提醒时刻, 开始时间, 类型, 原始记录)；提醒内容在真正到期时才构造，全量构建时不为每条日程建字典
+Fire = Tuple[float, datetime, str, Dict]
+
+
+def _start(date: str, hhmm: str) -> datetime:
+    # fromisoformat 比 strptime 快一个数量级，全量构建时每条日程都要解析一次；
+    # 它要求两位小时，而数据文件允许 "8:00"，补齐后再解析
+    hhmm = hhmm.strip()
+    if len(hhmm) == 4:
+        hhmm = "0" + hhmm
+    return datetime.fromisoformat(f"{date}T{hhmm}")
+
+
+def make_reminder(kind: str, record: Dict, start: datetime, lead: timedelta) -> Dict:
+    reminder = {
+        "kind": kind,
+        "id": record.get("id") if kind == "schedule" else None,
+        "title": record.get("event" if kind == "schedule" else "name", ""),
+        "start": start.strftime("%Y-%m-%d %H:%M"),
+        "minutes_before": int(lead.total_seconds() // 60),
+    }
+    if record.get("location"):
+        reminder["location"] = record["location"]
+    return reminder
+
+
+def schedule_fires(item: Dict, after: datetime, lead: timedelta) -> Iterator[Fire]:
+    """一条日程在 after 之后开始的每次发生，按时间顺序生成 Fire"""
+    if is_recurring(item):
+        return _recurring_fires(item, after, lead)
+    # 一次性日程最多一项，不必创建生成器
+    try:
+        start = _start(item["date"], item["time"])
+    except (KeyError, TypeError, ValueError):
+        return iter(())
+    if start <= after:
+        return iter(())
+    return iter((((start - lead).timestamp(), start, "schedule", item),))
+
+
+def _recurring_fires(item: Dict, after: datetime, lead: timedelta) -> Iterator[Fire]:
+    for date in iter_occurrence_dates(item, after.date().isoformat(), FAR_FUTURE):
+        try:
+            start = _start(date, item["time"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if start > after:
+            yield (start - lead).timestamp(), start, "schedule", item
+
+
+def course_fires(timetable, after: datetime, lead: timedelta) -> Iterator[Fire]:
+    """整张课表在 after 之后的每一节课；新格式课表到学期结束为止，旧格式每周重复"""
+    if not timetable.courses:
+        return
+    end = None
+    if timetable.semester_start is not None:
+        end = timetable.semester_start + timedelta(weeks=timetable.total_weeks)
+    day = after.date()
+    while end is None or day <= end:
+        for course in timetable.courses_on(day):
+            try:
+                start = _start(day.isoformat(), course["time"].split("-")[0])
+            except (KeyError, AttributeError, ValueError):
+                # 一节课的时间写错只跳过这一节，不影响其他课程和日程的提醒
+                continue
+            if start > after:
+                yield (start - lead).timestamp(), start, "course", course
+        day += timedelta(days=1)
+
+
+class ReminderSink:
+    """提醒的投递方式；send 抛出的异常由调度器记录，不影响其他投递方式"""
+
+    name = "base"
+
+    def send(self, user_id: str, reminder: Dict):
+        raise NotImplementedError
+
+
+class ConsoleSink(ReminderSink):
+    name = "console"
+
+    def send(self, user_id: str, reminder: Dict):
+        where = f" @{reminder['location']}" if reminder.get("location") else ""
+        print(f"[提醒][{user_id}] {reminder['start']} {reminder['title']}{where}"
+              f"（{reminder['minutes_before']} 分钟后开始）", flush=True)
+
+
+class WebhookSink(ReminderSink):
+    """POST JSON 到 url（可以是 eval/webhook_stub_server.py）"""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, user_id: str, reminder: Dict):
+        # requests 导入较慢，只在真正投递时加载
+        import requests
+        response = requests.post(self.url, json={"user": user_id, **reminder}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class SSESink(ReminderSink):
+    """写进用户的变更流，Web 端的 /events 会把它推给打开的页面"""
+
+    name = "sse"
+
+    def send(self, user_id: str, reminder: Dict):
+        changefeed.publish([changefeed.event("reminder", "fire", reminder.get("id"), reminder)], user_id)
+
+
+def make_sinks(names: List[str], webhook_url: Optional[str] = None) -> List[ReminderSink]:
+    sinks = []
+    for name in names:
+        if name == "console":
+            sinks.append(ConsoleSink())
+        elif name == "webhook":
+            if not webhook_url:
+                raise ValueError("webhook 投递需要设置 REMINDER_WEBHOOK_URL")
+            sinks.append(WebhookSink(webhook_url))
+        elif name == "sse":
+            sinks.append(SSESink())
+        else:
+            raise ValueError(f"不支持的提醒投递方式: {name}")
+    return sinks
+
+
+class ReminderScheduler:
+    """一个用户的提醒调度器；step() 处理到期提醒并返回下一次需要醒来的间隔（秒）"""
+
+    def __init__(self, user_id: str, sinks: List[ReminderSink], lead_minutes: int = 10,
+                 check_interval: float = 2.0):
+        self.user_id = user_id
+        self.sinks = sinks
+        self.lead = timedelta(minutes=lead_minutes)
+        self.check_interval = check_interval
+        self._heap: List[tuple] = []
+        self._gen: Dict[tuple, int] = {}
+        self._sources: Dict[tuple, Iterator[Fire]] = {}
+        self._seq = itertools.count()
+        # 代次全局递增：删除后重新添加的同一条日程不会与堆里残留的旧项撞号
+        self._gens = itertools.count(1)
+        self._cursor = None
+        self._course_sig = None
+        self.loaded = False
+        self.fired = 0
+        self.failures = 0
+        self.rebuilds = 0
+        self.applied = 0
+
+    # ---- 构建与增量更新 ----
+
+    def load(self, now: Optional[float] = None):
+        """全量构建：读一次 schedule.json 和课表，之后只按变更流增量更新"""
+        after = datetime.fromtimestamp(now if now is not None else time.time())
+        # 先记下变更流位置再读数据，读数据期间的变更会在下一次 refresh 时重放（替换来源是幂等的）
+        self._cursor, _ = changefeed.tail(self.user_id)
+        with use_user(self.user_id):
+            items = schedule_cli.load_data()
+        self._heap = []
+        self._gen = {}
+        self._sources = {}
+        for item in items:
+            self._set_source(("schedule", item.get("id")), schedule_fires(item, after, self.lead), heapify_later=True)
+        self._load_courses(after, heapify_later=True)
+        heapq.heapify(self._heap)
+        self.loaded = True
+        self.rebuilds += 1
+
+    def _course_signature(self):
+        try:
+            st = user_path(COURSE_FILE, self.user_id).stat()
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _load_courses(self, after: datetime, heapify_later: bool = False):
+        self._course_sig = self._course_signature()
+        with use_user(self.user_id):
+            timetable = course_cli.get_timetable()
+        self._set_source(COURSE_KEY, course_fires(timetable, after, self.lead), heapify_later)
+
+    def _set_source(self, key: tuple, source: Iterator[Fire], heapify_later: bool = False):
+        # 全量构建时先追加再统一 heapify（O(n)），增量更新时逐个 heappush
+        gen = next(self._gens)
+        self._gen[key] = gen
+        self._sources[key] = source
+        self._advance(key, gen, heapify_later)
+
+    def _drop_source(self, key: tuple):
+        # 堆里的旧项在弹出时因找不到代次而被丢弃
+        self._gen.pop(key, None)
+        self._sources.pop(key, None)
+
+    def _advance(self, key: tuple, gen: int, heapify_later: bool = False):
+        nxt = next(self._sources[key], None)
+        if nxt is None:
+            self._drop_source(key)
+            return
+        entry = (nxt[0], next(self._seq), key, gen) + nxt[1:]
+        if heapify_later:
+            self._heap.append(entry)
+        else:
+            heapq.heappush(self._heap, entry)
+
+    def refresh(self, now: Optional[float] = None):
+        """检查变更流和课表文件；没有变化时只有两次 stat"""
+        after = datetime.fromtimestamp(now if now is not None else time.time())
+        events, self._cursor, replaced = changefeed.read_since(self._cursor, self.user_id)
+        if replaced:
+            # 变更流被压缩过，无法确定漏掉了什么，全量重建
+            self.load(now)
+            return
+        for ev in events:
+            if ev.get("entity") != "schedule":
+                continue
+            key = ("schedule", ev.get("id"))
+            if ev.get("op") == "delete":
+                self._drop_source(key)
+            elif ev.get("record"):
+                self._set_source(key, schedule_fires(ev["record"], after, self.lead))
+            self.applied += 1
+        if self._course_signature() != self._course_sig:
+            self._load_courses(after)
+        # 被替换来源留下的失效堆项太多时整理一次
+        if len(self._heap) > 2 * len(self._gen) + 1024:
+            self._heap = [e for e in self._heap if self._gen.get(e[2]) == e[3]]
+            heapq.heapify(self._heap)
+
+    # ---- 到期处理 ----
+
+    def _peek(self) -> Optional[tuple]:
+        while self._heap and self._gen.get(self._heap[0][2]) != self._heap[0][3]:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def due(self, now: float) -> List[Dict]:
+        """弹出所有到期的提醒，并把对应来源推进到下一次"""
+        fired = []
+        while True:
+            head = self._peek()
+            if head is None or head[0] > now:
+                return fired
+            heapq.heappop(self._heap)
+            _, _, key, gen, start, kind, record = head
+            fired.append(make_reminder(kind, record, start, self.lead))
+            self._advance(key, gen)
+
+    def next_fire(self) -> Optional[float]:
+        head = self._peek()
+        return head[0] if head else None
+
+    def upcoming(self, limit: int = 10) -> List[Dict]:
+        """每个来源的下一次提醒，按时间排序（不推进迭代器）"""
+        valid = [e for e in self._heap if self._gen.get(e[2]) == e[3]]
+        return [dict(make_reminder(e[5], e[6], e[4], self.lead),
+                     fire_at=datetime.fromtimestamp(e[0]).strftime("%Y-%m-%d %H:%M"))
+                for e in heapq.nsmallest(limit, valid)]
+
+    def deliver(self, reminders: List[Dict]):
+        for reminder in reminders:
+            self.fired += 1
+            for sink in self.sinks:
+                try:
+                    sink.send(self.user_id, reminder)
+                except Exception as e:
+                    self.failures += 1
+                    print(f"[reminders] {sink.name} 投递失败: {e}", file=sys.stderr)
+
+    def step(self, now: Optional[float] = None) -> float:
+        """处理一轮：同步变更、投递到期提醒，返回距离下一次需要醒来的秒数"""
+        now = now if now is not None else time.time()
+        if not self.loaded:
+            self.load(now)
+        else:
+            self.refresh(now)
+        self.deliver(self.due(now))
+        nxt = self.next_fire()
+        if nxt is None:
+            return self.check_interval
+        return max(0.0, min(self.check_interval, nxt - time.time()))
+
+    def stats(self) -> Dict:
+        return {
+            "user": self.user_id,
+            "sources": len(self._gen),
+            "heap": len(self._heap),
+            "fired": self.fired,
+            "failures": self.failures,
+            "rebuilds": self.rebuilds,
+            "applied": self.applied,
+        }
+
+    # ---- 运行方式 ----
+
+    async def run_async(self):
+        """Web 端的后台任务；构建和投递放在线程里，不阻塞事件循环"""
+        while True:
+            try:
+                delay = await asyncio.to_thread(self.step)
+            except Exception as e:
+                print(f"[reminders] 调度出错: {e}", file=sys.stderr)
+                delay = self.check_interval
+            await asyncio.sleep(delay)
+
+
+class LeaderLock:
+    """非阻塞的进程间文件锁：抢到的进程负责投递提醒，进程退出时锁自动释放"""
+
+    def __init__(self, path: Path = REMINDER_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def run_as_leader(schedulers: List[ReminderScheduler], lock: LeaderLock, retry: float = 10.0):
+    """抢到锁后运行所有调度器；没抢到时每隔 retry 秒重试，持锁的进程退出后接替它"""
+    while not lock.acquire():
+        await asyncio.sleep(retry)
+    try:
+        await asyncio.gather(*(s.run_async() for s in schedulers))
+    finally:
+        lock.release()
+
+
+def build_schedulers(users: Optional[List[str]] = None, sinks: Optional[List[str]] = None,
+                     webhook_url: Optional[str] = None, lead_minutes: Optional[int] = None) -> List[ReminderScheduler]:
+    from config import (REMINDER_USERS, REMINDER_SINKS, REMINDER_WEBHOOK_URL,
+                        REMINDER_LEAD_MINUTES, REMINDER_CHECK_INTERVAL)
+    sink_objs = make_sinks(sinks or REMINDER_SINKS, webhook_url or REMINDER_WEBHOOK_URL)
+    lead = lead_minutes if lead_minutes is not None else REMINDER_LEAD_MINUTES
+    return [ReminderScheduler(user, sink_objs, lead, REMINDER_CHECK_INTERVAL) for user in (users or REMINDER_USERS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日程与课程提醒守护进程")
+    parser.add_argument("--user", action="append", help="为哪些用户提醒，可重复；默认 REMINDER_USERS")
+    parser.add_argument("--sinks", help="投递方式，逗号分隔：console,webhook,sse；默认 REMINDER_SINKS")
+    parser.add_argument("--webhook-url", help="webhook 地址；默认 REMINDER_WEBHOOK_URL")
+    parser.add_argument("--lead", type=int, help="提前多少分钟提醒；默认 REMINDER_LEAD_MINUTES")
+    parser.add_argument("--upcoming", type=int, metavar="N", help="只列出接下来的 N 条提醒后退出")
+    args = parser.parse_args()
+
+    sinks = [s.strip() for s in args.sinks.split(",") if s.strip()] if args.sinks else None
+    try:
+        schedulers = build_schedulers(args.user, sinks, args.webhook_url, args.lead)
+    except ValueError as e:
+        sys.exit(str(e))
+    if args.upcoming:
+        for scheduler in schedulers:
+            scheduler.load()
+            print(json.dumps({"user": scheduler.user_id, "data": scheduler.upcoming(args.upcoming),
+                              "stats": scheduler.stats()}, ensure_ascii=False))
+        return
+
+    lock = LeaderLock()
+    if not lock.acquire():
+        print(f"已有进程在投递提醒（{lock.path}），等待它退出后接替", flush=True)
+    print(f"提醒服务已启动: 用户 {', '.join(s.user_id for s in schedulers)}，"
+          f"投递 {', '.join(s.name for s in schedulers[0].sinks) if schedulers else '-'}", flush=True)
+    try:
+        asyncio.run(run_as_leader(schedulers, lock))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import argparse
-import json
 import sys
 from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
 
 # 适配直接运行和模块导入路径
@@ -12,65 +12,212 @@ except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
     from config import SCHEDULE_FILE
 
+from tools import batch, changefeed, records, stream, course_cli
+from tools.records import ScheduleItem
+from tools.userdata import ensure_parent, mark_changed, stores, user_path
+from tools.recurrence import iter_occurrence_dates, make_rule
+from tools.schedule_index import (
+    ScheduleIndex, find_conflicts, free_slot_in_day,
+    item_interval, iter_dates, to_hhmm, to_minutes
+)
+
+# 批处理事务：批内所有操作共享同一份数据，结束时统一保存一次
+_txn = None
+# 数据变更事件（Web 页面据此实时刷新）
+changes = changefeed.Recorder("schedule")
+
 def load_data():
-    if not SCHEDULE_FILE.exists():
+    if _txn is not None:
+        return _txn["data"]
+    path = user_path(SCHEDULE_FILE)
+    if not path.exists():
         return []
     try:
-        with open(SCHEDULE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
+        raw = records.load_file(path)
+    except records.DecodeError:
         return []
+    return records.decode_list(ScheduleItem, raw, path.name)
 
 def save_data(data):
-    with open(SCHEDULE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if _txn is not None:
+        _txn["data"] = data
+        _txn["dirty"] = True
+        return
+    path = ensure_parent(user_path(SCHEDULE_FILE))
+    records.dump_file(data, path)
+    mark_changed(path)
+    stores.invalidate("schedule_index")
+
+def get_index():
+    """获取当前用户的日程索引；文件未变化时复用已构建的索引（Web 端长驻进程按用户 LRU 缓存）"""
+    if _txn is not None and _txn["dirty"]:
+        # 批处理中数据已修改但尚未落盘，按内存中的数据重建
+        return ScheduleIndex(_txn["data"])
+    return stores.get("schedule_index", user_path(SCHEDULE_FILE), lambda: ScheduleIndex(load_data()))
+
+def resolve_date(date):
+    """解析相对日期 today/tomorrow"""
+    if date == 'today':
+        return datetime.now().strftime("%Y-%m-%d")
+    elif date == 'tomorrow':
+        return (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    return date
 
-def add_schedule(date, time, event, duration=60):
+def is_valid_date(date):
+    """date 是否为 YYYY-MM-DD 格式的合法日期"""
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def course_busy(date):
+    """某天课程占用的时间段（分钟）"""
+    busy = []
+    result = course_cli.query_courses(date=date)
+    for c in result.get("data", []) if result.get("success") else []:
+        try:
+            start, end = c["time"].split("-")
+            busy.append({"start": to_minutes(start), "end": to_minutes(end),
+                         "name": c.get("name"), "location": c.get("location")})
+        except (KeyError, ValueError):
+            continue
+    return busy
+
+def add_schedule(date, time, event, duration=60, repeat=None, until=None):
     data = load_data()
+    date = resolve_date(date)
     
     # 生成新ID
     new_id = 1
     if data:
         new_id = max(item['id'] for item in data) + 1
     
-    new_item = {
-        "id": new_id,
-        "date": date,
-        "time": time,
-        "event": event,
-        "duration": duration, # 分钟
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    try:
+        new_item = ScheduleItem(
+            id=new_id,
+            date=date,
+            time=time,
+            event=event,
+            duration=duration, # 分钟
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        if repeat:
+            # 重复日程只存一条规则，查询时再按窗口展开
+            new_item["repeat"] = make_rule(repeat, until)
+    except ValueError as e:
+        # RecordError 也是 ValueError：日期、时间格式不对时不写入
+        return {"success": False, "message": str(e)}
+
+    # 冲突检测：与当天已有日程和课程比较（只提示，不阻止添加）
+    # 重复日程检查最近的若干次发生
+    if repeat:
+        horizon = until or (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=366)).strftime("%Y-%m-%d")
+        check_dates = list(islice(iter_occurrence_dates(new_item, date, horizon), 12))
+    else:
+        check_dates = [date]
+    conflicts = []
+    try:
+        index = ScheduleIndex(data)
+        for d in check_dates:
+            for c in find_conflicts(index, d, time, duration, course_busy(d)):
+                c["date"] = d
+                conflicts.append(c)
+    except ValueError:
+        conflicts = []
     
     data.append(new_item)
     save_data(data)
-    return {"success": True, "id": new_id, "message": "日程已添加", "data": new_item}
+    changes("add", new_id, new_item)
+    result = {"success": True, "id": new_id, "message": "日程已添加", "data": new_item}
+    if conflicts:
+        result["message"] = f"日程已添加，但与 {len(conflicts)} 项安排时间冲突"
+        result["conflicts"] = conflicts
+    return result
 
 def query_schedule(date, time_range=None):
-    data = load_data()
-    results = []
+    index = get_index()
+    target_date = resolve_date(date)
+    if not is_valid_date(target_date):
+        return {"success": False, "message": f"日期格式无效: {date}，应为 YYYY-MM-DD"}
     
-    # 解析相对日期
-    target_date = date
-    if date == 'today':
-        target_date = datetime.now().strftime("%Y-%m-%d")
-    elif date == 'tomorrow':
-        target_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-        
-    for item in data:
-        if item['date'] == target_date:
-            # 如果有时间范围筛选 (简单的字符串比较，实际项目应更严谨)
-            if time_range:
-                start, end = time_range.split('-')
-                item_start = item['time']
-                # 简单起见，只比较开始时间在范围内
-                if start <= item_start <= end:
-                    results.append(item)
-            else:
-                results.append(item)
+    if time_range:
+        # 返回与时间范围有重叠的日程（考虑持续时间）
+        try:
+            start, end = time_range.split('-')
+            start, end = to_minutes(start), to_minutes(end)
+        except ValueError:
+            return {"success": False, "message": f"时间范围格式无效: {time_range}，应为 HH:MM-HH:MM"}
+        if start >= end:
+            return {"success": False, "message": f"时间范围无效: {time_range}，结束时间应晚于开始时间"}
+        results = index.overlapping(target_date, start, end)
+    else:
+        results = index.day(target_date)
                 
     return {"success": True, "data": results}
 
+def query_range(start_date, end_date):
+    """查询多天范围内的日程，按日期分组"""
+    start_date, end_date = resolve_date(start_date), resolve_date(end_date)
+    for d in (start_date, end_date):
+        if not is_valid_date(d):
+            return {"success": False, "message": f"日期格式无效: {d}，应为 YYYY-MM-DD"}
+    if start_date > end_date:
+        return {"success": False, "message": "开始日期不能晚于结束日期"}
+    days = get_index().range(start_date, end_date)
+    return {"success": True, "start": start_date, "end": end_date,
+            "data": days, "count": sum(len(v) for v in days.values())}
+
+def query_week(date="today"):
+    """查询 date 所在周（周一到周日）的日程"""
+    try:
+        d = datetime.strptime(resolve_date(date), "%Y-%m-%d")
+    except ValueError:
+        return {"success": False, "message": "日期格式无效"}
+    monday = d - timedelta(days=d.weekday())
+    start = monday.strftime("%Y-%m-%d")
+    days = get_index().range(start, (monday + timedelta(days=6)).strftime("%Y-%m-%d"))
+    week = {day: days.get(day, []) for day in iter_dates(start, 7)}
+    return {"success": True, "start": start, "data": week,
+            "count": sum(len(v) for v in week.values())}
+
+def check_conflicts(date, time, duration=60, exclude_id=None):
+    """检查某个时间段是否与日程或课程冲突"""
+    date = resolve_date(date)
+    try:
+        conflicts = find_conflicts(get_index(), date, time, duration, course_busy(date), exclude_id)
+    except ValueError:
+        return {"success": False, "message": "时间格式无效，应为 HH:MM"}
+    return {"success": True, "date": date, "time": time, "duration": duration,
+            "has_conflict": bool(conflicts), "conflicts": conflicts}
+
+def find_free_slot(date, duration=60, after=None, days=7, day_start="08:00", day_end="22:00"):
+    """从 date 起查找第一个长度为 duration 分钟的空闲时段（避开日程和课程）"""
+    date = resolve_date(date)
+    try:
+        dates = list(iter_dates(date, days))
+        window_start, window_end = to_minutes(day_start), to_minutes(day_end)
+        first_start = to_minutes(after) if after else None
+    except ValueError:
+        return {"success": False, "message": "日期或时间格式无效"}
+
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    index = get_index()
+    for i, d in enumerate(dates):
+        start = window_start
+        if i == 0 and first_start is not None:
+            start = max(start, first_start)
+        if d == today:
+            start = max(start, now.hour * 60 + now.minute)
+        busy = [item_interval(item) for item in index.overlapping(d, start, window_end)]
+        busy += [(b["start"], b["end"]) for b in course_busy(d)]
+        slot = free_slot_in_day(busy, duration, start, window_end)
+        if slot:
+            return {"success": True, "date": d, "start": to_hhmm(slot[0]),
+                    "end": to_hhmm(slot[1]), "duration": duration}
+    return {"success": False, "message": f"{days} 天内没有找到 {duration} 分钟的空闲时段"}
+
 def delete_schedule(schedule_id):
     data = load_data()
     new_data = [item for item in data if item['id'] != schedule_id]
@@ -79,25 +226,46 @@ def delete_schedule(schedule_id):
         return {"success": False, "message": "未找到指定ID的日程"}
         
     save_data(new_data)
+    changes("delete", schedule_id)
     return {"success": True, "message": "日程已删除"}
 
+def skip_occurrence(schedule_id, date):
+    """跳过重复日程的某一次（添加例外日期）"""
+    data = load_data()
+    date = resolve_date(date)
+    for item in data:
+        if item['id'] == schedule_id:
+            if "repeat" not in item:
+                return {"success": False, "message": "该日程不是重复日程"}
+            exdates = set(item["repeat"].get("exdates", []))
+            exdates.add(date)
+            item["repeat"]["exdates"] = sorted(exdates)
+            save_data(data)
+            changes("skip", schedule_id, item, date=date)
+            return {"success": True, "message": f"已跳过 {date} 的这次日程"}
+    return {"success": False, "message": "未找到指定ID的日程"}
+
 def update_schedule(schedule_id, time=None, event=None):
     data = load_data()
-    found = False
+    found = None
     for item in data:
         if item['id'] == schedule_id:
-            if time: item['time'] = time
-            if event: item['event'] = event
-            found = True
+            try:
+                if time: item['time'] = time
+                if event: item['event'] = event
+            except records.RecordError as e:
+                return {"success": False, "message": str(e)}
+            found = item
             break
             
     if not found:
         return {"success": False, "message": "未找到指定ID的日程"}
         
     save_data(data)
+    changes("update", schedule_id, found)
     return {"success": True, "message": "日程已更新"}
 
-if __name__ == "__main__":
+def build_parser():
     parser = argparse.ArgumentParser(description="日程管理工具")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
@@ -107,12 +275,41 @@ if __name__ == "__main__":
     add_parser.add_argument("--time", required=True, help="时间 HH:MM")
     add_parser.add_argument("--event", required=True, help="事件内容")
     add_parser.add_argument("--duration", type=int, default=60, help="持续时间(分钟)")
+    add_parser.add_argument("--repeat", choices=["daily", "weekly", "biweekly"], help="重复规则")
+    add_parser.add_argument("--until", help="重复截止日期 YYYY-MM-DD")
     
     # query 命令
     query_parser = subparsers.add_parser("query", help="查询日程")
     query_parser.add_argument("--date", required=True, help="日期")
     query_parser.add_argument("--time-range", help="时间范围 HH:MM-HH:MM")
     
+    # range 命令
+    range_parser = subparsers.add_parser("range", help="查询多天日程")
+    range_parser.add_argument("--start", required=True, help="开始日期 YYYY-MM-DD")
+    range_parser.add_argument("--end", required=True, help="结束日期 YYYY-MM-DD")
+
+    # week 命令
+    week_parser = subparsers.add_parser("week", help="查询某天所在周的日程")
+    week_parser.add_argument("--date", default="today", help="日期")
+
+    # conflicts 命令
+    conflict_parser = subparsers.add_parser("conflicts", help="检测时间冲突")
+    conflict_parser.add_argument("--date", required=True, help="日期")
+    conflict_parser.add_argument("--time", required=True, help="开始时间 HH:MM")
+    conflict_parser.add_argument("--duration", type=int, default=60, help="持续时间(分钟)")
+
+    # free 命令
+    free_parser = subparsers.add_parser("free", help="查找空闲时段")
+    free_parser.add_argument("--date", default="today", help="从哪天开始找")
+    free_parser.add_argument("--duration", type=int, default=60, help="需要的时长(分钟)")
+    free_parser.add_argument("--after", help="当天最早开始时间 HH:MM")
+    free_parser.add_argument("--days", type=int, default=7, help="最多向后查找的天数")
+
+    # skip 命令
+    skip_parser = subparsers.add_parser("skip", help="跳过重复日程的某一次")
+    skip_parser.add_argument("--id", type=int, required=True, help="日程ID")
+    skip_parser.add_argument("--date", required=True, help="要跳过的日期")
+    
     # delete 命令
     del_parser = subparsers.add_parser("delete", help="删除日程")
     del_parser.add_argument("--id", type=int, required=True, help="日程ID")
@@ -123,15 +320,68 @@ if __name__ == "__main__":
     up_parser.add_argument("--time", help="新时间")
     up_parser.add_argument("--event", help="新事件")
     
-    args = parser.parse_args()
-    
+    # batch 命令
+    batch.add_batch_parser(subparsers)
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
     if args.command == "add":
-        print(json.dumps(add_schedule(args.date, args.time, args.event, args.duration), ensure_ascii=False))
+        return add_schedule(args.date, args.time, args.event, args.duration, args.repeat, args.until)
     elif args.command == "query":
-        print(json.dumps(query_schedule(args.date, args.time_range), ensure_ascii=False))
+        return query_schedule(args.date, args.time_range)
+    elif args.command == "range":
+        return query_range(args.start, args.end)
+    elif args.command == "week":
+        return query_week(args.date)
+    elif args.command == "conflicts":
+        return check_conflicts(args.date, args.time, args.duration)
+    elif args.command == "free":
+        return find_free_slot(args.date, args.duration, args.after, args.days)
+    elif args.command == "skip":
+        return skip_occurrence(args.id, args.date)
     elif args.command == "delete":
-        print(json.dumps(delete_schedule(args.id), ensure_ascii=False))
+        return delete_schedule(args.id)
     elif args.command == "update":
-        print(json.dumps(update_schedule(args.id, args.time, args.event), ensure_ascii=False))
+        return update_schedule(args.id, args.time, args.event)
+    return None
+
+def run_batch(ops):
+    """批量执行：整个批次只加载一次、保存一次"""
+    global _txn
+    _txn = {"data": load_data(), "dirty": False}
+    changes.begin()
+    try:
+        results = batch.run_ops(build_parser(), run_command, ops)
+    except BaseException:
+        changes.discard()
+        raise
+    finally:
+        txn, _txn = _txn, None
+    if txn["dirty"]:
+        save_data(txn["data"])
+    # 数据落盘后再发布批内的全部变更
+    changes.commit()
+    return {"success": True, "count": len(results), "results": results}
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    if args.command == "batch":
+        try:
+            print(records.dumps(run_batch(batch.read_ops(args.ops))))
+        except records.RecordError as e:
+            print(records.dumps({"success": False, "error": str(e)}))
+        except ValueError as e:
+            print(records.dumps({"success": False, "error": f"批处理输入无效: {e}"}))
     else:
-        parser.print_help()
+        try:
+            result = run_command(args)
+        except records.RecordError as e:
+            # 数据文件里有不合规的记录：报出文件和记录位置，而不是抛出堆栈
+            result = {"success": False, "error": str(e)}
+        if result is None:
+            parser.print_help()
+        else:
+            stream.print_result(result)
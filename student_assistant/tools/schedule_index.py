@@ -0,0 +1,224 @@
+# 日程的按日期分桶区间索引
+# 每个日期一个桶，桶内按开始时间（分钟）排序，配合 bisect 做范围查询、冲突检测和空闲时间查找。
+# 桶只在第一次被访问时排序，单次查询的成本取决于当天的日程数量，而不是整个 schedule.json 的大小。
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tools.recurrence import is_recurring, occurrences
+
+DEFAULT_DURATION = 60
+
+
+def _parses(date: str) -> bool:
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def to_minutes(hhmm: str) -> int:
+    """'HH:MM' -> 当天的分钟数；格式不对时抛 ValueError"""
+    h, m = hhmm.strip().split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h <= 24 and 0 <= m < 60):
+        raise ValueError(f"无效时间: {hhmm}")
+    return h * 60 + m
+
+
+def to_hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def item_interval(item: dict) -> Tuple[int, int]:
+    start = to_minutes(item["time"])
+    duration = item.get("duration") or DEFAULT_DURATION
+    return start, start + int(duration)
+
+
+class _DayBucket:
+    __slots__ = ("items", "starts", "max_duration", "sorted")
+
+    def __init__(self):
+        self.items: List[dict] = []
+        self.starts: List[int] = []
+        self.max_duration = 0
+        self.sorted = False
+
+    def ensure_sorted(self):
+        if self.sorted:
+            return
+        keyed = []
+        for item in self.items:
+            try:
+                start, end = item_interval(item)
+            except (KeyError, ValueError):
+                continue
+            keyed.append((start, end, item))
+        keyed.sort(key=lambda t: t[0])
+        self.items = [t[2] for t in keyed]
+        self.starts = [t[0] for t in keyed]
+        self.max_duration = max((t[1] - t[0] for t in keyed), default=0)
+        self.sorted = True
+
+
+def _sort_key(item: dict) -> int:
+    try:
+        return to_minutes(item["time"])
+    except (KeyError, ValueError):
+        return 0
+
+
+class ScheduleIndex:
+    """日期分桶 + 桶内按开始时间排序的日程索引
+
+    重复日程不展开进桶里，而是单独保存规则，查询时只在窗口内惰性生成。
+    """
+
+    def __init__(self, items: Iterable[dict]):
+        self._buckets: Dict[str, _DayBucket] = {}
+        self._recurring: List[dict] = []
+        for item in items:
+            date = item.get("date")
+            if not date:
+                continue
+            if is_recurring(item):
+                self._recurring.append(item)
+                continue
+            bucket = self._buckets.get(date)
+            if bucket is None:
+                bucket = self._buckets[date] = _DayBucket()
+            bucket.items.append(item)
+        self._dates: Optional[List[str]] = None
+
+    def _bucket(self, date: str) -> Optional[_DayBucket]:
+        bucket = self._buckets.get(date)
+        if bucket is not None:
+            bucket.ensure_sorted()
+        return bucket
+
+    def _recurring_on(self, date: str) -> List[dict]:
+        # 不是合法日期时不会有重复日程落在这天，不必展开（展开时解析日期会抛 ValueError）
+        if not self._recurring or not _parses(date):
+            return []
+        return [occ for item in self._recurring for occ in occurrences(item, date, date)]
+
+    def day(self, date: str) -> List[dict]:
+        """某一天的日程（含重复日程的当次实例），按开始时间排序"""
+        bucket = self._bucket(date)
+        items = list(bucket.items) if bucket else []
+        recurring = self._recurring_on(date)
+        if recurring:
+            items.extend(recurring)
+            items.sort(key=_sort_key)
+        return items
+
+    def overlapping(self, date: str, start: int, end: int) -> List[dict]:
+        """与 [start, end) 分钟区间有重叠的日程"""
+        bucket = self._bucket(date)
+        results = []
+        if bucket:
+            # 开始时间早于 start - max_duration 的日程不可能和区间重叠
+            lo = bisect_left(bucket.starts, start - bucket.max_duration)
+            hi = bisect_left(bucket.starts, end)
+            results = [item for item in bucket.items[lo:hi] if self._overlaps(item, start, end)]
+        recurring = [occ for occ in self._recurring_on(date) if self._overlaps(occ, start, end)]
+        if recurring:
+            results.extend(recurring)
+            results.sort(key=_sort_key)
+        return results
+
+    @staticmethod
+    def _overlaps(item: dict, start: int, end: int) -> bool:
+        try:
+            s, e = item_interval(item)
+        except (KeyError, ValueError):
+            return False
+        return s < end and e > start
+
+    def starting_between(self, date: str, start: int, end: int) -> List[dict]:
+        """开始时间落在 [start, end] 内的日程"""
+        bucket = self._bucket(date)
+        results = []
+        if bucket:
+            lo = bisect_left(bucket.starts, start)
+            hi = bisect_right(bucket.starts, end)
+            results = bucket.items[lo:hi]
+        recurring = [occ for occ in self._recurring_on(date) if start <= _sort_key(occ) <= end]
+        if recurring:
+            results = sorted(results + recurring, key=_sort_key)
+        return results
+
+    def range(self, start_date: str, end_date: str) -> Dict[str, List[dict]]:
+        """[start_date, end_date] 范围内有日程的日期 -> 当天日程"""
+        if self._dates is None:
+            self._dates = sorted(self._buckets)
+        lo = bisect_left(self._dates, start_date)
+        hi = bisect_right(self._dates, end_date)
+        days = {}
+        for d in self._dates[lo:hi]:
+            bucket = self._bucket(d)
+            days[d] = list(bucket.items)
+        # 重复日程只在窗口内展开；窗口端点不是合法日期时不展开
+        touched = set()
+        recurring = self._recurring if _parses(start_date) and _parses(end_date) else []
+        for item in recurring:
+            for occ in occurrences(item, start_date, end_date):
+                days.setdefault(occ["date"], []).append(occ)
+                touched.add(occ["date"])
+        for d in touched:
+            days[d].sort(key=_sort_key)
+        return dict(sorted(days.items()))
+
+
+def find_conflicts(index: ScheduleIndex, date: str, time: str, duration: int,
+                   busy: Iterable[dict] = (), exclude_id=None) -> List[dict]:
+    """检测新日程与已有日程/课程的冲突
+
+    busy 为额外的忙碌区间（例如当天的课程），每项需含 start/end 分钟数。
+    """
+    start = to_minutes(time)
+    end = start + int(duration or DEFAULT_DURATION)
+    conflicts = []
+    for item in index.overlapping(date, start, end):
+        if exclude_id is not None and item.get("id") == exclude_id:
+            continue
+        conflicts.append({"source": "schedule", "id": item.get("id"), "time": item["time"],
+                          "duration": item.get("duration", DEFAULT_DURATION), "event": item.get("event")})
+    for b in busy:
+        if b["start"] < end and b["end"] > start:
+            conflicts.append({"source": "course", "time": f"{to_hhmm(b['start'])}-{to_hhmm(b['end'])}",
+                              "event": b.get("name"), "location": b.get("location")})
+    return conflicts
+
+
+def merge_busy(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def free_slot_in_day(busy: List[Tuple[int, int]], duration: int,
+                     day_start: int, day_end: int) -> Optional[Tuple[int, int]]:
+    """在 [day_start, day_end) 内找第一个长度 >= duration 的空闲时段"""
+    cursor = day_start
+    for s, e in merge_busy(busy):
+        if e <= cursor:
+            continue
+        if s - cursor >= duration:
+            break
+        cursor = max(cursor, e)
+    if cursor + duration <= day_end:
+        return cursor, cursor + duration
+    return None
+
+
+def iter_dates(start_date: str, days: int):
+    d = datetime.strptime(start_date, "%Y-%m-%d")
+    for i in range(days):
+        yield (d + timedelta(days=i)).strftime("%Y-%m-%d")
@@ -0,0 +1,440 @@
+# 数据目录的增量快照
+# 快照覆盖所有用户分区的四个数据文件（账单、日程、课表、记忆），存放在 data/snapshots/ 下：
+#   objects/ab/cdef...      按内容寻址的数据块，文件名是未压缩内容的 blake2b-128，内容用 zlib 压缩；
+#                           相同的块在不同文件、不同用户、不同快照之间只存一份
+#   manifests/<快照号>.z    一次快照的清单：每个文件的签名、整体哈希和“块组”列表
+# 文件按内容定义的边界切块：在记录之间切分（数据文件是缩进格式，每条记录以 "}," 加换行结束），边界由记录内容的哈希决定，
+# 所以改动一条记录只影响它所在的块，前后的块保持不变。块的摘要再按同样的方式分组存成对象（一层默克尔树），
+# 清单里每个文件只有几十个组号。因此一次快照写入的数据量取决于改动的大小，而不是数据集的大小：
+# 签名（数据版本号 + mtime + 大小，见 tools/dataversion.py）没变的文件连读都不读，直接沿用上一个快照的条目。
+# 恢复按清单取出块、校验整体哈希后原子替换数据文件；恢复前先自动拍一个快照，恢复本身也可以撤销。
+# 保留策略：最近若干个全部保留，更早的每天、每周各保留最后一个；清理后删除不再被引用的块。
+import hashlib
+import os
+import re
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只有单进程拍快照时才可靠
+    fcntl = None
+
+try:
+    from config import (BUDGET_FILE, COURSE_FILE, DATA_DIR, DEFAULT_USER, MEMORY_FILE, SCHEDULE_FILE,
+                        SNAPSHOTS_DIR, USERS_DIR)
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import (BUDGET_FILE, COURSE_FILE, DATA_DIR, DEFAULT_USER, MEMORY_FILE, SCHEDULE_FILE,
+                        SNAPSHOTS_DIR, USERS_DIR)
+
+from tools import records
+from tools.dataversion import dataset_of, versions
+from tools.userdata import mark_changed
+
+# 快照包含的数据文件名（每个用户分区下的同名文件）
+SNAPSHOT_FILES = [BUDGET_FILE.name, SCHEDULE_FILE.name, COURSE_FILE.name, MEMORY_FILE.name]
+
+# 分块参数：块至少 MIN_CHUNK 字节，之后每条记录有 1/64 的概率成为边界，超过 MAX_CHUNK 强制切开
+MIN_CHUNK = 2 * 1024
+MAX_CHUNK = 64 * 1024
+_CUT_MASK = 0x3F
+# 记录之间的位置：紧凑格式的 "},{"，缩进格式（数据文件）的 "},\n"
+_BOUNDARY = re.compile(rb"\},\{|\},?\n")
+# 分组参数：每组平均 64 个块摘要，最多 256 个
+_GROUP_MASK = 0x3F
+_MAX_GROUP = 256
+_DIGEST = 16
+
+_ID_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+
+class SnapshotError(ValueError):
+    """快照不存在、已损坏或参数不合法"""
+
+
+def split_chunks(data: bytes) -> Iterable[Tuple[int, int]]:
+    """按内容定义的边界切块，返回 (起点, 终点) 序列"""
+    view = memoryview(data)
+    start = piece = 0
+    ends = (m.start() + 2 if data[m.end() - 1] == 0x7B else m.end() for m in _BOUNDARY.finditer(data))
+    for end in ends:
+        while end - start > MAX_CHUNK:
+            # 单条记录（或没有分隔符的长行）过长时按固定长度切
+            yield start, start + MAX_CHUNK
+            start += MAX_CHUNK
+            piece = max(piece, start)
+        if end - start >= MIN_CHUNK and zlib.crc32(view[piece:end]) & _CUT_MASK == 0:
+            yield start, end
+            start = end
+        piece = end
+    while start < len(data):
+        yield start, min(start + MAX_CHUNK, len(data))
+        start += MAX_CHUNK
+
+
+def _group(digests: List[bytes]) -> Iterable[List[bytes]]:
+    """把块摘要按内容分组：边界由摘要本身决定，插入或删除一个块只影响它所在的组"""
+    group = []
+    for d in digests:
+        group.append(d)
+        if d[0] & _GROUP_MASK == 0 or len(group) >= _MAX_GROUP:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def _file_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=_DIGEST).hexdigest()
+
+
+def _user_of(rel: str) -> str:
+    parts = Path(rel).parts
+    return parts[1] if len(parts) == 3 and parts[0] == USERS_DIR.name else DEFAULT_USER
+
+
+@contextmanager
+def _locked(path: Path):
+    """进程间互斥：多个 Web worker 和命令行同时拍快照或清理时依次进行"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def select_keep(snapshot_ids: List[str], keep_last: int, keep_daily: int, keep_weekly: int) -> set:
+    """保留策略：最近 keep_last 个；再往前每天最后一个，共 keep_daily 天；每周最后一个，共 keep_weekly 周"""
+    ordered = sorted(snapshot_ids, reverse=True)
+    keep = set(ordered[:keep_last])
+    days, weeks = set(), set()
+    for sid in ordered:
+        at = datetime.strptime(sid, _ID_FORMAT)
+        day = at.date()
+        week = at.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.add(day)
+            keep.add(sid)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.add(week)
+            keep.add(sid)
+    return keep
+
+
+class SnapshotStore:
+    def __init__(self, root: Path = SNAPSHOTS_DIR, data_dir: Path = DATA_DIR):
+        self.root = Path(root)
+        self.data_dir = Path(data_dir)
+        self.objects = self.root / "objects"
+        self.manifests = self.root / "manifests"
+        self._lock_path = self.root / ".lock"
+        # 最近一个快照的清单缓存：后台定期检查时不必每次解压
+        self._latest: Optional[Dict] = None
+
+    # ---------- 对象 ----------
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest[2:]
+
+    def _put(self, data) -> Tuple[bytes, int]:
+        """存入一个对象，返回 (摘要, 新写入的压缩字节数)；已存在时不重复写"""
+        digest = hashlib.blake2b(data, digest_size=_DIGEST).digest()
+        path = self._object_path(digest.hex())
+        if path.exists():
+            return digest, 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        packed = zlib.compress(data, 6)
+        # 对象不逐个落盘，写清单之前统一 sync 一次
+        records.write_atomic(path, packed, sync=False)
+        return digest, len(packed)
+
+    def _get(self, digest: str) -> bytes:
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            raise SnapshotError(f"快照数据块 {digest} 缺失或损坏: {e}") from e
+
+    # ---------- 清单 ----------
+
+    def snapshot_ids(self) -> List[str]:
+        if not self.manifests.exists():
+            return []
+        return sorted(p.name[:-2] for p in self.manifests.glob("*.z"))
+
+    def load(self, snapshot_id: str) -> Dict:
+        path = self.manifests / f"{snapshot_id}.z"
+        try:
+            with open(path, "rb") as f:
+                return records.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            raise SnapshotError(f"快照不存在: {snapshot_id}") from None
+        except (zlib.error, *records.DecodeError) as e:
+            raise SnapshotError(f"快照清单损坏: {snapshot_id}: {e}") from e
+
+    def latest(self) -> Optional[Dict]:
+        ids = self.snapshot_ids()
+        if not ids:
+            self._latest = None
+            return None
+        if self._latest is None or self._latest["id"] != ids[-1]:
+            self._latest = self.load(ids[-1])
+        return self._latest
+
+    def resolve(self, target: str) -> str:
+        """快照号，或时间点（YYYY-MM-DD[ HH:MM[:SS]]）：取该时间点及之前的最后一个快照"""
+        ids = self.snapshot_ids()
+        if target in ids:
+            return target
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                at = datetime.strptime(target, fmt)
+            except ValueError:
+                continue
+            if fmt == "%Y-%m-%d":
+                at = at.replace(hour=23, minute=59, second=59, microsecond=999999)
+            before = [sid for sid in ids if datetime.strptime(sid, _ID_FORMAT) <= at]
+            if not before:
+                raise SnapshotError(f"{target} 之前没有快照")
+            return before[-1]
+        raise SnapshotError(f"快照不存在: {target}（可以用快照号或 YYYY-MM-DD HH:MM）")
+
+    # ---------- 拍快照 ----------
+
+    def tracked_files(self) -> List[str]:
+        """需要快照的数据文件（相对数据目录的路径）"""
+        found = [name for name in SNAPSHOT_FILES if (self.data_dir / name).is_file()]
+        users = self.data_dir / USERS_DIR.name
+        if users.is_dir():
+            for user in sorted(p for p in users.iterdir() if p.is_dir()):
+                found += [f"{USERS_DIR.name}/{user.name}/{name}" for name in SNAPSHOT_FILES
+                          if (user / name).is_file()]
+        return found
+
+    def _signature(self, rel: str, path: Path) -> List[int]:
+        st = path.stat()
+        return [versions.get(dataset_of(path), _user_of(rel)), st.st_mtime_ns, st.st_size]
+
+    def _store_file(self, data: bytes) -> Tuple[List[str], int, int]:
+        """切块存入，返回 (组号列表, 新对象数, 新写入字节数)"""
+        view = memoryview(data)
+        new_objects = new_bytes = 0
+        digests = []
+        for start, end in split_chunks(data):
+            digest, written = self._put(view[start:end])
+            digests.append(digest)
+            new_objects += written > 0
+            new_bytes += written
+        groups = []
+        for group in _group(digests):
+            digest, written = self._put(b"".join(group))
+            groups.append(digest.hex())
+            new_objects += written > 0
+            new_bytes += written
+        return groups, new_objects, new_bytes
+
+    def take(self, trigger: str = "manual", note: str = None, force: bool = False) -> Dict:
+        """拍一个快照；没有任何文件变化且未指定 force 时不生成新快照"""
+        with _locked(self._lock_path):
+            previous = self.latest()
+            old_files = previous["files"] if previous else {}
+            files, changed = {}, []
+            new_objects = new_bytes = read_bytes = 0
+            for rel in self.tracked_files():
+                path = self.data_dir / rel
+                try:
+                    sig = self._signature(rel, path)
+                    old = old_files.get(rel)
+                    if old is not None and old["sig"] == sig:
+                        files[rel] = old
+                        continue
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue  # 拍快照的过程中被删除
+                read_bytes += len(data)
+                digest = _file_hash(data)
+                if old is not None and old["hash"] == digest:
+                    # 内容没变（例如只是重新保存了一次），只更新签名
+                    files[rel] = {**old, "sig": sig}
+                    continue
+                groups, objects, written = self._store_file(data)
+                files[rel] = {"sig": sig, "hash": digest, "size": len(data), "groups": groups}
+                changed.append(rel)
+                new_objects += objects
+                new_bytes += written
+            removed = sorted(set(old_files) - set(files))
+            if previous is not None and not changed and not removed and not force:
+                return {"success": True, "id": None, "message": "数据没有变化，未生成新快照",
+                        "latest": previous["id"]}
+            now = datetime.now()
+            manifest = {
+                "id": now.strftime(_ID_FORMAT),
+                "created_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+                "trigger": trigger,
+                "note": note,
+                "files": files,
+                "changed": changed,
+                "removed": removed,
+                "new_objects": new_objects,
+                "new_bytes": new_bytes,
+                "read_bytes": read_bytes,
+            }
+            if new_objects and hasattr(os, "sync"):
+                os.sync()
+            self.manifests.mkdir(parents=True, exist_ok=True)
+            records.write_atomic(self.manifests / f"{manifest['id']}.z", zlib.compress(records.dumps_bytes(manifest)))
+            self._latest = manifest
+        return {"success": True, **self._summary(manifest)}
+
+    @staticmethod
+    def _summary(manifest: Dict) -> Dict:
+        summary = {key: manifest.get(key) for key in ("id", "created_at", "trigger", "note", "changed", "removed",
+                                                      "new_objects", "new_bytes", "read_bytes")}
+        summary["files"] = len(manifest["files"])
+        summary["total_bytes"] = sum(f["size"] for f in manifest["files"].values())
+        return summary
+
+    def list(self) -> List[Dict]:
+        return [self._summary(self.load(sid)) for sid in self.snapshot_ids()]
+
+    # ---------- 恢复 ----------
+
+    def read_file(self, entry: Dict) -> bytes:
+        """按清单条目重建文件内容并校验整体哈希"""
+        parts = []
+        for group in entry["groups"]:
+            table = self._get(group)
+            for i in range(0, len(table), _DIGEST):
+                parts.append(self._get(table[i:i + _DIGEST].hex()))
+        data = b"".join(parts)
+        if _file_hash(data) != entry["hash"]:
+            raise SnapshotError("快照内容校验失败")
+        return data
+
+    def restore(self, target: str, files: Optional[List[str]] = None, dry_run: bool = False,
+                progress=None) -> Dict:
+        """把 files（相对数据目录的路径，None 表示全部）恢复到 target 快照时的状态
+
+        快照里没有的文件（当时还不存在）会被删除。恢复前先拍一个 pre-restore 快照。
+        """
+        snapshot_id = self.resolve(target)
+        manifest = self.load(snapshot_id)
+        scope = set(files) if files is not None else set(manifest["files"]) | set(self.tracked_files())
+        actions = []
+        for rel in sorted(scope):
+            path = self.data_dir / rel
+            entry = manifest["files"].get(rel)
+            if entry is None:
+                if path.exists():
+                    actions.append((rel, "delete", None))
+                continue
+            current = path.read_bytes() if path.exists() else None
+            if current is not None and _file_hash(current) == entry["hash"]:
+                continue
+            actions.append((rel, "restore", entry))
+        result = {"success": True, "id": snapshot_id, "created_at": manifest["created_at"],
+                  "restored": [rel for rel, op, _ in actions if op == "restore"],
+                  "deleted": [rel for rel, op, _ in actions if op == "delete"]}
+        if dry_run or not actions:
+            result["message"] = "预演，未修改任何文件" if dry_run else "数据与快照一致，无需恢复"
+            return result
+        # 先取出全部内容再动数据文件：块缺失时不会只恢复了一半
+        contents = {rel: self.read_file(entry) for rel, op, entry in actions if op == "restore"}
+        backup = self.take("pre-restore", note=f"恢复到 {snapshot_id} 之前")
+        result["undo"] = backup.get("id") or backup.get("latest")
+        for i, (rel, op, _) in enumerate(actions, 1):
+            path = self.data_dir / rel
+            if op == "restore":
+                path.parent.mkdir(parents=True, exist_ok=True)
+                records.write_atomic(path, contents[rel])
+            else:
+                path.unlink(missing_ok=True)
+            mark_changed(path, _user_of(rel))
+            if progress is not None:
+                progress(i, len(actions), f"已恢复 {rel}")
+        result["message"] = f"已恢复到 {manifest['created_at']} 的快照，可用快照 {result['undo']} 撤销"
+        return result
+
+    # ---------- 清理 ----------
+
+    def prune(self, keep_last: int, keep_daily: int, keep_weekly: int, dry_run: bool = False) -> Dict:
+        """按保留策略删除旧快照，再删除不再被任何快照引用的数据块"""
+        with _locked(self._lock_path):
+            ids = self.snapshot_ids()
+            keep = select_keep(ids, keep_last, keep_daily, keep_weekly)
+            drop = [sid for sid in ids if sid not in keep]
+            result = {"success": True, "kept": len(keep), "removed": drop, "freed_objects": 0, "freed_bytes": 0}
+            if dry_run or not drop:
+                return result
+            for sid in drop:
+                (self.manifests / f"{sid}.z").unlink(missing_ok=True)
+            live = set()
+            for sid in sorted(keep):
+                for entry in self.load(sid)["files"].values():
+                    for group in entry["groups"]:
+                        if group in live:
+                            continue
+                        live.add(group)
+                        table = self._get(group)
+                        live.update(table[i:i + _DIGEST].hex() for i in range(0, len(table), _DIGEST))
+            for bucket in self.objects.iterdir() if self.objects.exists() else []:
+                for obj in bucket.iterdir():
+                    if bucket.name + obj.name not in live and not obj.name.endswith(".tmp"):
+                        result["freed_bytes"] += obj.stat().st_size
+                        result["freed_objects"] += 1
+                        obj.unlink()
+            self._latest = None
+        return result
+
+    def stats(self) -> Dict:
+        objects = total = 0
+        if self.objects.exists():
+            for bucket in self.objects.iterdir():
+                for obj in bucket.iterdir():
+                    objects += 1
+                    total += obj.stat().st_size
+        return {"snapshots": len(self.snapshot_ids()), "objects": objects, "object_bytes": total}
+
+
+class SnapshotScheduler:
+    """后台线程：每隔 interval 秒检查一次，数据有变化就拍快照并按保留策略清理"""
+
+    def __init__(self, store: SnapshotStore, interval: float, retention: Dict):
+        self.store = store
+        self.interval = interval
+        self.retention = retention
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshots", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # 启动时先检查一次，之后按间隔
+        while True:
+            try:
+                if self.store.take("schedule").get("id"):
+                    self.store.prune(**self.retention)
+            except Exception as e:
+                print(f"[snapshots] 快照失败: {e}", file=sys.stderr)
+            if self._stop.wait(self.interval):
+                return
+
+
+store = SnapshotStore()
@@ -0,0 +1,66 @@
+# 工具 CLI 的流式输出（NDJSON）
+# ToolExecutor 通过环境变量 STUDENT_TOOL_STREAM=1 开启；直接在终端运行时仍输出一整个 JSON。
+# 开启后列表型结果逐行输出，每行一个 JSON 对象：
+#   {"stream": "head", "key": "data", "count_key": "count", "fields": {...}}   列表以外的字段
+#   {...}                                                                      每条记录一行
+#   {"stream": "end", "count": N}                                              正常结束
+# 读取方达到行数/字节上限时会提前关闭管道并结束进程，写入方遇到 BrokenPipe 时安静退出。
+# 后台任务运行的工具另外通过 progress() 向 stderr 汇报进度（STUDENT_JOB_PROGRESS=1 时）。
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, Optional
+
+try:
+    from config import PROGRESS_ENV_VAR, STREAM_ENV_VAR
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import PROGRESS_ENV_VAR, STREAM_ENV_VAR
+
+from tools import records
+
+
+def enabled() -> bool:
+    return os.environ.get(STREAM_ENV_VAR) == "1"
+
+
+def _line(obj) -> str:
+    return records.dumps(obj) + "\n"
+
+
+def emit(fields: dict, rows: Iterable, key: str = "data", count_key: Optional[str] = "count"):
+    """逐条写出记录；rows 可以是生成器，不必先构造完整列表"""
+    out = sys.stdout
+    try:
+        out.write(_line({"stream": "head", "key": key, "count_key": count_key, "fields": fields}))
+        count = 0
+        for row in rows:
+            out.write(_line(row))
+            count += 1
+            if count % 100 == 0:
+                # 定期刷新，读取方可以边读边判断是否已达到上限
+                out.flush()
+        out.write(_line({"stream": "end", "count": count}))
+        out.flush()
+    except BrokenPipeError:
+        # 读取方已经拿够了：把 stdout 指向 /dev/null，避免解释器退出时再次报错
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(0)
+
+
+def print_result(result: dict, key: str = "data", count_key: str = "count"):
+    """CLI 输出结果：开启流式且 result[key] 是列表时按 NDJSON 输出，否则输出一整个 JSON"""
+    if enabled() and isinstance(result, dict) and isinstance(result.get(key), list):
+        fields = {k: v for k, v in result.items() if k not in (key, count_key)}
+        emit(fields, result[key], key=key, count_key=count_key if count_key in result else None)
+    else:
+        print(records.dumps(result))
+
+
+def progress(done: int, total: int, message: str = ""):
+    """后台任务运行工具时（STUDENT_JOB_PROGRESS=1）把进度写到 stderr，一行一个 JSON；否则什么都不做"""
+    if os.environ.get(PROGRESS_ENV_VAR) != "1":
+        return
+    print(records.dumps({"progress": round(done / total, 4) if total else 1.0, "message": message}),
+          file=sys.stderr, flush=True)
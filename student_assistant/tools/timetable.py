@@ -0,0 +1,218 @@
+# 学期课表模型
+# courses.json 支持两种格式：
+#   1. 旧格式：课程列表，每周都一样
+#   2. 新格式：{"semester": {"start": "2026-02-23", "weeks": 18},
+#              "periods": {"1": "08:00-08:45", ...},
+#              "courses": [{"weekday": 0, "periods": [1, 2], "name": ..., "location": ...,
+#                           "weeks": "1-16", "parity": "odd"}]}
+# 加载时一次性编译成 (周次, 星期) -> 已排序课程 的查找表，按日期查课、当前/下一节课、空闲时段都是查表操作。
+import zlib
+from bisect import bisect_right
+from datetime import date as date_cls, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DAY_START = 8 * 60
+DAY_END = 22 * 60
+# 旧格式没有学期信息时，所有周共用周次 0
+ALL_WEEKS = 0
+
+
+def _minutes(hhmm: str) -> int:
+    h, m = hhmm.strip().split(":")
+    return int(h) * 60 + int(m)
+
+
+def _hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_weeks(spec) -> Optional[set]:
+    """解析周次：'1-16'、'1-8,10-16'、[1, 2, 3]；None 表示每周都有"""
+    if spec is None or spec == "":
+        return None
+    if isinstance(spec, (list, tuple, set)):
+        return {int(w) for w in spec}
+    weeks = set()
+    for part in str(spec).replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            weeks.update(range(int(lo), int(hi) + 1))
+        else:
+            weeks.add(int(part))
+    return weeks
+
+
+def _parity_ok(week: int, parity) -> bool:
+    if parity in ("odd", "单", "单周"):
+        return week % 2 == 1
+    if parity in ("even", "双", "双周"):
+        return week % 2 == 0
+    return True
+
+
+class _DayTable:
+    """某 (周次, 星期) 的课程表：课程按开始时间排序，并预先算好空闲时段"""
+
+    __slots__ = ("courses", "starts", "ends", "free")
+
+    def __init__(self, entries: List[Tuple[int, int, dict]]):
+        entries.sort(key=lambda e: e[0])
+        self.courses = tuple(e[2] for e in entries)
+        self.starts = tuple(e[0] for e in entries)
+        self.ends = tuple(e[1] for e in entries)
+        free = []
+        cursor = DAY_START
+        for s, e in zip(self.starts, self.ends):
+            if s > cursor:
+                free.append((cursor, min(s, DAY_END)))
+            cursor = max(cursor, e)
+        if cursor < DAY_END:
+            free.append((cursor, DAY_END))
+        self.free = tuple((_hhmm(s), _hhmm(e)) for s, e in free if e > s)
+
+
+_EMPTY_DAY = _DayTable([])
+
+
+class Timetable:
+    """编译后的学期课表"""
+
+    def __init__(self, raw):
+        if isinstance(raw, dict):
+            semester = raw.get("semester") or {}
+            periods = raw.get("periods") or {}
+            courses = raw.get("courses") or []
+        else:
+            semester, periods, courses = {}, {}, raw or []
+
+        self.semester_start: Optional[date_cls] = None
+        if semester.get("start"):
+            start = datetime.strptime(semester["start"], "%Y-%m-%d").date()
+            # 学期第一周从周一算起
+            self.semester_start = start - timedelta(days=start.weekday())
+        self.total_weeks = int(semester.get("weeks", 20)) if self.semester_start else 0
+        self.periods = {str(k): v for k, v in periods.items()}
+        self.courses: List[dict] = []
+        self._table: Dict[Tuple[int, int], _DayTable] = {}
+        self._compile(courses)
+
+    def _course_interval(self, course: dict) -> Tuple[int, int, str]:
+        if course.get("time"):
+            start, end = course["time"].split("-")
+        else:
+            # 按节次换算时间
+            ps = [str(p) for p in course["periods"]]
+            start = self.periods[ps[0]].split("-")[0]
+            end = self.periods[ps[-1]].split("-")[1]
+        return _minutes(start), _minutes(end), f"{start.strip()}-{end.strip()}"
+
+    def _compile(self, courses: List[dict]):
+        buckets: Dict[Tuple[int, int], List] = {}
+        for raw_course in courses:
+            try:
+                start, end, time_str = self._course_interval(raw_course)
+                weekday = int(raw_course["weekday"])
+                weeks = parse_weeks(raw_course.get("weeks"))
+            except (KeyError, ValueError, IndexError, TypeError):
+                continue
+            course = dict(raw_course, time=time_str)
+            self.courses.append(course)
+            parity = raw_course.get("parity")
+            if self.semester_start is None:
+                keys = [(ALL_WEEKS, weekday)]
+            else:
+                candidates = weeks if weeks is not None else range(1, self.total_weeks + 1)
+                keys = [(w, weekday) for w in candidates
+                        if 1 <= w <= self.total_weeks and _parity_ok(w, parity)]
+            for key in keys:
+                buckets.setdefault(key, []).append((start, end, course))
+        self._table = {key: _DayTable(entries) for key, entries in buckets.items()}
+
+    def week_of(self, day: date_cls) -> Optional[int]:
+        """日期所在的教学周；不在学期内返回 None，无学期信息时返回 0"""
+        if self.semester_start is None:
+            return ALL_WEEKS
+        week = (day - self.semester_start).days // 7 + 1
+        if 1 <= week <= self.total_weeks:
+            return week
+        return None
+
+    def _day(self, week: Optional[int], weekday: int) -> _DayTable:
+        if week is None:
+            return _EMPTY_DAY
+        return self._table.get((week, weekday), _EMPTY_DAY)
+
+    def lookup(self, week: Optional[int], weekday: int) -> Tuple[dict, ...]:
+        """按 (周次, 星期) 查表；week 为 None（学期外）时没有课"""
+        return self._day(week, weekday).courses
+
+    def day_table(self, day: date_cls) -> _DayTable:
+        return self._day(self.week_of(day), day.weekday())
+
+    def courses_on(self, day: date_cls) -> Tuple[dict, ...]:
+        return self.day_table(day).courses
+
+    def courses_on_weekday(self, weekday: int, week: Optional[int] = None) -> Tuple[dict, ...]:
+        if week is None:
+            week = self.week_of(datetime.now().date())
+        return self._day(week, weekday).courses
+
+    def free_periods(self, day: date_cls) -> Tuple[Tuple[str, str], ...]:
+        return self.day_table(day).free
+
+    def current_and_next(self, now: datetime) -> Tuple[Optional[dict], Optional[dict]]:
+        """当前正在上的课和今天的下一节课"""
+        table = self.day_table(now.date())
+        minute = now.hour * 60 + now.minute
+        i = bisect_right(table.starts, minute)
+        current = None
+        if i > 0 and table.ends[i - 1] > minute:
+            current = table.courses[i - 1]
+        upcoming = table.courses[i] if i < len(table.courses) else None
+        return current, upcoming
+
+    def iter_occurrences(self, start: date_cls, end: date_cls) -> Iterator[Tuple[date_cls, dict]]:
+        """按日期顺序逐个生成 [start, end] 内的上课实例"""
+        day = start
+        while day <= end:
+            for course in self.courses_on(day):
+                yield day, course
+            day += timedelta(days=1)
+
+    def iter_ics(self, start: Optional[date_cls] = None, end: Optional[date_cls] = None) -> Iterator[str]:
+        """流式生成 ICS 文本行，不在内存中拼接整个日历"""
+        if start is None:
+            start = self.semester_start or datetime.now().date()
+        if end is None:
+            weeks = self.total_weeks or 16
+            end = start + timedelta(weeks=weeks) - timedelta(days=1)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        yield "BEGIN:VCALENDAR\r\n"
+        yield "VERSION:2.0\r\n"
+        yield "PRODID:-//student_assistant//timetable//CN\r\n"
+        for day, course in self.iter_occurrences(start, end):
+            s, e = (_ics_time(t) for t in course["time"].split("-"))
+            d = day.strftime("%Y%m%d")
+            yield "BEGIN:VEVENT\r\n"
+            yield f"UID:{d}-{s[:4]}-{zlib.crc32(course['name'].encode('utf-8')):08x}@student_assistant\r\n"
+            yield f"DTSTAMP:{stamp}\r\n"
+            yield f"DTSTART:{d}T{s}\r\n"
+            yield f"DTEND:{d}T{e}\r\n"
+            yield f"SUMMARY:{_ics_escape(course['name'])}\r\n"
+            if course.get("location"):
+                yield f"LOCATION:{_ics_escape(course['location'])}\r\n"
+            yield "END:VEVENT\r\n"
+        yield "END:VCALENDAR\r\n"
+
+
+def _ics_time(hhmm: str) -> str:
+    """'9:00' -> '090000'：iCalendar 要求时分秒各两位"""
+    m = _minutes(hhmm)
+    return f"{m // 60:02d}{m % 60:02d}00"
+
+
+def _ics_escape(text: str) -> str:
+    return str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
@@ -0,0 +1,162 @@
+# 按用户划分的数据分区
+# 默认用户沿用 data/ 下原有的文件；其他用户的数据放在 data/users/<用户名>/ 下，目录在第一次写入时才创建。
+# 当前用户保存在 contextvar 中：Web 端每个请求设置一次，工具子进程从环境变量 STUDENT_USER 继承。
+# 解析后的派生数据（日程索引、编译后的课表）放在按 (用户, 文件) 划分的 LRU 中，
+# 只有被访问过的用户才会被加载，条数和总字节数都有上限。
+# 缓存按文件 mtime/size 加上跨进程的数据版本号（tools/dataversion.py）失效：写文件的一方调用 mark_changed，
+# 其他 Web worker 和工具进程在下次访问时就会重建，不会因为 mtime 精度不够或改动前后大小相同而读到旧数据。
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+try:
+    from config import DATA_DIR, DEFAULT_USER, USERS_DIR, USER_ENV_VAR, USER_CACHE_SIZE, USER_CACHE_MAX_BYTES
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import DATA_DIR, DEFAULT_USER, USERS_DIR, USER_ENV_VAR, USER_CACHE_SIZE, USER_CACHE_MAX_BYTES
+
+from tools.dataversion import dataset_of, versions
+
+_USER_ID_RE = re.compile(r"^[\w\-]{1,64}$")
+
+_current_user: ContextVar = ContextVar("current_user", default=None)
+
+
+def validate_user_id(user_id: str) -> str:
+    """用户名只允许字母、数字、汉字、下划线和连字符，防止路径穿越"""
+    if not isinstance(user_id, str) or not _USER_ID_RE.match(user_id):
+        raise ValueError(f"非法的用户名: {user_id!r}")
+    return user_id
+
+
+def current_user() -> str:
+    user_id = _current_user.get()
+    if user_id is None:
+        user_id = os.environ.get(USER_ENV_VAR) or DEFAULT_USER
+    return user_id
+
+
+def set_user(user_id: str):
+    """设置当前上下文的用户，返回用于 reset_user 的 token"""
+    return _current_user.set(validate_user_id(user_id))
+
+
+def reset_user(token):
+    _current_user.reset(token)
+
+
+@contextmanager
+def use_user(user_id: str):
+    token = set_user(user_id)
+    try:
+        yield user_id
+    finally:
+        reset_user(token)
+
+
+def user_dir(user_id: Optional[str] = None) -> Path:
+    user_id = user_id or current_user()
+    if user_id == DEFAULT_USER:
+        return DATA_DIR
+    return USERS_DIR / validate_user_id(user_id)
+
+
+def user_path(path: Path, user_id: Optional[str] = None) -> Path:
+    """把 config 中默认用户的数据路径映射到指定（默认当前）用户的分区"""
+    path = Path(path)
+    base = user_dir(user_id)
+    if base == DATA_DIR:
+        return path
+    try:
+        return base / path.relative_to(DATA_DIR)
+    except ValueError:
+        return base / path.name
+
+
+def ensure_parent(path: Path) -> Path:
+    """写文件前再创建用户目录，只读访问不会留下空目录"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def mark_changed(path: Path, user_id: Optional[str] = None) -> int:
+    """数据文件写入后调用：递增共享的数据版本号，所有进程里基于该文件的缓存随之失效"""
+    return versions.bump(dataset_of(path), user_id or current_user())
+
+
+class StoreCache:
+    """(用户, 数据文件) -> 派生对象 的 LRU 缓存，按文件 mtime/size 和数据版本号失效"""
+
+    def __init__(self, max_entries: int = USER_CACHE_SIZE, max_bytes: int = USER_CACHE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (文件签名, 对象, 占用字节数)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, name: str, path: Path, build: Callable[[], object]):
+        """取出当前用户 name 对应的对象；文件变化或未缓存时调用 build() 重建"""
+        user_id = current_user()
+        key = (user_id, name)
+        try:
+            st = path.stat()
+            sig = (versions.get(dataset_of(path), user_id), st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            sig, st = None, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and sig is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        obj = build()
+        if sig is None:
+            return obj
+        size = st.st_size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (sig, obj, size)
+            self._bytes += size
+            self._evict()
+        return obj
+
+    def _evict(self):
+        # 至少保留刚放进去的那一项
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, name: str, user_id: Optional[str] = None):
+        with self._lock:
+            entry = self._entries.pop((user_id or current_user(), name), None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "users": len({user for user, _ in self._entries}),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+stores = StoreCache()
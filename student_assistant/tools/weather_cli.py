@@ -1,66 +1,92 @@
 import argparse
-import json
-import random
+import sys
 from datetime import datetime, timedelta
+from pathlib import Path
 
-def query_weather(date_str):
+try:
+    from config import (WEATHER_PROVIDER, WEATHER_LOCATION, WEATHER_FILE, WEATHER_API_URL,
+                        WEATHER_CACHE_FILE, WEATHER_CACHE_TTL)
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import (WEATHER_PROVIDER, WEATHER_LOCATION, WEATHER_FILE, WEATHER_API_URL,
+                        WEATHER_CACHE_FILE, WEATHER_CACHE_TTL)
+
+from tools import batch, records, stream
+from tools.weather_provider import WeatherCache, WeatherService, make_provider, make_suggestion
+
+_service = None
+
+def get_service():
+    """进程内复用同一个 WeatherService，批处理和 Web 端的并发查询共享 singleflight"""
+    global _service
+    if _service is None:
+        provider = make_provider(WEATHER_PROVIDER, WEATHER_FILE, WEATHER_API_URL)
+        _service = WeatherService(provider, WeatherCache(WEATHER_CACHE_FILE, WEATHER_CACHE_TTL))
+    return _service
+
+def query_weather(date_str, location=None):
     # 解析日期
     target_date = date_str
     if date_str == 'today':
         target_date = datetime.now().strftime("%Y-%m-%d")
     elif date_str == 'tomorrow':
         target_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-    
-    # Mock 数据生成逻辑
-    weathers = ["晴", "多云", "阴", "小雨", "大雨", "雷阵雨"]
-    weather = random.choice(weathers)
-    
-    # 根据天气生成合理的温度
-    base_temp = 20 # 假设是春秋季
-    if "雨" in weather:
-        temp_high = base_temp - random.randint(2, 5)
-        temp_low = temp_high - random.randint(5, 8)
-        rain_prob = random.randint(60, 95)
-    elif "晴" in weather:
-        temp_high = base_temp + random.randint(3, 8)
-        temp_low = temp_high - random.randint(10, 15)
-        rain_prob = random.randint(0, 10)
-    else:
-        temp_high = base_temp
-        temp_low = base_temp - random.randint(5, 10)
-        rain_prob = random.randint(10, 40)
-        
-    data = {
-        "date": target_date,
-        "weather": weather,
-        "temp_high": temp_high,
-        "temp_low": temp_low,
-        "rain_prob": rain_prob, # 降水概率 %
-        "suggestion": ""
-    }
-    
-    # 生成建议
-    if rain_prob > 50:
-        data["suggestion"] = "记得带伞哦！"
-    elif temp_high > 30:
-        data["suggestion"] = "天气较热，注意防暑。"
-    elif temp_low < 10:
-        data["suggestion"] = "天气转凉，多穿点衣服。"
-    else:
-        data["suggestion"] = "天气不错，适合出门。"
-        
-    return {"success": True, "data": data}
+    location = location or WEATHER_LOCATION
 
-if __name__ == "__main__":
+    try:
+        result = get_service().get(location, target_date)
+    except LookupError as e:
+        return {"success": False, "error": str(e)}
+    except Exception as e:
+        return {"success": False, "error": f"天气服务不可用: {e}"}
+
+    data = dict(result["data"])
+    data["suggestion"] = make_suggestion(data)
+    return {"success": True, "data": data, "cache": result["cache"]}
+
+def weather_stats():
+    return {"success": True, "data": get_service().stats()}
+
+def build_parser():
     parser = argparse.ArgumentParser(description="天气查询工具")
     subparsers = parser.add_subparsers(dest="command", help="子命令")
     
     query_parser = subparsers.add_parser("query", help="查询天气")
     query_parser.add_argument("--date", required=True, help="日期 today/tomorrow/YYYY-MM-DD")
+    query_parser.add_argument("--location", help="地点，默认为配置中的 WEATHER_LOCATION")
+
+    # stats
+    subparsers.add_parser("stats", help="缓存命中率与上游调用次数")
     
+    # batch
+    batch.add_batch_parser(subparsers)
+    return parser
+
+def run_command(args):
+    """执行一条已解析的子命令，返回结果字典；未知子命令返回 None"""
+    if args.command == "query":
+        return query_weather(args.date, args.location)
+    elif args.command == "stats":
+        return weather_stats()
+    return None
+
+def run_batch(ops):
+    """批量执行多条查询，只启动一次进程"""
+    results = batch.run_ops(build_parser(), run_command, ops)
+    return {"success": True, "count": len(results), "results": results}
+
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
     
-    if args.command == "query":
-        print(json.dumps(query_weather(args.date), ensure_ascii=False))
+    if args.command == "batch":
+        try:
+            print(records.dumps(run_batch(batch.read_ops(args.ops))))
+        except ValueError as e:
+            print(records.dumps({"success": False, "error": f"批处理输入无效: {e}"}))
     else:
-        parser.print_help()
+        result = run_command(args)
+        if result is None:
+            parser.print_help()
+        else:
+            stream.print_result(result)
@@ -0,0 +1,348 @@
+# 天气预报数据源与缓存
+# - WeatherProvider：数据源接口；StubProvider 按 (地点, 日期) 确定性生成，FileProvider 读本地 JSON，
+#   HttpProvider 请求预报服务（可以是 eval/weather_stub_server.py）
+# - WeatherCache：按 (地点, 日期) 的 TTL 缓存，存成 JSON 文件供多个工具进程共享；
+#   命中/未命中等计数不写进缓存文件，由各进程在内存中累加，定期把增量追加到单独的统计文件
+# - WeatherService：先查缓存；未命中时同一个 key 只向上游请求一次（进程内 singleflight + 跨进程文件锁）
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只做进程内合并
+    fcntl = None
+
+from tools import records
+
+WEATHERS = ["晴", "多云", "阴", "小雨", "大雨", "雷阵雨"]
+
+
+def make_suggestion(data: Dict) -> str:
+    if data.get("rain_prob", 0) > 50:
+        return "记得带伞哦！"
+    if data.get("temp_high", 20) > 30:
+        return "天气较热，注意防暑。"
+    if data.get("temp_low", 20) < 10:
+        return "天气转凉，多穿点衣服。"
+    return "天气不错，适合出门。"
+
+
+class WeatherProvider:
+    """天气数据源接口：fetch 返回某地某天的预报，没有数据时抛 LookupError"""
+
+    name = "base"
+
+    def fetch(self, location: str, date: str) -> Dict:
+        raise NotImplementedError
+
+
+class StubProvider(WeatherProvider):
+    """离线桩数据：以 (地点, 日期) 为随机种子，同一天多次查询结果一致"""
+
+    name = "stub"
+
+    def fetch(self, location: str, date: str) -> Dict:
+        rng = random.Random(zlib.crc32(f"{location}|{date}".encode("utf-8")))
+        weather = rng.choice(WEATHERS)
+        base_temp = 20  # 假设是春秋季
+        if "雨" in weather:
+            temp_high = base_temp - rng.randint(2, 5)
+            temp_low = temp_high - rng.randint(5, 8)
+            rain_prob = rng.randint(60, 95)
+        elif "晴" in weather:
+            temp_high = base_temp + rng.randint(3, 8)
+            temp_low = temp_high - rng.randint(10, 15)
+            rain_prob = rng.randint(0, 10)
+        else:
+            temp_high = base_temp
+            temp_low = base_temp - rng.randint(5, 10)
+            rain_prob = rng.randint(10, 40)
+        return {
+            "date": date,
+            "location": location,
+            "weather": weather,
+            "temp_high": temp_high,
+            "temp_low": temp_low,
+            "rain_prob": rain_prob,
+        }
+
+
+class FileProvider(WeatherProvider):
+    """本地 JSON 预报：{"地点": {"YYYY-MM-DD": {"weather": ..., "temp_high": ...}}}"""
+
+    name = "file"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def fetch(self, location: str, date: str) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                forecasts = json.load(f)
+        except FileNotFoundError:
+            raise LookupError(f"天气数据文件不存在: {self.path}")
+        day = forecasts.get(location, {}).get(date)
+        if day is None:
+            raise LookupError(f"没有 {location} {date} 的天气数据")
+        return dict(day, date=date, location=location)
+
+
+class HttpProvider(WeatherProvider):
+    """HTTP 预报服务：GET {base_url}/forecast?location=..&date=.. 返回预报 JSON"""
+
+    name = "http"
+
+    def __init__(self, base_url: str, timeout: float = 5):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def fetch(self, location: str, date: str) -> Dict:
+        import requests
+        response = requests.get(f"{self.base_url}/forecast",
+                                params={"location": location, "date": date}, timeout=self.timeout)
+        if response.status_code == 404:
+            raise LookupError(f"没有 {location} {date} 的天气数据")
+        response.raise_for_status()
+        return dict(response.json(), date=date, location=location)
+
+
+def make_provider(kind: str, file_path: Optional[Path] = None, api_url: Optional[str] = None) -> WeatherProvider:
+    if kind == "stub":
+        return StubProvider()
+    if kind == "file":
+        return FileProvider(file_path)
+    if kind == "http":
+        return HttpProvider(api_url)
+    raise ValueError(f"不支持的天气数据源: {kind}")
+
+
+class WeatherCache:
+    """按 (地点, 日期) 的 TTL 缓存，落盘为 JSON；累计的命中/上游调用次数在旁边的 .stats.jsonl 里"""
+
+    LOCK_SLOTS = 4096
+    # 统计文件超过这么大时合并成一行
+    STATS_COMPACT_BYTES = 64 * 1024
+
+    def __init__(self, path: Path, ttl: int):
+        self.path = Path(path)
+        self.stats_path = self.path.with_name(self.path.name + ".stats.jsonl")
+        self.ttl = ttl
+        self._fetch_fd = None
+
+    def _key(self, location: str, date: str) -> str:
+        return f"{location}|{date}"
+
+    def load(self) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"entries": {}, "stats": {}}
+
+    def save(self, state: Dict):
+        # 写临时文件再替换，其他进程不会读到半个文件；缓存丢了可以重新请求，不必 fsync
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        records.write_atomic(self.path, json.dumps(state, ensure_ascii=False).encode("utf-8"), sync=False)
+
+    def load_stats(self) -> Dict:
+        """各进程追加的计数增量之和"""
+        totals: Dict[str, int] = {}
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        delta = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    for name, n in delta.items():
+                        totals[name] = totals.get(name, 0) + n
+        except FileNotFoundError:
+            pass
+        return totals
+
+    def append_stats(self, delta: Dict[str, int]):
+        """追加一行计数增量；文件太大时合并成一行"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.write_locked():
+            with open(self.stats_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(delta) + "\n")
+                size = f.tell()
+            if size > self.STATS_COMPACT_BYTES:
+                records.write_atomic(self.stats_path, (json.dumps(self.load_stats()) + "\n").encode("utf-8"),
+                                     sync=False)
+
+    def lookup(self, state: Dict, location: str, date: str) -> Optional[Dict]:
+        entry = state["entries"].get(self._key(location, date))
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            return entry["data"]
+        return None
+
+    def store(self, state: Dict, location: str, date: str, data: Dict):
+        now = time.time()
+        entries = state["entries"]
+        # 顺带清理过期条目，文件大小只与 TTL 内查询过的 (地点, 日期) 数量有关
+        for k in [k for k, e in entries.items() if now - e["fetched_at"] >= self.ttl]:
+            del entries[k]
+        entries[self._key(location, date)] = {"data": data, "fetched_at": round(now, 3)}
+
+    @contextmanager
+    def write_locked(self):
+        """读-改-写缓存文件时的跨进程互斥，只在内存中改完即释放"""
+        if fcntl is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def fetch_locked(self, location: str, date: str):
+        """同一个 (地点, 日期) 同一时刻只有一个进程请求上游；不同 key 落在不同字节区间，互不阻塞"""
+        if fcntl is None:
+            yield
+            return
+        if self._fetch_fd is None:
+            # 锁文件句柄在进程内常驻：POSIX 记录锁在关闭同一文件的任意句柄时都会被释放
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fetch_fd = os.open(str(self.path.with_name(self.path.name + ".fetch.lock")),
+                                     os.O_RDWR | os.O_CREAT, 0o644)
+        slot = zlib.crc32(self._key(location, date).encode("utf-8")) % self.LOCK_SLOTS
+        fcntl.lockf(self._fetch_fd, fcntl.LOCK_EX, 1, slot)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fetch_fd, fcntl.LOCK_UN, 1, slot)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同一个 key 的并发调用只执行一次，其余调用等待并共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn):
+        """返回 (结果, 是否与其他调用合并)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class WeatherService:
+    # 计数的增量至多每隔这么多秒写一次统计文件（进程退出时再写一次），命中路径只改内存
+    STATS_FLUSH_INTERVAL = 10.0
+
+    def __init__(self, provider: WeatherProvider, cache: WeatherCache):
+        self.provider = provider
+        self.cache = cache
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        # 本进程内的计数；跨进程的累计值在统计文件里
+        self.counters = {"hits": 0, "misses": 0, "upstream_calls": 0, "coalesced": 0, "errors": 0}
+        self._pending: Dict[str, int] = {}
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush_stats)
+
+    def _record(self, *names: str):
+        with self._lock:
+            for name in names:
+                self.counters[name] += 1
+                self._pending[name] = self._pending.get(name, 0) + 1
+            due = time.monotonic() - self._flushed_at >= self.STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if pending:
+            self.cache.append_stats(pending)
+
+    def get(self, location: str, date: str) -> Dict:
+        """返回 {"data": 预报, "cache": "hit"|"miss"|"coalesced"}；上游没有数据时抛 LookupError"""
+        # 缓存文件总是整体替换，命中路径不需要加锁读
+        data = self.cache.lookup(self.cache.load(), location, date)
+        if data is not None:
+            self._record("hits")
+            return {"data": data, "cache": "hit"}
+
+        def fetch():
+            with self.cache.fetch_locked(location, date):
+                # 拿到锁后再查一次：等锁期间可能已有其他进程填好了缓存
+                cached = self.cache.lookup(self.cache.load(), location, date)
+                if cached is not None:
+                    self._record("hits")
+                    return cached, "hit"
+                try:
+                    fetched = self.provider.fetch(location, date)
+                except Exception:
+                    self._record("misses", "upstream_calls", "errors")
+                    raise
+                with self.cache.write_locked():
+                    state = self.cache.load()
+                    self.cache.store(state, location, date, fetched)
+                    self.cache.save(state)
+                self._record("misses", "upstream_calls")
+                return fetched, "miss"
+
+        (data, outcome), shared = self._flight.do(f"{location}|{date}", fetch)
+        if shared:
+            self._record("coalesced")
+            outcome = "coalesced"
+        return {"data": data, "cache": outcome}
+
+    def stats(self) -> Dict:
+        """累计统计（跨进程，来自统计文件，加上本进程尚未写出的增量）"""
+        self.flush_stats()
+        stats = self.cache.load_stats()
+        # 旧版本把计数存在缓存文件里，一并算上
+        for name, n in self.cache.load().get("stats", {}).items():
+            stats[name] = stats.get(name, 0) + n
+        for name in ("hits", "misses", "upstream_calls", "coalesced", "errors"):
+            stats.setdefault(name, 0)
+        # 合并到他人请求上的查询也没有访问上游，算作命中
+        served = stats["hits"] + stats["coalesced"]
+        lookups = served + stats["misses"]
+        stats["hit_ratio"] = round(served / lookups, 3) if lookups else 0.0
+        stats["provider"] = self.provider.name
+        stats["process"] = dict(self.counters)
+        return stats
@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+try:
+    from config import TRACE_ENABLED, TRACE_FILE, METRICS_ENABLED
+except ImportError:
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent))
+    from config import TRACE_ENABLED, TRACE_FILE, METRICS_ENABLED
+
+# 当前线程/协程中正在进行的 span，用于自动串起父子关系
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+class Span:
+    """一次被追踪的操作（一轮对话、一次 LLM 调用、一次工具调用等）"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "start", "duration", "attrs", "status", "_perf", "_token")
+
+    def __init__(self, tracer, name: str, attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.status = "ok"
+        self.duration = 0.0
+        self._token = None
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self.start = time.time()
+        self._perf = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._perf
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.status = "error"
+            self.attrs.setdefault("error", f"{exc_type.__name__}: {exc}")
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """关闭追踪时返回的空 span，所有操作都是空操作，开销接近于零"""
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlExporter:
+    """把结束的 span 逐行追加到本地 JSONL 文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line + "\n")
+
+
+class MetricsExporter:
+    """按 span 名称聚合耗时直方图，输出 Prometheus 文本格式"""
+
+    BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[str, Dict] = {}
+
+    def export(self, span: Span):
+        with self._lock:
+            s = self._series.get(span.name)
+            if s is None:
+                s = {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(self.BUCKETS)}
+                self._series[span.name] = s
+            s["count"] += 1
+            s["sum"] += span.duration
+            if span.status != "ok":
+                s["errors"] += 1
+            for i, bound in enumerate(self.BUCKETS):
+                if span.duration <= bound:
+                    s["buckets"][i] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP assistant_span_seconds Duration of traced operations",
+            "# TYPE assistant_span_seconds histogram",
+        ]
+        with self._lock:
+            series = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._series.items()}
+        for name in sorted(series):
+            s = series[name]
+            for bound, n in zip(self.BUCKETS, s["buckets"]):
+                lines.append(f'assistant_span_seconds_bucket{{span="{name}",le="{bound}"}} {n}')
+            lines.append(f'assistant_span_seconds_bucket{{span="{name}",le="+Inf"}} {s["count"]}')
+            lines.append(f'assistant_span_seconds_sum{{span="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'assistant_span_seconds_count{{span="{name}"}} {s["count"]}')
+        lines.append("# HELP assistant_span_errors_total Traced operations that raised")
+        lines.append("# TYPE assistant_span_errors_total counter")
+        for name in sorted(series):
+            lines.append(f'assistant_span_errors_total{{span="{name}"}} {series[name]["errors"]}')
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """轻量级追踪器：span 结束时交给各个 exporter"""
+
+    def __init__(self, exporters: Optional[List] = None):
+        self.exporters = exporters or []
+        self.enabled = bool(self.exporters)
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def _finish(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception:
+                # 追踪失败不能影响主流程
+                pass
+
+
+metrics = MetricsExporter() if METRICS_ENABLED else None
+
+_exporters = []
+if TRACE_ENABLED:
+    _exporters.append(JsonlExporter(TRACE_FILE))
+if metrics is not None:
+    _exporters.append(metrics)
+
+tracer = Tracer(_exporters)
@@ -1,15 +1,23 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import asyncio
 import sys
 
 # 确保路径正确
 BASE_DIR = Path(__file__).parent.parent
 sys.path.append(str(BASE_DIR))
 
-from web.routers import schedule, budget, course
-from web.services import schedule_service, budget_service, course_service
+from web import auth
+from web.routers import schedule, budget, course, events, jobs
+from web.services import schedule_service, budget_service, course_service, job_service
+from tracing import tracer, metrics
+from config import (DEFAULT_USER, REMINDERS_ENABLED, SESSION_MAX_AGE, SNAPSHOT_INTERVAL, SNAPSHOT_KEEP_DAILY,
+                    SNAPSHOT_KEEP_LAST, SNAPSHOT_KEEP_WEEKLY, TRUST_USER_HEADER)
+from tools.records import RecordError
+from tools.userdata import set_user, reset_user, validate_user_id
 
 app = FastAPI(title="大学生小秘书 - 数据管理")
 
@@ -21,11 +29,124 @@ templates = Jinja2Templates(directory="web/templates")
 app.include_router(schedule.router, prefix="/schedule", tags=["日程"])
 app.include_router(budget.router, prefix="/budget", tags=["生活费"])
 app.include_router(course.router, prefix="/course", tags=["课程"])
+# 数据变更推送（SSE），页面据此局部刷新
+app.include_router(events.router, tags=["实时更新"])
+# 后台任务（全年报告、ICS 导出、数据备份）：提交后立即返回，页面轮询进度
+app.include_router(jobs.router, tags=["后台任务"])
+
+USER_COOKIE = "session"
+# 未登录也能访问的路径（默认用户配置了令牌时）
+PUBLIC_PATHS = ("/user/login", "/static/")
+
+@app.middleware("http")
+async def select_user(request: Request, call_next):
+    """按签名的会话 Cookie（或可信代理设置的 X-User-Id）选择数据分区，整个请求内的工具调用都读写该用户的数据"""
+    user_id = request.headers.get("x-user-id") if TRUST_USER_HEADER else None
+    if not user_id:
+        user_id = auth.read_session(request.cookies.get(USER_COOKIE))
+    if not user_id:
+        if not auth.anonymous_allowed() and not request.url.path.startswith(PUBLIC_PATHS):
+            request.state.user_id = ""
+            return templates.TemplateResponse("login.html", {"request": request}, status_code=401)
+        user_id = DEFAULT_USER
+    try:
+        token = set_user(user_id)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    request.state.user_id = user_id
+    try:
+        return await call_next(request)
+    finally:
+        reset_user(token)
+
+@app.exception_handler(RecordError)
+async def bad_record(request: Request, exc: RecordError):
+    """数据文件里有不合法的记录（例如手工编辑出错）：说明是哪一条，而不是返回 500"""
+    return PlainTextResponse(f"数据文件有误：{exc}\n请修正该记录，或用 tools/backup_cli.py restore 恢复到之前的快照。",
+                             status_code=409)
+
+@app.get("/user/login")
+async def login_page(request: Request):
+    return templates.TemplateResponse("login.html", {"request": request})
+
+@app.post("/user/login")
+async def login(request: Request, user_id: str = Form(...), token: str = Form("")):
+    """校验访问令牌后写入签名的会话 Cookie"""
+    try:
+        validate_user_id(user_id)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    if not auth.check_token(user_id, token):
+        request.state.user_id = ""
+        return templates.TemplateResponse("login.html", {"request": request, "error": "用户名或令牌不正确"},
+                                          status_code=401)
+    response = RedirectResponse(url="/", status_code=303)
+    response.set_cookie(USER_COOKIE, auth.make_session(user_id), max_age=SESSION_MAX_AGE, httponly=True,
+                        samesite="lax", secure=request.url.scheme == "https")
+    return response
+
+@app.post("/user/logout")
+async def logout():
+    response = RedirectResponse(url="/", status_code=303)
+    response.delete_cookie(USER_COOKIE)
+    return response
+
+@app.on_event("startup")
+async def start_jobs():
+    # 持久化队列里上次没跑完的任务在启动时继续
+    job_service.jobs.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    job_service.jobs.stop()
+
+if REMINDERS_ENABLED:
+    # 提醒调度器作为后台任务运行，空闲时只定期 stat 变更流和课表文件；
+    # 多个 worker 时只有抢到 data/reminders.lock 的那个投递，避免每条提醒发 N 次
+    from tools.reminders import LeaderLock, build_schedulers, run_as_leader
+
+    @app.on_event("startup")
+    async def start_reminders():
+        app.state.reminder_schedulers = build_schedulers()
+        app.state.reminder_task = asyncio.create_task(run_as_leader(app.state.reminder_schedulers, LeaderLock()))
+
+    @app.on_event("shutdown")
+    async def stop_reminders():
+        app.state.reminder_task.cancel()
+
+if SNAPSHOT_INTERVAL > 0:
+    # 定期给数据目录拍增量快照，数据没变化时只 stat 一遍文件
+    from tools.snapshot import SnapshotScheduler, store as snapshot_store
+
+    @app.on_event("startup")
+    async def start_snapshots():
+        app.state.snapshot_scheduler = SnapshotScheduler(
+            snapshot_store, SNAPSHOT_INTERVAL,
+            {"keep_last": SNAPSHOT_KEEP_LAST, "keep_daily": SNAPSHOT_KEEP_DAILY, "keep_weekly": SNAPSHOT_KEEP_WEEKLY})
+        app.state.snapshot_scheduler.start()
+
+    @app.on_event("shutdown")
+    async def stop_snapshots():
+        app.state.snapshot_scheduler.stop()
+
+if tracer.enabled:
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        with tracer.span("web.request", method=request.method, path=request.url.path) as span:
+            response = await call_next(request)
+            span.set("status_code", response.status_code)
+            return response
+
+if metrics is not None:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {
         "request": request,
+        "today": schedule_service.resolve_date("today"),
         "today_schedules": schedule_service.get_today_schedules(),
         "today_courses": course_service.get_today_courses(),
         "budget_summary": budget_service.get_monthly_summary()
@@ -0,0 +1,86 @@
+"""Web 端的用户身份
+
+- 登录（POST /user/login）时校验用户名和访问令牌（USER_TOKENS），通过后写入签名的会话 Cookie：
+  "<用户名 base64>.<签发时间>.<HMAC-SHA256>"。每个请求校验签名和有效期，伪造、篡改或过期的 Cookie 视同未登录。
+- 签名密钥取 SESSION_SECRET；没有配置时第一次用到时在 data/ 下生成并保存，多个 worker 共用同一个。
+- 未登录的请求使用默认用户；默认用户也配置了令牌时，未登录只能看到登录页。
+- 只有部署在已完成认证的反向代理之后时才打开 TRUST_USER_HEADER，按代理设置的 X-User-Id 选择用户；
+  否则请求头可以被任何人伪造，不予理会。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+import time
+from typing import Optional
+
+from config import DEFAULT_USER, SESSION_MAX_AGE, SESSION_SECRET, SESSION_SECRET_FILE, USER_TOKENS
+
+_secret: Optional[bytes] = None
+
+
+def _load_or_create_secret() -> bytes:
+    """读取密钥文件；不存在时生成一个，用硬链接原子地放到位，同时启动的 worker 最终读到同一个密钥"""
+    path = SESSION_SECRET_FILE
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(tmp)
+    return path.read_bytes().strip()
+
+
+def _key() -> bytes:
+    global _secret
+    if _secret is None:
+        _secret = SESSION_SECRET.encode("utf-8") if SESSION_SECRET else _load_or_create_secret()
+    return _secret
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(_key(), payload.encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def make_session(user_id: str, now: Optional[float] = None) -> str:
+    name = base64.urlsafe_b64encode(user_id.encode("utf-8")).decode("ascii").rstrip("=")
+    payload = f"{name}.{int(now if now is not None else time.time())}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def read_session(value: Optional[str], now: Optional[float] = None) -> Optional[str]:
+    """校验会话 Cookie，返回用户名；签名不对、格式不对或已过期时返回 None"""
+    # 合法的 Cookie 只含 ASCII 字符；伪造的非 ASCII 值无法参与签名比较，直接当作未登录
+    if not value or not value.isascii() or value.count(".") != 2:
+        return None
+    payload, sig = value.rsplit(".", 1)
+    if not hmac.compare_digest(sig, _sign(payload)):
+        return None
+    name, issued = payload.split(".")
+    try:
+        if (now if now is not None else time.time()) - int(issued) > SESSION_MAX_AGE:
+            return None
+        return base64.urlsafe_b64decode(name + "=" * (-len(name) % 4)).decode("utf-8")
+    except ValueError:
+        return None
+
+
+def check_token(user_id: str, token: str) -> bool:
+    """只有配置了令牌的用户能登录；默认用户没有配置令牌时无需令牌"""
+    expected = USER_TOKENS.get(user_id)
+    if expected is None:
+        return user_id == DEFAULT_USER
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+def anonymous_allowed() -> bool:
+    """未登录的请求能否以默认用户身份访问"""
+    return DEFAULT_USER not in USER_TOKENS
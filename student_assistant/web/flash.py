@@ -0,0 +1,17 @@
+"""表单提交后的提示：把消息放进重定向地址的 msg 参数，base.html 显示在页面顶部"""
+from urllib.parse import urlencode
+
+from fastapi.responses import RedirectResponse
+
+
+def redirect(url: str, message: str = None):
+    if message:
+        url += ("&" if "?" in url else "?") + urlencode({"msg": message})
+    return RedirectResponse(url=url, status_code=303)
+
+
+def redirect_result(url: str, result: dict):
+    """工具返回失败时带上原因，成功时直接跳转"""
+    if result.get("success"):
+        return redirect(url)
+    return redirect(url, result.get("message") or result.get("error") or "操作失败")
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, Request, Form, UploadFile, File
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from web.services import budget_service
+from web.flash import redirect, redirect_result
 
 router = APIRouter()
 templates = Jinja2Templates(directory="web/templates")
@@ -23,14 +24,27 @@ async def add(
     category: str = Form(...),
     note: str = Form("")
 ):
-    budget_service.add_record(type, amount, category, note)
-    return RedirectResponse(url="/budget", status_code=303)
+    result = budget_service.add_record(type, amount, category, note)
+    return redirect_result("/budget", result)
 
 @router.post("/delete/{id}")
 async def delete(id: int):
     budget_service.delete_record(id)
     return RedirectResponse(url="/budget", status_code=303)
 
+@router.post("/import")
+def import_csv(
+    file: UploadFile = File(...),
+    preset: str = Form("auto"),
+    encoding: str = Form("utf-8-sig")
+):
+    # 同步路由会在线程池中执行，大文件导入不会阻塞事件循环
+    result = budget_service.import_csv(file.file, preset, encoding)
+    if not result.get("success"):
+        return redirect_result("/budget", result)
+    return redirect("/budget", f"{result['message']}（重复 {result['duplicates']} 条，"
+                               f"跳过 {result['skipped']} 条，无法解析 {result['errors']} 条）")
+
 @router.get("/stats")
 async def stats_page(request: Request):
     stats = budget_service.get_stats()
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 from web.services import course_service
 
@@ -13,3 +14,20 @@ async def list_page(request: Request, weekday: str = "monday"):
         "courses": courses,
         "current_weekday": weekday
     })
+
+@router.get("/now")
+async def now():
+    return course_service.current_course()
+
+@router.get("/free")
+async def free(date: str = "today"):
+    return course_service.free_periods(date)
+
+@router.get("/export.ics")
+async def export_ics(start: str = None, end: str = None):
+    # 逐行流式输出，不在内存中拼出整个日历
+    return StreamingResponse(
+        course_service.iter_ics(start, end),
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="timetable.ics"'}
+    )
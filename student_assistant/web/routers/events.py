@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from config import SSE_KEEPALIVE
+from web.services.change_service import hub
+
+router = APIRouter()
+
+
+def _sse(kind: str, payload: dict, event_id=None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append("data: " + json.dumps(payload, ensure_ascii=False))
+    return "\n".join(lines) + "\n\n"
+
+
+async def _stream(request: Request, user_id: str, last_id):
+    # 先订阅再补发断线期间的事件，两段之间新到的事件按版本号去重
+    queue = hub.subscribe(user_id)
+    try:
+        yield "retry: 3000\n\n"
+        sent = hub.version(user_id)
+        if last_id is not None and last_id < sent:
+            backlog, _, missed = await asyncio.to_thread(hub.backlog, user_id, last_id)
+            if missed:
+                yield _sse("reset", {"reason": "expired"})
+            for ev in backlog:
+                yield _sse("change", ev, ev["version"])
+            sent = max([sent] + [ev["version"] for ev in backlog])
+        yield _sse("ready", {"version": sent}, sent)
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                # 注释行做心跳，防止代理断开空闲连接
+                yield ": keepalive\n\n"
+                continue
+            if kind == "change":
+                if payload["version"] <= sent:
+                    continue
+                sent = payload["version"]
+                yield _sse(kind, payload, sent)
+            else:
+                yield _sse(kind, payload)
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+@router.get("/events")
+async def events(request: Request):
+    """当前用户的数据变更（SSE）；浏览器断线重连时带上 Last-Event-ID，从该版本之后补发"""
+    last_id = request.headers.get("last-event-id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    return StreamingResponse(
+        _stream(request, request.state.user_id, last_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+from web.services.job_service import JOB_TYPES, JobError, jobs, public_view
+
+router = APIRouter()
+
+
+def _own_job(request: Request, job_id: str):
+    """只返回当前用户自己的任务，其他用户的任务号视同不存在"""
+    job = jobs.get(job_id)
+    if job is None or job["user"] != request.state.user_id:
+        return None
+    return job
+
+
+@router.post("/jobs/{job_type}")
+async def submit(request: Request, job_type: str):
+    """提交后台任务，立即返回任务号；参数取自查询字符串，如 /jobs/budget_report?year=2024"""
+    try:
+        job = jobs.submit(request.state.user_id, job_type, dict(request.query_params))
+    except JobError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    return JSONResponse({"success": True, **public_view(job)}, status_code=202)
+
+
+@router.get("/jobs/{job_id}")
+async def status(request: Request, job_id: str):
+    """轮询任务状态：status 为 queued/running/done/failed，progress 在 0-1 之间"""
+    job = _own_job(request, job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "任务不存在或已过期"}, status_code=404)
+    return {"success": True, **public_view(job)}
+
+
+@router.get("/jobs/{job_id}/download")
+async def download(request: Request, job_id: str):
+    job = _own_job(request, job_id)
+    if job is None or job["status"] != "done" or not job.get("output"):
+        return JSONResponse({"success": False, "error": "没有可下载的结果"}, status_code=404)
+    kind = JOB_TYPES[job["type"]]
+    return FileResponse(job["output"], media_type=kind.media_type,
+                        filename=f"{job['type']}{kind.suffix}")
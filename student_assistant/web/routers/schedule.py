@@ -1,26 +1,58 @@
 from fastapi import APIRouter, Request, Form
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from web.services import schedule_service
+from web.flash import redirect_result
 
 router = APIRouter()
 templates = Jinja2Templates(directory="web/templates")
 
 @router.get("/")
 async def list_page(request: Request, date: str = "today"):
-    schedules = schedule_service.list_schedules(date)
+    result = schedule_service.query_schedules(date)
+    if not result["success"]:
+        return PlainTextResponse(result["message"], status_code=400)
     return templates.TemplateResponse("schedule/list.html", {
         "request": request,
-        "schedules": schedules,
-        "current_date": date
+        "schedules": result["data"],
+        "current_date": date,
+        "page_date": schedule_service.resolve_date(date)
     })
 
 @router.post("/add")
-async def add(date: str = Form(...), time: str = Form(...), event: str = Form(...)):
-    schedule_service.add_schedule(date, time, event)
-    return RedirectResponse(url="/schedule", status_code=303)
+async def add(
+    date: str = Form(...),
+    time: str = Form(...),
+    event: str = Form(...),
+    repeat: str = Form(""),
+    until: str = Form("")
+):
+    result = schedule_service.add_schedule(date, time, event, repeat, until)
+    return redirect_result("/schedule", result)
+
+@router.post("/skip/{id}")
+async def skip(id: int, date: str = Form(...)):
+    result = schedule_service.skip_occurrence(id, date)
+    return redirect_result(f"/schedule?date={date}", result)
 
 @router.post("/delete/{id}")
 async def delete(id: int):
     schedule_service.delete_schedule(id)
     return RedirectResponse(url="/schedule", status_code=303)
+
+@router.get("/week")
+async def week(date: str = "today"):
+    return schedule_service.get_week(date)
+
+@router.get("/range")
+async def range_query(start: str, end: str):
+    result = schedule_service.get_range(start, end)
+    return JSONResponse(result, status_code=200 if result["success"] else 400)
+
+@router.get("/conflicts")
+async def conflicts(date: str, time: str, duration: int = 60):
+    return schedule_service.check_conflicts(date, time, duration)
+
+@router.get("/free")
+async def free_slot(date: str = "today", duration: int = 60, after: str = None, days: int = 7):
+    return schedule_service.find_free_slot(date, duration, after, days)
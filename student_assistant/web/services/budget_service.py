@@ -1,3 +1,4 @@
+import io
 import sys
 from pathlib import Path
 
@@ -23,3 +24,11 @@ def delete_record(record_id):
 
 def get_stats(month=None):
     return budget_cli.get_stats(month)
+
+def import_csv(binary_file, preset="auto", encoding="utf-8-sig"):
+    # 包一层文本流，按行读取上传文件，不把整个文件读进内存
+    text = io.TextIOWrapper(binary_file, encoding=encoding, newline='')
+    try:
+        return budget_cli.import_csv(text, preset=preset)
+    finally:
+        text.detach()
@@ -0,0 +1,112 @@
+import asyncio
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+try:
+    from tools import changefeed
+except ImportError:
+    BASE_DIR = Path(__file__).parent.parent.parent
+    sys.path.append(str(BASE_DIR))
+    from tools import changefeed
+
+from config import CHANGEFEED_POLL_INTERVAL
+from tools.userdata import use_user
+from web.services import budget_service
+
+# 每个订阅者（一个 SSE 连接）的队列上限；处理不过来时清空队列改发 reset，让页面整体刷新
+QUEUE_SIZE = 1000
+
+
+def budget_summary(user_id: str) -> Dict:
+    """本月摘要，数值转成与模板渲染一致的字符串"""
+    with use_user(user_id):
+        summary = budget_service.get_monthly_summary()
+    data = {k: str(summary[k]) for k in ("monthly_income", "monthly_expense", "balance", "monthly_budget")}
+    budget = summary["monthly_budget"]
+    data["ratio"] = int(summary["monthly_expense"] / budget * 100) if budget else 0
+    return data
+
+
+class _UserFeed:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.cursor, self.version = changefeed.tail(user_id)
+        self.task: Optional[asyncio.Task] = None
+
+
+class ChangeHub:
+    """把变更流扇出给 SSE 连接：每个用户只有一个后台任务在 stat 变更文件，不管开了多少个页面
+
+    工具子进程和 Web 进程都只往文件里追加，所以这里不区分事件来自哪个进程。
+    预算类事件额外附带一次重新计算的本月摘要，所有页面共用这一次计算。
+    """
+
+    def __init__(self, poll_interval: float = CHANGEFEED_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._feeds: Dict[str, _UserFeed] = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        feed = self._feeds.get(user_id)
+        if feed is None:
+            feed = self._feeds[user_id] = _UserFeed(user_id)
+        queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        feed.subscribers.add(queue)
+        if feed.task is None or feed.task.done():
+            feed.task = asyncio.create_task(self._watch(feed))
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        feed = self._feeds.get(user_id)
+        if feed is not None:
+            feed.subscribers.discard(queue)
+
+    def version(self, user_id: str) -> int:
+        feed = self._feeds.get(user_id)
+        return feed.version if feed is not None else changefeed.current_version(user_id)
+
+    def backlog(self, user_id: str, version: int):
+        """版本号 version 之后的事件，返回 (事件列表, 游标, 是否有事件已被压缩掉)"""
+        return changefeed.events_after(version, user_id)
+
+    def stats(self) -> Dict:
+        return {"users": len(self._feeds), "subscribers": sum(len(f.subscribers) for f in self._feeds.values())}
+
+    def _broadcast(self, feed: _UserFeed, kind: str, payload: Dict):
+        for queue in list(feed.subscribers):
+            try:
+                queue.put_nowait((kind, payload))
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("reset", {"reason": "slow_consumer"}))
+
+    async def _watch(self, feed: _UserFeed):
+        try:
+            while feed.subscribers:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    events, feed.cursor, replaced = changefeed.read_since(feed.cursor, feed.user_id)
+                    if replaced:
+                        # 文件被压缩替换：按版本号补齐，中间丢失的部分让页面整体刷新
+                        events, feed.cursor, missed = await asyncio.to_thread(
+                            changefeed.events_after, feed.version, feed.user_id)
+                        if missed:
+                            self._broadcast(feed, "reset", {"reason": "compacted"})
+                except OSError:
+                    continue
+                if not events:
+                    continue
+                for ev in events:
+                    feed.version = max(feed.version, ev["version"])
+                    self._broadcast(feed, "change", ev)
+                if any(ev["entity"] == "budget" for ev in events):
+                    summary = await asyncio.to_thread(budget_summary, feed.user_id)
+                    self._broadcast(feed, "summary", {"version": feed.version, **summary})
+        finally:
+            if not feed.subscribers and self._feeds.get(feed.user_id) is feed:
+                del self._feeds[feed.user_id]
+
+
+hub = ChangeHub()
@@ -13,3 +13,14 @@ def get_today_courses():
 
 def list_courses(weekday=None):
     return course_cli.query_courses(weekday=weekday)["data"]
+
+def current_course():
+    return course_cli.current_course()
+
+def free_periods(date="today"):
+    return course_cli.free_periods(date)
+
+def iter_ics(start=None, end=None):
+    start_day = course_cli.parse_date(start) if start else None
+    end_day = course_cli.parse_date(end) if end else None
+    return course_cli.get_timetable().iter_ics(start_day, end_day)
@@ -0,0 +1,439 @@
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    from tools import records
+except ImportError:
+    BASE_DIR = Path(__file__).parent.parent.parent
+    sys.path.append(str(BASE_DIR))
+    from tools import records
+
+from config import (BUDGET_FILE, COURSE_FILE, EXPORTS_DIR, MEMORY_FILE, PROGRESS_ENV_VAR, SCHEDULE_FILE,
+                    TOOLS_DIR, USER_ENV_VAR, JOB_MAX_PENDING, JOB_PERSIST, JOB_POLL_INTERVAL, JOB_RESULT_TTL,
+                    JOB_TIMEOUT, JOB_WORKERS, JOBS_DB)
+from tools.dataversion import dataset_of, versions
+from tools.userdata import ensure_parent, user_path
+
+
+class JobError(ValueError):
+    """任务无法提交：未知类型、参数无效或排队的任务太多"""
+
+
+class JobType:
+    """一种后台任务：运行哪个工具 CLI、依赖哪些数据文件、结果是否写成文件"""
+
+    def __init__(self, tool: str, build_args: Callable[[Dict, Optional[Path]], List[str]],
+                 normalize: Callable[[Dict], Dict], depends: List[Path],
+                 suffix: Optional[str] = None, media_type: Optional[str] = None):
+        self.tool = tool
+        self.build_args = build_args
+        self.normalize = normalize
+        self.depends = depends
+        self.suffix = suffix
+        self.media_type = media_type
+
+
+def _year_params(params: Dict) -> Dict:
+    year = params.get("year") or datetime.now().year
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        raise JobError(f"年份无效: {year!r}") from None
+    if not 2000 <= year <= 2100:
+        raise JobError(f"年份无效: {year}")
+    return {"year": year}
+
+
+def _range_params(params: Dict) -> Dict:
+    return {k: str(params[k]) for k in ("start", "end") if params.get(k)}
+
+
+def _ics_args(params: Dict, output: Path) -> List[str]:
+    args = ["export-ics", "--output", str(output)]
+    for k in ("start", "end"):
+        if params.get(k):
+            args += [f"--{k}", params[k]]
+    return args
+
+
+JOB_TYPES: Dict[str, JobType] = {
+    "budget_report": JobType("budget", lambda p, out: ["report", "--year", str(p["year"])],
+                             _year_params, [BUDGET_FILE]),
+    "ics_export": JobType("course", _ics_args, _range_params, [COURSE_FILE],
+                          suffix=".ics", media_type="text/calendar; charset=utf-8"),
+    "backup": JobType("backup", lambda p, out: ["create", "--output", str(out)], lambda p: {},
+                      [BUDGET_FILE, SCHEDULE_FILE, COURSE_FILE, MEMORY_FILE],
+                      suffix=".zip", media_type="application/zip"),
+}
+
+# 任务记录里以 JSON 存储的字段
+_JSON_FIELDS = ("params", "result")
+_COLUMNS = ("id", "user", "type", "params", "key", "status", "progress", "message", "result", "error",
+            "output", "owner", "created", "started", "finished")
+
+
+class MemoryJobStore:
+    """进程内的任务表；只在单 worker 部署时使用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict] = {}
+        self._queue: deque = deque()
+
+    def add(self, job: Dict):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            self._queue.append(job["id"])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        with self._lock:
+            while self._queue:
+                job = self._jobs.get(self._queue.popleft())
+                if job is not None and job["status"] == "queued":
+                    job.update(status="running", owner=owner, started=time.time())
+                    return dict(job)
+        return None
+
+    def find(self, user: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            for job in reversed(list(self._jobs.values())):
+                if job["user"] == user and job["key"] == key and job["status"] != "failed":
+                    return dict(job)
+        return None
+
+    def pending(self, user: str) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j["user"] == user and j["status"] in ("queued", "running"))
+
+    def prune(self, before: float) -> List[Dict]:
+        with self._lock:
+            old = [j for j in self._jobs.values() if j["finished"] and j["finished"] < before]
+            for job in old:
+                del self._jobs[job["id"]]
+            return old
+
+    def recover(self, alive: Callable[[str], bool]):
+        """进程内的任务表随进程消失，没有需要恢复的任务"""
+
+
+class SQLiteJobStore:
+    """SQLite 任务表：重启后继续未完成的任务，同一台机器上的多个 worker 共享队列"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(str(ensure_parent(self.path)), timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, user TEXT NOT NULL, type TEXT NOT NULL, params TEXT, key TEXT,
+                    status TEXT NOT NULL, progress REAL, message TEXT, result TEXT, error TEXT, output TEXT,
+                    owner TEXT, created REAL, started REAL, finished REAL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (user, key)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _row(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            if job[field] is not None:
+                job[field] = records.loads(job[field])
+        return job
+
+    @staticmethod
+    def _value(field: str, value):
+        return records.dumps(value) if field in _JSON_FIELDS and value is not None else value
+
+    def add(self, job: Dict):
+        with self._lock:
+            self._db().execute(
+                f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [self._value(c, job.get(c)) for c in _COLUMNS])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def update(self, job_id: str, **fields):
+        if not fields:
+            return
+        with self._lock:
+            self._db().execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                [self._value(k, v) for k, v in fields.items()] + [job_id])
+
+    def claim(self, owner: str) -> Optional[Dict]:
+        # 单条 UPDATE ... RETURNING 是原子的：多个 worker 同时领取时每个任务只会被领走一次
+        with self._lock:
+            row = self._db().execute(
+                "UPDATE jobs SET status = 'running', owner = ?, started = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1) RETURNING *",
+                (owner, time.time())).fetchone()
+            return self._row(row)
+
+    def find(self, user: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._row(self._db().execute(
+                "SELECT * FROM jobs WHERE user = ? AND key = ? AND status != 'failed' "
+                "ORDER BY created DESC LIMIT 1", (user, key)).fetchone())
+
+    def pending(self, user: str) -> int:
+        with self._lock:
+            return self._db().execute(
+                "SELECT COUNT(*) FROM jobs WHERE user = ? AND status IN ('queued', 'running')",
+                (user,)).fetchone()[0]
+
+    def prune(self, before: float) -> List[Dict]:
+        with self._lock:
+            rows = self._db().execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ? RETURNING *", (before,)).fetchall()
+            return [self._row(r) for r in rows]
+
+    def recover(self, alive: Callable[[str], bool]):
+        """上次退出时仍在运行、且所在进程已不存在的任务重新排队"""
+        with self._lock:
+            rows = self._db().execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+            for row in rows:
+                if not alive(row["owner"]):
+                    self._db().execute(
+                        "UPDATE jobs SET status = 'queued', owner = NULL, progress = 0, message = '重新排队' "
+                        "WHERE id = ? AND status = 'running'", (row["id"],))
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    try:
+        pid = int((owner or "").rsplit(":", 1)[-1])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """后台任务队列：路由提交后立即返回任务号，固定数量的线程在子进程中运行对应的工具 CLI
+
+    任务在子进程中执行，线程只等待子进程和转发进度，不与请求处理争抢 GIL。
+    结果按 (用户, 任务类型, 参数, 所依赖数据的版本) 缓存：数据没有变化时重复提交直接返回已有的任务。
+    """
+
+    def __init__(self, store=None, workers: int = JOB_WORKERS, timeout: float = JOB_TIMEOUT,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.store = store if store is not None else (SQLiteJobStore(JOBS_DB) if JOB_PERSIST else MemoryJobStore())
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self.submitted = 0
+        self.cache_hits = 0
+
+    # ---- 提交与查询 ----
+
+    def submit(self, user_id: str, job_type: str, params: Optional[Dict] = None) -> Dict:
+        """提交任务，返回任务记录；数据未变化的相同任务直接返回已有记录（cached=True）"""
+        kind = JOB_TYPES.get(job_type)
+        if kind is None:
+            raise JobError(f"未知的任务类型: {job_type}")
+        params = kind.normalize(params or {})
+        key = self._cache_key(user_id, job_type, params, kind)
+        self._prune()
+        existing = self.store.find(user_id, key)
+        if existing is not None and (existing["status"] != "done" or self._output_ok(existing)):
+            self.cache_hits += 1
+            return dict(existing, cached=True)
+        if self.store.pending(user_id) >= JOB_MAX_PENDING:
+            raise JobError(f"排队中的任务已达上限 {JOB_MAX_PENDING}，请稍后再试")
+        job = {c: None for c in _COLUMNS}
+        job.update(id=uuid.uuid4().hex[:16], user=user_id, type=job_type, params=params, key=key,
+                   status="queued", progress=0.0, message="排队中", created=time.time())
+        self.store.add(job)
+        self.submitted += 1
+        self.start()
+        with self._wake:
+            self._wake.notify()
+        return dict(job, cached=False)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers, "running": len(self._procs), "submitted": self.submitted,
+                "cache_hits": self.cache_hits, "persistent": isinstance(self.store, SQLiteJobStore)}
+
+    @staticmethod
+    def _cache_key(user_id: str, job_type: str, params: Dict, kind: JobType) -> str:
+        # 依赖文件的签名与 StoreCache 一致：数据版本号 + mtime/size（手工编辑的文件同样会使缓存失效）
+        sigs = []
+        for path in kind.depends:
+            path = user_path(path, user_id)
+            try:
+                st = path.stat()
+                sigs.append([versions.get(dataset_of(path), user_id), st.st_mtime_ns, st.st_size])
+            except FileNotFoundError:
+                sigs.append(None)
+        raw = records.dumps([user_id, job_type, params, sigs])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _output_ok(job: Dict) -> bool:
+        return not job.get("output") or Path(job["output"]).exists()
+
+    def _prune(self):
+        for job in self.store.prune(time.time() - JOB_RESULT_TTL):
+            if job.get("output"):
+                Path(job["output"]).unlink(missing_ok=True)
+
+    # ---- 执行 ----
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self.store.recover(_owner_alive)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for proc in list(self._procs.values()):
+            proc.kill()
+        for t in self._threads:
+            t.join(timeout=5)
+        self._threads = []
+
+    def _worker(self):
+        owner = f"{threading.current_thread().name}:{os.getpid()}"
+        while not self._stop.is_set():
+            job = self.store.claim(owner)
+            if job is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                self.store.update(job["id"], status="failed", error=f"任务执行出错: {e}", finished=time.time())
+
+    def _run(self, job: Dict):
+        kind = JOB_TYPES[job["type"]]
+        output = None
+        if kind.suffix:
+            output = ensure_parent(user_path(EXPORTS_DIR, job["user"]) / f"{job['id']}{kind.suffix}")
+        cmd = [sys.executable, str(TOOLS_DIR / f"{kind.tool}_cli.py")] + kind.build_args(job["params"], output)
+        env = os.environ.copy()
+        env[USER_ENV_VAR] = job["user"]
+        env[PROGRESS_ENV_VAR] = "1"
+        self.store.update(job["id"], message="运行中")
+        with tempfile.TemporaryFile() as out:
+            # stdout 写临时文件，本线程只逐行读 stderr 上的进度，两个管道不会互相阻塞
+            proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.PIPE, env=env,
+                                    cwd=str(TOOLS_DIR.parent), text=True, encoding="utf-8")
+            self._procs[job["id"]] = proc
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(self.timeout, kill)
+            timer.start()
+            errors = []
+            last_update = 0.0
+            try:
+                for line in proc.stderr:
+                    try:
+                        report = records.loads(line)
+                    except records.DecodeError:
+                        report = None
+                    if not isinstance(report, dict) or "progress" not in report:
+                        errors.append(line.rstrip())
+                        continue
+                    # 进度最多每 0.25 秒落一次库
+                    now = time.monotonic()
+                    if now - last_update >= 0.25 or report["progress"] >= 1:
+                        last_update = now
+                        self.store.update(job["id"], progress=report["progress"], message=report.get("message", ""))
+                code = proc.wait()
+            finally:
+                timer.cancel()
+                self._procs.pop(job["id"], None)
+            out.seek(0)
+            text = out.read().decode("utf-8", errors="replace").strip()
+
+        result = None
+        if text:
+            try:
+                result = records.loads(text.rsplit("\n", 1)[-1])
+            except records.DecodeError:
+                result = None
+        finished = time.time()
+        if code != 0 or not isinstance(result, dict) or not result.get("success", True):
+            if output is not None:
+                output.unlink(missing_ok=True)
+            if timed_out.is_set():
+                error = f"任务超时（{self.timeout:g} 秒）"
+            elif isinstance(result, dict):
+                error = result.get("error") or result.get("message") or "任务失败"
+            else:
+                error = "\n".join(errors[-5:]) or f"工具退出码 {code}"
+            self.store.update(job["id"], status="failed", error=error, finished=finished)
+            return
+        self.store.update(job["id"], status="done", progress=1.0, message="已完成", result=result,
+                          output=str(output) if output is not None else None, finished=finished)
+
+
+def public_view(job: Dict) -> Dict:
+    """返回给页面的任务状态；结果文件只给下载地址，不暴露服务器路径"""
+    view = {k: job.get(k) for k in ("id", "type", "params", "status", "progress", "message", "error",
+                                     "created", "started", "finished")}
+    view["cached"] = bool(job.get("cached"))
+    if job.get("status") == "done":
+        if job.get("output"):
+            view["download"] = f"/jobs/{job['id']}/download"
+            view["result"] = {k: v for k, v in (job.get("result") or {}).items() if k != "file"}
+        else:
+            view["result"] = job.get("result")
+    return view
+
+
+jobs = JobQueue()
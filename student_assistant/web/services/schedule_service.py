@@ -10,14 +10,32 @@ except ImportError:
     sys.path.append(str(BASE_DIR))
     from tools import schedule_cli
 
+def resolve_date(date):
+    return schedule_cli.resolve_date(date)
+
 def get_today_schedules():
     return schedule_cli.query_schedule("today")["data"]
 
-def list_schedules(date="today"):
-    return schedule_cli.query_schedule(date)["data"]
+def query_schedules(date="today"):
+    return schedule_cli.query_schedule(date)
+
+def add_schedule(date, time, event, repeat=None, until=None):
+    return schedule_cli.add_schedule(date, time, event, repeat=repeat or None, until=until or None)
 
-def add_schedule(date, time, event):
-    return schedule_cli.add_schedule(date, time, event)
+def skip_occurrence(schedule_id, date):
+    return schedule_cli.skip_occurrence(schedule_id, date)
 
 def delete_schedule(schedule_id):
     return schedule_cli.delete_schedule(schedule_id)
+
+def get_week(date="today"):
+    return schedule_cli.query_week(date)
+
+def get_range(start, end):
+    return schedule_cli.query_range(start, end)
+
+def check_conflicts(date, time, duration=60):
+    return schedule_cli.check_conflicts(date, time, duration)
+
+def find_free_slot(date="today", duration=60, after=None, days=7):
+    return schedule_cli.find_free_slot(date, duration, after, days)